@@ -41,12 +41,18 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'rest_framework',
+    'django_filters',
     'st',  # Наше приложение
     # 'crispy_forms', # е crispy-forms
     # 'crispy_bootstrap5', #  crispy-forms с Bootstrap 5
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учитывать время всех остальных middleware: Server-Timing и метрики для /store/metrics/
+    'st.middleware.PerformanceMiddleware',
+    # Read-your-writes для реплик базы (st/routers.py)
+    'st.middleware.PrimaryPinningMiddleware',
    'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,13 +86,75 @@ WSGI_APPLICATION = 'iat.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Настройки соединения SQLite выполняются при каждом новом подключении (OPTIONS['init_command']).
+# WAL: читатели не ждут писателя и наоборот, писатель по-прежнему один. synchronous=NORMAL в режиме WAL
+# не портит базу при сбое питания, но может потерять последние транзакции; busy_timeout - сколько
+# миллисекунд ждать занятую базу вместо немедленной ошибки «database is locked».
+# Режим WAL хранится в самом файле базы: db.sqlite3 в репозитории уже переведен в него, поэтому
+# первая команда manage.py не меняет файл; служебные -wal и -shm не отслеживаются (.gitignore)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,  # в КиБ (отрицательное значение), около 32 МБ на соединение
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # BEGIN IMMEDIATE: транзакция сразу берет блокировку записи и ждет ее по busy_timeout.
+            # При обычном BEGIN транзакция, которая сначала читает, а потом пишет, получает
+            # «database is locked» без ожидания, если запись уже начал другой процесс
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Постоянные соединения между запросами (секунды; 0 - закрывать после каждого запроса).
+        # По умолчанию 0: под ASGI (iat/asgi.py) Django рекомендует 0, соединения открываются
+        # в разных потоках. iat/wsgi.py задает DJANGO_CONN_MAX_AGE=600, если он не указан явно
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики для чтения каталога (st/routers.py): пути к копиям файла базы через запятую,
+# например DJANGO_DB_REPLICAS=/srv/iat/replica.sqlite3. Локально копии обновляет команда sync_replicas
+for index, path in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME': path.strip(),
+        'OPTIONS': {
+            **DATABASES['default']['OPTIONS'],
+            # Реплика только читается: запись в нее - ошибка, а не расхождение с основной базой
+            'init_command': DATABASES['default']['OPTIONS']['init_command'] + ';PRAGMA query_only=ON',
+        },
+        # В тестах реплика - та же тестовая база, что и основная
+        'TEST': {'MIRROR': 'default'},
+    }
+ST_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Допустимое отставание реплик, секунды: столько после записи в каталог клиент читает основную базу
+ST_DB_REPLICA_LAG = int(os.environ.get('DJANGO_DB_REPLICA_LAG', 5))
+# Как часто проверять доступность реплик (и возвращать исключенные), секунды
+ST_DB_REPLICA_CHECK_INTERVAL = 30
+DATABASE_ROUTERS = ['st.routers.PrimaryReplicaRouter']
+
+
+# Кэш: версии каталога, скидки, страницы и фрагменты (st/pagecache.py).
+# В продакшене кэш должен быть общим для всех процессов (например, Redis или Memcached),
+# иначе сброс версий в одном воркере остальные увидят только по истечении версий (ST_PAGE_CACHE_TIMEOUT)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'st-default'),
+    }
+}
+# Время жизни страниц и фрагментов каталога, а также версий в кэше (st/versions.py), секунды
+ST_PAGE_CACHE_TIMEOUT = 60 * 15
+# Потоки фоновой генерации миниатюр изображений вариантов (st/thumbnails.py); 0 - сразу при сохранении
+ST_THUMBNAIL_WORKERS = int(os.environ.get('ST_THUMBNAIL_WORKERS', 2))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,4 +207,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# JSON API каталога (st/api.py): только JSON, без браузерного интерфейса DRF
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'UNICODE_JSON': True,
+    'COMPACT_JSON': True,
+}
@@ -12,5 +12,8 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iat.settings')
+# Воркер WSGI обслуживает запросы в своих постоянных потоках: соединения с БД можно держать
+# между запросами (CONN_MAX_AGE в iat/settings.py; под ASGI - 0)
+os.environ.setdefault('DJANGO_CONN_MAX_AGE', '600')
 
 application = get_wsgi_application()
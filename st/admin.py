@@ -1,28 +1,86 @@
 # st/admin.py
 from django.contrib import admin
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.forms.models import BaseInlineFormSet
 from django.utils.html import format_html
-from django.urls import reverse
+from django.utils.text import Truncator
+from django.urls import NoReverseMatch, reverse
 from django.utils.safestring import mark_safe
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib.humanize.templatetags.humanize import intcomma
 
-import csv
 from decimal import Decimal
 
 from .models import (
     User, TechType, Category, Product, ProductSpecification, Color, Size,
-    ProductVariant, Review, Favorite, Order, OrderItem, Promo, PromoProduct
+    ProductVariant, Review, Favorite, Order, OrderItem, Promo, PromoProduct, ProductCard
 )
+from .cards import refresh_product_cards
+from .catalog import bump_reviews_version
 from .forms import ProductAdminForm
+from .exports import export_products_csv, export_orders_csv
+from .imports import IMPORT_PERMISSIONS
+from .invoices import iter_invoices_zip
+from .thumbnails import thumbnail_html
 
 # --- Инлайны ---
+class LoadedRawIdWidget(ForeignKeyRawIdWidget):
+    """
+    raw_id-виджет, подписывающий выбранный объект уже загруженным объектом строки инлайна
+    (select_related в get_queryset), а не отдельным запросом на каждую строку.
+    """
+    loaded_object = None
+
+    def label_and_url_for_value(self, value):
+        obj = self.loaded_object
+        # Значение из POST формы с ошибками может не совпадать с сохраненным
+        if obj is None or str(obj.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        try:
+            url = reverse(f'{self.admin_site.name}:{obj._meta.app_label}_{obj._meta.model_name}_change', args=(obj.pk,))
+        except NoReverseMatch:
+            url = ''
+        return Truncator(obj).words(14), url
+
+
+class LoadedRelationsFormSet(BaseInlineFormSet):
+    """
+    Передает виджетам LoadedRawIdWidget объекты, загруженные вместе со строками инлайна, а строкам -
+    родительский объект (подпись строки, __str__, обычно ссылается на него).
+    """
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        self.fk.set_cached_value(form.instance, self.instance)
+        for name, field in form.fields.items():
+            if isinstance(field.widget, LoadedRawIdWidget) and form.instance.pk:
+                db_field = form.instance._meta.get_field(name)
+                if db_field.is_cached(form.instance):
+                    field.widget.loaded_object = db_field.get_cached_value(form.instance)
+        return form
+
+
+class LoadedRawIdInlineMixin:
+    """
+    Инлайн с raw_id_fields без запроса на строку: связанные объекты загружаются в get_queryset
+    (select_related) и подписываются виджетом LoadedRawIdWidget.
+    """
+    formset = LoadedRelationsFormSet
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.raw_id_fields and 'widget' not in kwargs:
+            kwargs['widget'] = LoadedRawIdWidget(db_field.remote_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 class ProductSpecificationInline(admin.TabularInline):
     model = ProductSpecification
+    formset = LoadedRelationsFormSet
     extra = 1
     verbose_name_plural = "Характеристики товара"
 
-class ProductVariantInline(admin.TabularInline):
+class ProductVariantInline(LoadedRawIdInlineMixin, admin.TabularInline):
     model = ProductVariant
     extra = 1
     verbose_name_plural = "Варианты товара (SKU, цена, остатки)"
@@ -30,13 +88,16 @@ class ProductVariantInline(admin.TabularInline):
     readonly_fields = ('admin_image_preview',)
     raw_id_fields = ('color', 'size')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('color', 'size')
+
     @admin.display(description="Превью")
     def admin_image_preview(self, obj):
         if obj.image and hasattr(obj.image, 'url'):
-            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.image.url)
+            return thumbnail_html(obj.image, obj.image_hash, 100)
         return "Нет изображения"
 
-class OrderItemInline(admin.TabularInline):
+class OrderItemInline(LoadedRawIdInlineMixin, admin.TabularInline):
     model = OrderItem
     extra = 1 
     fields = ('variant', 'quantity', 'price_at_time', 'display_item_total_price')
@@ -58,13 +119,16 @@ class OrderItemInline(admin.TabularInline):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('variant', 'variant__product', 'variant__color', 'variant__size')
 
-class PromoProductInline(admin.TabularInline):
+class PromoProductInline(LoadedRawIdInlineMixin, admin.TabularInline):
     model = PromoProduct
     extra = 1
     verbose_name = "Товар в акции"
     verbose_name_plural = "Товары, участвующие в акции"
     raw_id_fields = ('product',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('promo', 'product')
+
 # --- Регистрация моделей и настройка админки ---
 
 @admin.register(User)
@@ -82,6 +146,12 @@ class UserAdmin(admin.ModelAdmin):
         ('Важные даты', {'fields': ('last_login', 'date_joined')}),
     )
 
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        # Подпись права включает тип содержимого: без select_related - запрос на каждое право
+        if db_field.name == 'user_permissions':
+            kwargs['queryset'] = db_field.remote_field.model.objects.select_related('content_type')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
     @admin.display(description="Дата регистрации", ordering='date_joined')
     def date_joined_formatted(self, obj):
         if obj.date_joined:
@@ -101,18 +171,25 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ('parent',)
     search_fields = ('name', 'description')
     raw_id_fields = ('parent',)
+    list_select_related = ('parent',)
+    readonly_fields = ('full_name', 'path', 'depth')
 
-    @admin.display(description="Кол-во товаров")
+    @admin.display(description="Кол-во товаров (с подкатегориями)", ordering='subtree_product_count')
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.subtree_product_count
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_subtree_product_count()
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     # ... (код ProductAdmin без изменений) ...
     form = ProductAdminForm
+    # Колонки списка берутся из карточки товара (st.cards): один запрос без GROUP BY и prefetch
     list_display = (
-        'name', 'tech_type', 'brand', 'is_active', 
+        'name', 'tech_type_name', 'brand', 'is_active',
         'created_at_formatted', 'display_categories', 'variants_count',
+        'price_range', 'total_stock',
         'get_full_name_with_brand_admin',
         'average_rating_display'
     )
@@ -137,47 +214,74 @@ class ProductAdmin(admin.ModelAdmin):
             return timezone.localtime(obj.created_at).strftime("%d.%m.%Y %H:%M")
         return "-"
 
+    def _card(self, obj):
+        # Карточки нет, только если товар изменили в обход ORM и не перестроили карточки
+        try:
+            return obj.card
+        except ProductCard.DoesNotExist:
+            return None
+
+    @admin.display(description="Тип техники", ordering='card__tech_type_name')
+    def tech_type_name(self, obj):
+        card = self._card(obj)
+        return card.tech_type_name if card else "-"
+
     @admin.display(description="Категории")
     def display_categories(self, obj):
-        return ", ".join([cat.name for cat in obj.categories.all()[:3]]) + ("..." if obj.categories.count() > 3 else "")
+        card = self._card(obj)
+        categories = card.category_names if card else []
+        return ", ".join(categories[:3]) + ("..." if len(categories) > 3 else "")
 
-    @admin.display(description="Кол-во вариантов")
+    @admin.display(description="Кол-во вариантов", ordering='card__variants_count')
     def variants_count(self, obj):
-        return obj.variants.count()
+        card = self._card(obj)
+        return card.variants_count if card else "-"
+
+    @admin.display(description="Цена", ordering='card__min_price')
+    def price_range(self, obj):
+        card = self._card(obj)
+        if not card or card.min_price is None:
+            return "-"
+        if card.min_price == card.max_price:
+            return f"{intcomma(card.min_price)} руб."
+        return f"{intcomma(card.min_price)} – {intcomma(card.max_price)} руб."
+
+    @admin.display(description="Остаток", ordering='card__total_stock')
+    def total_stock(self, obj):
+        card = self._card(obj)
+        return card.total_stock if card else "-"
 
     @admin.display(description="Полное название", ordering='name')
     def get_full_name_with_brand_admin(self, obj):
         return obj.get_full_name_with_brand()
 
-    @admin.display(description="Средний рейтинг")
+    @admin.display(description="Средний рейтинг", ordering='rating_avg')
     def average_rating_display(self, obj):
         avg_rating = obj.get_average_rating()
         return f"{avg_rating:.2f}" if avg_rating is not None else "Нет оценок"
     
     @admin.action(description="Сделать неактивными")
     def mark_as_inactive(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
         count = queryset.update(is_active=False)
+        # update() не отправляет сигналов: карточки пересчитываются явно
+        refresh_product_cards(product_ids)
         self.message_user(request, f"{count} товаров были помечены как неактивные.")
 
     @admin.action(description="Сделать активными")
     def mark_as_active(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
         count = queryset.update(is_active=True)
+        refresh_product_cards(product_ids)
         self.message_user(request, f"{count} товаров были помечены как активные.")
 
     @admin.action(description="Экспортировать выбранные товары в CSV")
     def export_selected_products_as_csv(self, request, queryset):
-        meta = self.model._meta
-        field_names = [field.verbose_name if field.verbose_name else field.name for field in meta.fields]
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="{meta.verbose_name_plural}.csv"'
-        writer = csv.writer(response)
-        writer.writerow(field_names)
-        for obj in queryset:
-            writer.writerow([getattr(obj, field.name) for field in meta.fields])
-        return response
+        # Потоковый ответ: товары читаются пачками вместе с вариантами, категориями и характеристиками
+        return export_products_csv(queryset, filename=f"{self.model._meta.verbose_name_plural}.csv")
 
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('categories', 'variants', 'reviews').select_related('tech_type')
+        return super().get_queryset(request).select_related('card')
 
 @admin.register(ProductSpecification)
 class ProductSpecificationAdmin(admin.ModelAdmin):
@@ -186,11 +290,12 @@ class ProductSpecificationAdmin(admin.ModelAdmin):
     list_filter = ('product__tech_type', 'name')
     search_fields = ('product__name', 'name', 'value')
     raw_id_fields = ('product',)
+    list_select_related = ('product',)
 
     @admin.display(description="Товар", ordering='product__name')
     def product_link(self, obj):
         if obj.product:
-            link = reverse("admin:st_product_change", args=[obj.product.id])
+            link = reverse("admin:st_product_change", args=[obj.product_id])
             return mark_safe(f'<a href="{link}">{obj.product.name}</a>')
         return "N/A"
 
@@ -224,6 +329,8 @@ class ProductVariantAdmin(admin.ModelAdmin):
     raw_id_fields = ('product', 'color', 'size')
     readonly_fields = ('admin_image_preview_form',)
     list_select_related = ('product', 'color', 'size')
+    # Ссылка на импорт каталога (st/imports.py)
+    change_list_template = 'st/admin/productvariant_change_list.html'
 
     fieldsets = (
         (None, {'fields': ('product', 'sku')}),
@@ -232,16 +339,20 @@ class ProductVariantAdmin(admin.ModelAdmin):
         ('Изображение', {'fields': ('image', 'admin_image_preview_form')}),
     )
 
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {'can_import_catalog': request.user.has_perms(IMPORT_PERMISSIONS), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
     @admin.display(description="Изображение")
     def admin_image_preview_list(self, obj):
         if obj.image and hasattr(obj.image, 'url'):
-            return format_html('<img src="{}" style="max-height: 50px; max-width: 50px;" />', obj.image.url)
+            return thumbnail_html(obj.image, obj.image_hash, 50)
         return "Нет изображения"
     
     @admin.display(description="Превью изображения")
     def admin_image_preview_form(self, obj):
         if obj.image and hasattr(obj.image, 'url'):
-            return format_html('<img src="{}" style="max-height: 200px; max-width: 200px;" />', obj.image.url)
+            return thumbnail_html(obj.image, obj.image_hash, 200)
         return "Изображение не загружено"
 
     @admin.display(description="Товар", ordering='product__name')
@@ -260,6 +371,7 @@ class ReviewAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     actions = ['mark_as_moderated', 'mark_as_not_moderated']
     raw_id_fields = ('user', 'product')
+    list_select_related = ('product', 'user')
 
     @admin.display(description="Дата создания", ordering='created_at')
     def created_at_formatted(self, obj):
@@ -277,13 +389,21 @@ class ReviewAdmin(admin.ModelAdmin):
         link = reverse("admin:st_user_change", args=[obj.user.id])
         return mark_safe(f'<a href="{link}">{obj.user.username}</a>')
 
+    # set_moderated() вместо update(): сводка рейтинга товаров обновляется вместе с флагом
     @admin.action(description="Отметить как промодерированные")
     def mark_as_moderated(self, request, queryset):
-        queryset.update(is_moderated=True)
+        self._set_moderated(queryset, True)
 
     @admin.action(description="Отметить как НЕ промодерированные")
     def mark_as_not_moderated(self, request, queryset):
-        queryset.update(is_moderated=False)
+        self._set_moderated(queryset, False)
+
+    def _set_moderated(self, queryset, is_moderated):
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        queryset.set_moderated(is_moderated)
+        bump_reviews_version()
+        # Рейтинг в карточках товаров
+        refresh_product_cards(product_ids)
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -291,6 +411,7 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user_link', 'product_link')
     search_fields = ('user__username', 'product__name')
     raw_id_fields = ('user', 'product')
+    list_select_related = ('user', 'product')
 
     @admin.display(description="Товар", ordering='product__name')
     def product_link(self, obj):
@@ -313,6 +434,7 @@ class OrderAdmin(admin.ModelAdmin):
     base_readonly_fields = ('calculated_total_price', 'order_date', 'updated_at', 'total_price') 
     inlines = [OrderItemInline]
     raw_id_fields = ('user',)
+    actions = ['export_selected_orders_as_csv', 'download_invoices_zip']
     
     def get_fieldsets(self, request, obj=None):
         base_main_info_fields = ['order_date', 'updated_at', 'status', 'payment_method', 'tracking_number']
@@ -341,7 +463,7 @@ class OrderAdmin(admin.ModelAdmin):
     @admin.display(description="Клиент", ordering='user__username')
     def user_info(self, obj):
         if obj.user:
-            link = reverse("admin:st_user_change", args=[obj.user.id])
+            link = reverse("admin:st_user_change", args=[obj.user_id])
             return mark_safe(f'<a href="{link}">{obj.user.username}</a>')
         return f"Гость: {obj.guest_name or 'N/A'} ({obj.guest_email or obj.guest_phone or 'N/A'})"
 
@@ -359,9 +481,7 @@ class OrderAdmin(admin.ModelAdmin):
 
     @admin.display(description="Итоговая стоимость", ordering='total_price')
     def total_price_formatted(self, obj):
-        from django.contrib.humanize.templatetags.humanize import intcomma
-        if obj.pk:
-            obj.refresh_from_db(fields=['total_price'])
+        # total_price всегда актуален (пересчитывается при коммите изменений позиций), перечитывать не нужно
         return f"{intcomma(obj.total_price)} руб."
 
     @admin.display(description="Расчетная стоимость (инлайн)")
@@ -377,13 +497,26 @@ class OrderAdmin(admin.ModelAdmin):
         url = reverse('admin_order_pdf', args=[obj.id])
         return mark_safe(f'<a href="{url}" target="_blank">PDF</a>')
 
+    @admin.action(description="Экспортировать выбранные заказы в CSV (с позициями)")
+    def export_selected_orders_as_csv(self, request, queryset):
+        return export_orders_csv(queryset, filename=f"{self.model._meta.verbose_name_plural}.csv")
+
+    @admin.action(description="Скачать счета (PDF) выбранных заказов одним ZIP-архивом")
+    def download_invoices_zip(self, request, queryset):
+        order_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        response = StreamingHttpResponse(iter_invoices_zip(order_ids), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+        return response
+
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('items__variant__product', 'user')
+        return super().get_queryset(request).select_related('user')
 
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False) 
         order_instance = form.instance 
 
+        for obj in formset.deleted_objects:
+            obj.delete()
         for instance in instances:
             if isinstance(instance, OrderItem) and instance.variant:
                 if not instance.pk or not instance.price_at_time: 
@@ -393,16 +526,7 @@ class OrderAdmin(admin.ModelAdmin):
                 instance.order = order_instance
             instance.save() 
         formset.save_m2m()
-        
-        if order_instance.pk: 
-            if hasattr(order_instance, 'update_total_price'):
-                order_instance.update_total_price()
-            else:
-                # Запасной вариант, если метода update_total_price нет
-                current_total = sum(item.item_total_price for item in order_instance.items.all())
-                if order_instance.total_price != current_total:
-                    order_instance.total_price = current_total
-                    order_instance.save(update_fields=['total_price'])
+        # total_price пересчитывается один раз при коммите транзакции (сигнал OrderItem)
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -411,6 +535,8 @@ class OrderItemAdmin(admin.ModelAdmin):
     search_fields = ('order__id', 'variant__sku', 'variant__product__name')
     raw_id_fields = ('order', 'variant')
     readonly_fields = ('price_at_time', 'item_total_price_display')
+    # str(variant) выводит товар, цвет и размер: все подгружаем одним JOIN
+    list_select_related = ('variant__product', 'variant__color', 'variant__size')
     fields = ('order', 'variant', 'quantity', 'price_at_time', 'item_total_price_display') # Добавил 'price_at_time' и 'item_total_price_display' сюда
 
     # Переопределяем save_model для установки price_at_time при прямом добавлении OrderItem
@@ -420,28 +546,19 @@ class OrderItemAdmin(admin.ModelAdmin):
         if obj.variant and (not obj.price_at_time or not change): # Если выбран вариант и цена не установлена или это новый объект
             obj.price_at_time = obj.variant.price
         super().save_model(request, obj, form, change)
-        # После сохранения OrderItem, также нужно обновить total_price связанного заказа
-        if obj.order: # Убедимся, что заказ существует
-            if hasattr(obj.order, 'update_total_price'):
-                obj.order.update_total_price()
-            else:
-                # Запасной вариант, если метода update_total_price нет
-                current_total = sum(item.item_total_price for item in obj.order.items.all())
-                if obj.order.total_price != current_total:
-                    obj.order.total_price = current_total
-                    obj.order.save(update_fields=['total_price'])
+        # total_price заказа пересчитает сигнал OrderItem при коммите транзакции
 
     @admin.display(description="Заказ", ordering='order__id')
     def order_link(self, obj):
-        if obj.order:
-            link = reverse("admin:st_order_change", args=[obj.order.id])
-            return mark_safe(f'<a href="{link}">Заказ №{obj.order.id}</a>')
+        if obj.order_id:
+            link = reverse("admin:st_order_change", args=[obj.order_id])
+            return mark_safe(f'<a href="{link}">Заказ №{obj.order_id}</a>')
         return "N/A"
 
     @admin.display(description="Вариант товара", ordering='variant__sku')
     def variant_link(self, obj):
         if obj.variant:
-            link = reverse("admin:st_productvariant_change", args=[obj.variant.id])
+            link = reverse("admin:st_productvariant_change", args=[obj.variant_id])
             return mark_safe(f'<a href="{link}">{obj.variant}</a>')
         return "N/A"
     
@@ -470,6 +587,7 @@ class PromoProductAdmin(admin.ModelAdmin):
     list_display = ('promo_link', 'product_link')
     search_fields = ('promo__title', 'product__name')
     raw_id_fields = ('promo', 'product')
+    list_select_related = ('promo', 'product')
 
     @admin.display(description="Промоакция", ordering='promo__title')
     def promo_link(self, obj):
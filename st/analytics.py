@@ -0,0 +1,369 @@
+# st/analytics.py
+"""
+Сводки продаж по дням и данные дашборда продаж.
+
+DailySalesRollup хранит выручку и штуки за день в разрезе типа техники, бренда, способа оплаты
+и статуса заказа, DailyOrderRollup - число заказов за день по способу оплаты и статусу.
+Отчеты читают только сводки: их объем зависит от числа дней и групп, а не от числа заказов.
+
+Сигналы Order (создание, смена статуса или способа оплаты, удаление) и позиций заказа
+(order_items_changed, в том числе массовые операции) только помечают заказы. При коммите
+(defer_on_commit) для каждого помеченного заказа вычисляется его текущий вклад в сводки и сравнивается
+с учтенным (RolledUpOrder): к затронутым группам прибавляется разность, поэтому стоимость записи
+зависит от размера заказа, а не от числа заказов за день. Целиком дни пересчитывает только
+rebuild_sales_rollups (он же исправляет расхождения после изменений в обход ORM). Переименование
+типа техники видно сразу (сводка ссылается на него), а смена бренда или типа у товара попадает
+в прошлые дни только после rebuild_sales_rollups: сводка фиксирует продажу такой, какой она была
+на момент учета заказа.
+
+Дашборд (sales_dashboard) строит ряды по дням на NumPy: скользящее среднее, сравнение
+с предыдущим периодом той же длины и разбивку по типам техники и брендам.
+"""
+import datetime
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.db import IntegrityError, router, transaction
+from django.db.models import F, Max, Min, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .deferred import defer_on_commit
+from .models import (
+    DailyOrderRollup, DailySalesRollup, Order, OrderItem, RolledUpOrder, TechType, order_items_changed,
+)
+
+# Дней в одном запросе пересчета (полная перестройка идет такими отрезками)
+ROLLUP_DAYS_PER_QUERY = 31
+DASHBOARD_PERIODS = (7, 30, 90, 365)
+DASHBOARD_DEFAULT_DAYS = 30
+MOVING_AVERAGE_DAYS = 7
+# Отмененные заказы по умолчанию не входят в выручку дашборда
+DEFAULT_EXCLUDED_STATUSES = (Order.STATUS_CANCELLED,)
+
+
+# --- Пересчет ---
+def order_day(order_date):
+    """День заказа в часовом поясе проекта."""
+    return timezone.localdate(order_date)
+
+
+def _day_spans(days, max_length=ROLLUP_DAYS_PER_QUERY):
+    """Разбивает дни на отрезки подряд идущих дней (first, last) длиной не больше max_length."""
+    spans = []
+    for day in sorted(set(days)):
+        if spans and (day - spans[-1][1]).days == 1 and (day - spans[-1][0]).days < max_length:
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return [tuple(span) for span in spans]
+
+
+def _span_bounds(first, last):
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime.combine(first, datetime.time.min, tzinfo=tz)
+    end = datetime.datetime.combine(last + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+    return start, end
+
+
+def _contributions(orders):
+    """
+    {id заказа: RolledUpOrder с текущим вкладом} для заказов из queryset orders: день, способ оплаты,
+    статус и продажи по группам (тип техники, бренд). Два запроса при любом числе заказов.
+    """
+    result = {
+        pk: RolledUpOrder(order_id=pk, day=order_day(order_date), payment_method=payment_method, status=status)
+        for pk, order_date, payment_method, status in orders.values_list('pk', 'order_date', 'payment_method', 'status')
+    }
+    rows = (
+        OrderItem.objects.using(orders.db)
+        .filter(order__in=orders)
+        .values_list('order_id', 'variant__product__tech_type', 'variant__product__brand')
+        .annotate(revenue=Sum(F('quantity') * F('price_at_time')), units=Sum('quantity'))
+        .order_by('order_id', 'variant__product__tech_type', 'variant__product__brand')
+    )
+    for order_id, tech_type, brand, revenue, units in rows:
+        if order_id in result:
+            result[order_id].groups.append([tech_type, brand or '', str(revenue or Decimal('0.00')), units or 0])
+    return result
+
+
+class _RollupDelta:
+    """Изменения сводок: (день, тип, бренд, оплата, статус) -> [выручка, штук, заказов]; (день, оплата, статус) -> заказов."""
+
+    def __init__(self):
+        self.sales = defaultdict(lambda: [Decimal('0.00'), 0, 0])
+        self.orders = Counter()
+
+    def add(self, order, sign=1):
+        self.orders[order.day, order.payment_method, order.status] += sign
+        for tech_type, brand, revenue, units in order.groups:
+            values = self.sales[order.day, tech_type, brand, order.payment_method, order.status]
+            values[0] += sign * Decimal(revenue)
+            values[1] += sign * units
+            values[2] += sign
+
+
+def _add_to_rollup(model, key, deltas, using):
+    """Прибавляет deltas ({поле: изменение}) к строке сводки key; строка создается, если ее нет."""
+    rows = model.objects.using(using).filter(**key)
+    if rows.update(**{field: F(field) + value for field, value in deltas.items()}):
+        return
+    if any(value < 0 for value in deltas.values()):
+        # Вычитать не из чего: сводка расходится с RolledUpOrder до rebuild_sales_rollups
+        return
+    try:
+        with transaction.atomic(using=using):
+            model.objects.using(using).create(**key, **deltas)
+    except IntegrityError:
+        # Параллельная транзакция создала ту же строку (DailyOrderRollup уникальна по ключу)
+        rows.update(**{field: F(field) + value for field, value in deltas.items()})
+
+
+def _apply_delta(delta, using):
+    # Вклад, учтенный с удаленным потом типом техники, переходит к строкам без типа, как и сами сводки (SET_NULL)
+    tech_types = {key[1] for key in delta.sales if key[1] is not None}
+    existing = set(TechType.objects.using(using).filter(pk__in=tech_types).values_list('pk', flat=True))
+    for (day, tech_type, brand, payment_method, status), (revenue, units, orders) in delta.sales.items():
+        if revenue or units or orders:
+            key = {
+                'day': day, 'tech_type_id': tech_type if tech_type in existing else None, 'brand': brand,
+                'payment_method': payment_method, 'status': status,
+            }
+            _add_to_rollup(DailySalesRollup, key, {'revenue': revenue, 'units': units, 'orders': orders}, using)
+    for (day, payment_method, status), orders in delta.orders.items():
+        if orders:
+            key = {'day': day, 'payment_method': payment_method, 'status': status}
+            _add_to_rollup(DailyOrderRollup, key, {'orders': orders}, using)
+    # Группы, из которых ушли все заказы, не хранятся - как после полной перестройки
+    days = {key[0] for key in delta.orders}
+    DailySalesRollup.objects.using(using).filter(day__in=days, orders=0).delete()
+    DailyOrderRollup.objects.using(using).filter(day__in=days, orders=0).delete()
+
+
+def refresh_order_sales(order_ids, using=None):
+    """
+    Применяет к сводкам изменения заказов order_ids (в том числе удаленных): вычитает учтенный
+    вклад заказа и прибавляет текущий. Используется как callback для defer_on_commit.
+    """
+    using = using or router.db_for_write(DailySalesRollup)
+    order_ids = {pk for pk in order_ids if pk is not None}
+    if not order_ids:
+        return
+    with transaction.atomic(using=using):
+        # Блокировка учтенных заказов: параллельный пересчет тех же заказов ждет и видит новый вклад
+        old = {order.pk: order for order in RolledUpOrder.objects.using(using).select_for_update().filter(pk__in=order_ids)}
+        new = _contributions(Order.objects.using(using).filter(pk__in=order_ids))
+        delta = _RollupDelta()
+        for pk in order_ids:
+            before, after = old.get(pk), new.get(pk)
+            if before and after and (before.day, before.payment_method, before.status, before.groups) == (
+                after.day, after.payment_method, after.status, after.groups,
+            ):
+                continue
+            if before:
+                delta.add(before, -1)
+            if after:
+                delta.add(after)
+        _apply_delta(delta, using)
+        RolledUpOrder.objects.using(using).filter(pk__in=order_ids - set(new)).delete()
+        RolledUpOrder.objects.using(using).bulk_create(
+            new.values(), update_conflicts=True, unique_fields=['order_id'],
+            update_fields=['day', 'payment_method', 'status', 'groups'],
+        )
+
+
+def _rebuild_span(first, last, using):
+    start, end = _span_bounds(first, last)
+    orders = _contributions(Order.objects.using(using).filter(order_date__gte=start, order_date__lt=end))
+    totals = _RollupDelta()
+    for order in orders.values():
+        totals.add(order)
+    sales = [
+        DailySalesRollup(
+            day=day, tech_type_id=tech_type, brand=brand, payment_method=payment_method, status=status,
+            revenue=revenue, units=units, orders=count,
+        )
+        for (day, tech_type, brand, payment_method, status), (revenue, units, count) in totals.sales.items()
+    ]
+    order_counts = [
+        DailyOrderRollup(day=day, payment_method=payment_method, status=status, orders=count)
+        for (day, payment_method, status), count in totals.orders.items()
+    ]
+    with transaction.atomic(using=using):
+        DailySalesRollup.objects.using(using).filter(day__range=(first, last)).delete()
+        DailyOrderRollup.objects.using(using).filter(day__range=(first, last)).delete()
+        RolledUpOrder.objects.using(using).filter(day__range=(first, last)).delete()
+        DailySalesRollup.objects.using(using).bulk_create(sales, batch_size=500)
+        DailyOrderRollup.objects.using(using).bulk_create(order_counts, batch_size=500)
+        RolledUpOrder.objects.using(using).bulk_create(
+            orders.values(), batch_size=500, update_conflicts=True, unique_fields=['order_id'],
+            update_fields=['day', 'payment_method', 'status', 'groups'],
+        )
+
+
+def refresh_sales_days(days, using=None):
+    """Пересчитывает сводки за указанные дни целиком (rebuild_sales_rollups)."""
+    using = using or router.db_for_write(DailySalesRollup)
+    for first, last in _day_spans(days):
+        _rebuild_span(first, last, using)
+
+
+def rebuild_sales_rollups(date_from=None, date_to=None, using=None):
+    """
+    Перестраивает сводки за период (по умолчанию - за всю историю заказов) отрезками
+    по ROLLUP_DAYS_PER_QUERY дней. Возвращает число дней.
+    """
+    using = using or router.db_for_write(DailySalesRollup)
+    full = date_from is None and date_to is None
+    if date_from is None or date_to is None:
+        bounds = Order.objects.using(using).aggregate(first=Min('order_date'), last=Max('order_date'))
+        if bounds['first'] is None:
+            if full:
+                DailySalesRollup.objects.using(using).all().delete()
+                DailyOrderRollup.objects.using(using).all().delete()
+                RolledUpOrder.objects.using(using).all().delete()
+            return 0
+        date_from = date_from or order_day(bounds['first'])
+        date_to = date_to or order_day(bounds['last'])
+    if full:
+        # Сводки за дни вне истории заказов остаются только после изменений в обход ORM
+        outside = ~Q(day__range=(date_from, date_to))
+        DailySalesRollup.objects.using(using).filter(outside).delete()
+        DailyOrderRollup.objects.using(using).filter(outside).delete()
+        RolledUpOrder.objects.using(using).filter(outside).delete()
+    total = max((date_to - date_from).days + 1, 0)
+    refresh_sales_days((date_from + datetime.timedelta(days=i) for i in range(total)), using=using)
+    return total
+
+
+# --- Синхронизация ---
+@receiver([post_save, post_delete], sender=Order)
+def order_sales_receiver(sender, instance, using=None, raw=False, **kwargs):
+    # Статус и способ оплаты - измерения сводок; вклад удаленного заказа берется из RolledUpOrder
+    if not raw:
+        defer_on_commit(refresh_order_sales, {instance.pk}, using=using)
+
+
+@receiver(order_items_changed)
+def order_items_sales_receiver(sender, order_ids, using=None, **kwargs):
+    defer_on_commit(refresh_order_sales, order_ids, using=using)
+
+
+# --- Дашборд ---
+def _percent_change(current, previous):
+    """(current - previous) / previous в процентах; nan, если предыдущее значение нулевое."""
+    current = np.asarray(current, dtype=float)
+    previous = np.asarray(previous, dtype=float)
+    change = np.full(np.broadcast(current, previous).shape, np.nan)
+    np.divide(current - previous, previous, out=change, where=previous != 0)
+    return change * 100
+
+
+def moving_average(values, window=MOVING_AVERAGE_DAYS):
+    """Скользящее среднее за window дней; первые window - 1 значений - по неполному окну."""
+    values = np.asarray(values, dtype=float)
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def _dense(rows, start, length, fields):
+    """Ряды по дням [start, start + length) из строк {'day': ..., поле: ...}; пропущенные дни - нули."""
+    series = {field: np.zeros(length) for field in fields}
+    if rows:
+        offsets = np.array([(row['day'] - start).days for row in rows], dtype=np.intp)
+        for field in fields:
+            series[field][offsets] = np.array([float(row[field] or 0) for row in rows])
+    return series
+
+
+def _breakdown(sales, group_by, start, prev_start):
+    rows = list(
+        sales.values(name=F(group_by))
+        .annotate(
+            current=Sum('revenue', filter=Q(day__gte=start)),
+            previous=Sum('revenue', filter=Q(day__gte=prev_start, day__lt=start)),
+            units=Sum('units', filter=Q(day__gte=start)),
+        )
+        .order_by()
+    )
+    if not rows:
+        return []
+    current = np.array([float(row['current'] or 0) for row in rows])
+    previous = np.array([float(row['previous'] or 0) for row in rows])
+    total = current.sum()
+    share = current / total * 100 if total else np.zeros_like(current)
+    change = _percent_change(current, previous)
+    order = np.argsort(-current, kind='stable')
+    return [
+        {
+            'name': rows[i]['name'] or "Не указан", 'revenue': current[i], 'previous': previous[i],
+            'units': rows[i]['units'] or 0, 'share': share[i], 'change': None if np.isnan(change[i]) else change[i],
+        }
+        for i in order if current[i] or previous[i]
+    ]
+
+
+def sales_dashboard(days=DASHBOARD_DEFAULT_DAYS, status=None, payment_method=None, today=None):
+    """
+    Данные дашборда за последние days дней (включая today) и предыдущий период той же длины.
+    status - статус заказа (None - все, кроме DEFAULT_EXCLUDED_STATUSES); payment_method - способ оплаты.
+    Четыре запроса к сводкам независимо от числа заказов.
+    """
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=days - 1)
+    prev_start = start - datetime.timedelta(days=days)
+    # История для скользящего среднего в первый день предыдущего периода
+    history_start = prev_start - datetime.timedelta(days=MOVING_AVERAGE_DAYS - 1)
+    length = (today - history_start).days + 1
+
+    filters = Q(day__gte=history_start, day__lte=today)
+    filters &= Q(status=status) if status else ~Q(status__in=DEFAULT_EXCLUDED_STATUSES)
+    if payment_method:
+        filters &= Q(payment_method=payment_method)
+    sales = DailySalesRollup.objects.filter(filters)
+    sales_rows = list(sales.values('day').annotate(revenue=Sum('revenue'), units=Sum('units')).order_by())
+    order_rows = list(DailyOrderRollup.objects.filter(filters).values('day').annotate(orders=Sum('orders')).order_by())
+    series = _dense(sales_rows, history_start, length, ('revenue', 'units'))
+    series.update(_dense(order_rows, history_start, length, ('orders',)))
+
+    # Последние 2 * days дней: предыдущий период и текущий
+    current = slice(length - days, length)
+    previous = slice(length - 2 * days, length - days)
+    totals = {name: values[current].sum() for name, values in series.items()}
+    previous_totals = {name: values[previous].sum() for name, values in series.items()}
+    for bucket in (totals, previous_totals):
+        bucket['average_check'] = bucket['revenue'] / bucket['orders'] if bucket['orders'] else 0.0
+    names = list(totals)
+    changes = _percent_change([totals[name] for name in names], [previous_totals[name] for name in names])
+
+    revenue_average = moving_average(series['revenue'])
+    return {
+        'days': days, 'start': start, 'end': today,
+        'dates': [start + datetime.timedelta(days=i) for i in range(days)],
+        'revenue': series['revenue'][current],
+        'revenue_average': revenue_average[current],
+        'previous_revenue_average': revenue_average[previous],
+        'orders': series['orders'][current],
+        'orders_average': moving_average(series['orders'])[current],
+        'units': series['units'][current],
+        'totals': totals,
+        'previous_totals': previous_totals,
+        'changes': {name: None if np.isnan(change) else change for name, change in zip(names, changes)},
+        'by_tech_type': _breakdown(sales, 'tech_type__name', start, prev_start),
+        'by_brand': _breakdown(sales, 'brand', start, prev_start),
+    }
+
+
+def svg_polyline(values, vmax, width, height):
+    """Точки SVG polyline для ряда values в области width x height (ось y вверх, 0 - внизу)."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return ''
+    x = np.linspace(0, width, len(values)) if len(values) > 1 else np.zeros(1)
+    y = height - (values / vmax * height if vmax else np.zeros_like(values))
+    return ' '.join(f'{px:.1f},{py:.1f}' for px, py in zip(x, y))
@@ -0,0 +1,274 @@
+# st/api.py
+"""
+JSON API каталога только для чтения (Django REST framework + django-filter).
+
+Ресурсы: товары, варианты, категории, типы техники и промодерированные отзывы. Параметры:
+  fields=id,name,...      - оставить только эти поля;
+  include=variants,...    - развернуть связи (см. expandable_fields сериализатора);
+  fields[variants]=sku,.. - поля вложенных объектов;
+  cursor, page_size       - курсорная пагинация (st.pagination.KeysetPaginator), до 500 объектов.
+Queryset строится по запрошенному набору полей: select_related/prefetch_related и расчет цен
+добавляются только для того, что попадет в ответ, поэтому число запросов не зависит от размера
+страницы.
+
+ETag ответа строится из версий каталога, отзывов и акций и полного URL, без обращения к БД.
+Запрос с совпадающим If-None-Match получает 304 до построения queryset.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.views.decorators.http import etag
+from django_filters import rest_framework as filters
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .catalog import category_subtree_ids, get_catalog_version, get_reviews_version
+from .models import Category, Product, ProductVariant, Review, TechType
+from .pagination import InvalidCursor, KeysetPaginator
+from .pricing import annotate_product_prices, annotate_variant_prices, current_window
+from .serializers import (
+    CategorySerializer, ProductSerializer, ReviewSerializer, TechTypeSerializer, VariantSerializer,
+)
+from .versions import page_cache_timeout
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+API_EPOCH_KEY = 'st:api:epoch'
+
+
+# --- ETag ---
+def _cache_epoch():
+    # Версии живут в кэше и после его очистки начинаются заново; случайная «эпоха»
+    # не дает старому ETag совпасть с новым ответом при тех же номерах версий. Срок жизни -
+    # как у версий (st.versions): с локальным кэшем процесса ETag воркера, не видевшего
+    # изменения, совпадает со старым ответом не дольше page_cache_timeout()
+    epoch = cache.get(API_EPOCH_KEY)
+    if epoch is None:
+        cache.add(API_EPOCH_KEY, uuid.uuid4().hex, timeout=page_cache_timeout())
+        epoch = cache.get(API_EPOCH_KEY)
+    return epoch
+
+
+def api_etag(request, *args, **kwargs):
+    promo_version, boundary, _ = current_window()
+    parts = [
+        _cache_epoch(), get_catalog_version(), get_reviews_version(), promo_version, boundary.isoformat(),
+        request.get_full_path(), request.META.get('HTTP_ACCEPT', ''),
+    ]
+    return hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+# --- Пагинация ---
+class KeysetCursorPagination(BasePagination):
+    """Курсорная пагинация DRF; упорядочение - атрибут cursor_ordering вьюхи."""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = API_PAGE_SIZE
+    max_page_size = API_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Должно быть целым числом"})
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, view.cursor_ordering, self.get_page_size(request))
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Некорректный курсор страницы")
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+
+# --- Базовый класс ресурсов ---
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+@method_decorator(etag(api_etag), name='dispatch')
+class CatalogApiViewSet(viewsets.ReadOnlyModelViewSet):
+    # Публичные данные каталога: без сессий и проверки пользователя
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    pagination_class = KeysetCursorPagination
+    filter_backends = [filters.DjangoFilterBackend]
+    cursor_ordering = ('id',)
+
+    @cached_property
+    def fieldset(self):
+        """{'fields': набор или None, 'include': набор, 'nested': {связь: набор}} из GET-параметров."""
+        serializer_class = self.get_serializer_class()
+        params = self.request.query_params
+        fields = _names(params['fields']) if 'fields' in params else None
+        include = _names(params.get('include', ''))
+        errors = {}
+        if fields is not None and fields - serializer_class.available_fields():
+            errors['fields'] = f"Неизвестные поля: {', '.join(sorted(fields - serializer_class.available_fields()))}"
+        if include - set(serializer_class.expandable_fields):
+            errors['include'] = f"Неизвестные связи: {', '.join(sorted(include - set(serializer_class.expandable_fields)))}"
+        nested = {}
+        for name in include & set(serializer_class.expandable_fields):
+            if f'fields[{name}]' in params:
+                nested[name] = _names(params[f'fields[{name}]'])
+                unknown = nested[name] - serializer_class.expandable_fields[name][0].available_fields()
+                if unknown:
+                    errors[f'fields[{name}]'] = f"Неизвестные поля: {', '.join(sorted(unknown))}"
+        if errors:
+            raise ValidationError(errors)
+        return {'fields': fields, 'include': include, 'nested': nested}
+
+    def wants(self, *names, relation=None):
+        """Нужно ли в ответе хотя бы одно из полей names (relation - поля вложенной связи)."""
+        fields = self.fieldset['nested'].get(relation) if relation else self.fieldset['fields']
+        return fields is None or not fields.isdisjoint(names)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.fieldset, **kwargs)
+
+    def prepare_objects(self, objects):
+        """Дополняет объекты страницы расчетными полями (скидки); по умолчанию ничего не делает."""
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.prepare_objects(page)
+        return page
+
+    def get_object(self):
+        obj = super().get_object()
+        self.prepare_objects([obj])
+        return obj
+
+
+# --- Товары ---
+class ProductFilter(filters.FilterSet):
+    category = filters.NumberFilter(method='filter_category', label="Категория (вместе с подкатегориями)")
+    in_stock = filters.BooleanFilter(method='filter_in_stock', label="Есть вариант в наличии")
+
+    class Meta:
+        model = Product
+        fields = ['tech_type', 'brand', 'category', 'in_stock']
+
+    def filter_category(self, queryset, name, value):
+        product_ids = Product.categories.through.objects.filter(
+            category_id__in=category_subtree_ids(value),
+        ).values('product_id')
+        return queryset.filter(pk__in=product_ids)
+
+    def filter_in_stock(self, queryset, name, value):
+        in_stock = Exists(ProductVariant.objects.filter(product=OuterRef('pk'), stock_quantity__gt=0))
+        return queryset.filter(in_stock) if value else queryset.exclude(in_stock)
+
+
+def variant_queryset(view, relation=None):
+    """Варианты с теми связанными таблицами, поля которых попадут в ответ."""
+    queryset = ProductVariant.objects.all()
+    related = {
+        table for field, table in VariantSerializer.RELATED_FIELDS.items()
+        if view.wants(field, relation=relation)
+    }
+    return queryset.select_related(*sorted(related)) if related else queryset
+
+
+class ProductViewSet(CatalogApiViewSet):
+    serializer_class = ProductSerializer
+    filterset_class = ProductFilter
+    # Совпадает с индексом st_product_keyset_idx
+    cursor_ordering = ('-created_at', 'name', 'id')
+
+    def get_queryset(self):
+        queryset = Product.active_products.all()
+        include = self.fieldset['include']
+        if self.wants(*ProductSerializer.PRICE_FIELDS):
+            # Коррелированный подзапрос считается только для строк страницы, в отличие от GROUP BY
+            cheapest = ProductVariant.objects.filter(product=OuterRef('pk')).order_by('price').values('price')[:1]
+            queryset = queryset.annotate(min_price=Subquery(cheapest))
+        if 'tech_type' in include:
+            queryset = queryset.select_related('tech_type')
+        for name in ('categories', 'specifications'):
+            if name in include:
+                queryset = queryset.prefetch_related(name)
+        if 'variants' in include:
+            variants = variant_queryset(self, relation='variants').order_by('price', 'id')
+            queryset = queryset.prefetch_related(Prefetch('variants', queryset=variants))
+        return queryset
+
+    def prepare_objects(self, products):
+        if self.wants(*ProductSerializer.PRICE_FIELDS):
+            annotate_product_prices(products)
+        if 'variants' in self.fieldset['include'] and self.wants(*VariantSerializer.PRICE_FIELDS, relation='variants'):
+            # Скидки по товарам уже в кэше после annotate_product_prices(): обычно без запросов
+            annotate_variant_prices(variant for product in products for variant in product.variants.all())
+
+
+# --- Варианты ---
+class VariantFilter(filters.FilterSet):
+    in_stock = filters.BooleanFilter(method='filter_in_stock', label="В наличии")
+
+    class Meta:
+        model = ProductVariant
+        fields = ['product', 'color', 'size', 'in_stock']
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock_quantity__gt=0) if value else queryset.filter(stock_quantity=0)
+
+
+class VariantViewSet(CatalogApiViewSet):
+    serializer_class = VariantSerializer
+    filterset_class = VariantFilter
+
+    def get_queryset(self):
+        return variant_queryset(self).filter(product__is_active=True)
+
+    def prepare_objects(self, variants):
+        if self.wants(*VariantSerializer.PRICE_FIELDS):
+            annotate_variant_prices(variants)
+
+
+# --- Справочники ---
+class CategoryViewSet(CatalogApiViewSet):
+    serializer_class = CategorySerializer
+    filterset_fields = ['parent', 'depth']
+    # Путь в дереве: родители идут перед потомками
+    cursor_ordering = ('path', 'id')
+    queryset = Category.objects.all()
+
+
+class TechTypeViewSet(CatalogApiViewSet):
+    serializer_class = TechTypeSerializer
+    cursor_ordering = ('name', 'id')
+    queryset = TechType.objects.all()
+
+
+# --- Отзывы ---
+class ReviewViewSet(CatalogApiViewSet):
+    serializer_class = ReviewSerializer
+    filterset_fields = ['product', 'rating']
+    cursor_ordering = ('-created_at', 'id')
+
+    def get_queryset(self):
+        queryset = Review.objects.filter(is_moderated=True, product__is_active=True)
+        return queryset.select_related('user') if self.wants('user') else queryset
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'st'
+
+    def ready(self):
+        # Регистрация обработчиков сигналов, вынесенных из models.py
+        from . import (
+            analytics, cards, catalog, invoices, middleware, pagecache, pricing, recommendations, search, thumbnails,
+        )
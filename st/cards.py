@@ -0,0 +1,173 @@
+# st/cards.py
+"""
+Карточки товаров (ProductCard) - read-модель для списков.
+
+Строка списка товаров собирается из пяти таблиц: товар, тип техники, категории, варианты
+(цены, остатки, изображения) и сводка рейтинга. Карточка хранит все это в одной строке, поэтому
+список - это один запрос к одной таблице без JOIN, GROUP BY и prefetch.
+
+Карточки пересчитываются пачками: сигналы Product, ProductVariant, Review, категорий и типов
+техники только помечают товары, а пересчет выполняется один раз при коммите (defer_on_commit):
+четыре запроса на чтение и один upsert на пачку товаров. Массовые изменения без сигналов
+(QuerySet.update(), списание остатков в st.checkout) вызывают refresh_product_cards() явно.
+Полная перестройка - команда rebuild_product_cards.
+"""
+from django.db import router
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .deferred import defer_on_commit
+from .models import Category, Product, ProductCard, ProductVariant, Review, TechType
+from .pagecache import m2m_product_ids
+
+CARD_BATCH_SIZE = 1000
+# Поля карточки, которые перезаписываются при пересчете (все, кроме ключа)
+CARD_FIELDS = [
+    'name', 'brand', 'description', 'is_active', 'created_at', 'manufacturer_url', 'tech_type_name',
+    'category_names', 'min_price', 'max_price', 'total_stock', 'variants_count', 'rating_avg',
+    'rating_count', 'image', 'image_hash', 'refreshed_at',
+]
+
+
+# --- Пересчет ---
+def refresh_product_cards(product_ids, using=None):
+    """
+    Пересчитывает карточки товаров с указанными id (карточки удаленных товаров удаляются).
+    Используется как callback для defer_on_commit.
+    """
+    using = using or router.db_for_write(ProductCard)
+    product_ids = sorted({pk for pk in product_ids if pk is not None})
+    for start in range(0, len(product_ids), CARD_BATCH_SIZE):
+        _refresh_batch(product_ids[start:start + CARD_BATCH_SIZE], using)
+    if product_ids:
+        # Страницы списков кэшируются по версии каталога (st.pagecache), а карточки обновляются
+        # уже после коммита: без повторного сброса в кэш мог попасть список со старыми карточками
+        bump_catalog_version()
+
+
+def build_product_cards(product_ids, using=None):
+    """Несохраненные ProductCard для существующих товаров из product_ids; четыре запроса."""
+    products = (
+        Product.objects.using(using).filter(pk__in=product_ids)
+        .values_list(
+            'pk', 'name', 'brand', 'description', 'is_active', 'created_at', 'manufacturer_url',
+            'tech_type__name', 'rating_avg', 'rating_count',
+        )
+    )
+    stats = {
+        row['product_id']: row
+        for row in (
+            ProductVariant.objects.using(using).filter(product_id__in=product_ids)
+            .values('product_id')
+            .annotate(min_price=Min('price'), max_price=Max('price'), total_stock=Sum('stock_quantity'), variants_count=Count('id'))
+            .order_by()
+        )
+    }
+    images = {}
+    image_rows = (
+        ProductVariant.objects.using(using).filter(product_id__in=product_ids)
+        .exclude(image='').exclude(image__isnull=True)
+        .order_by('product_id', 'price', 'pk').values_list('product_id', 'image', 'image_hash')
+    )
+    for product_id, image, image_hash in image_rows:
+        images.setdefault(product_id, (image, image_hash))
+    categories = {}
+    category_rows = (
+        Product.categories.through.objects.using(using).filter(product_id__in=product_ids)
+        .order_by('product_id', *(f'category__{field}' for field in Category._meta.ordering))
+        .values_list('product_id', 'category__name')
+    )
+    for product_id, name in category_rows:
+        categories.setdefault(product_id, []).append(name)
+
+    cards = []
+    for pk, name, brand, description, is_active, created_at, url, tech_type_name, rating_avg, rating_count in products:
+        row = stats.get(pk, {})
+        image, image_hash = images.get(pk, (None, ''))
+        cards.append(ProductCard(
+            product_id=pk, name=name, brand=brand, description=description, is_active=is_active,
+            created_at=created_at, manufacturer_url=url, tech_type_name=tech_type_name,
+            category_names=categories.get(pk, []),
+            min_price=row.get('min_price'), max_price=row.get('max_price'),
+            total_stock=row.get('total_stock') or 0, variants_count=row.get('variants_count', 0),
+            rating_avg=rating_avg, rating_count=rating_count,
+            image=image, image_hash=image_hash,
+        ))
+    return cards
+
+
+def _refresh_batch(product_ids, using):
+    cards = build_product_cards(product_ids, using)
+    if cards:
+        # Один INSERT ... ON CONFLICT DO UPDATE на пачку; auto_now при bulk_create заполняется
+        ProductCard.objects.using(using).bulk_create(
+            cards, update_conflicts=True, unique_fields=['product'], update_fields=CARD_FIELDS,
+        )
+    missing = set(product_ids) - {card.product_id for card in cards}
+    if missing:
+        ProductCard.objects.using(using).filter(pk__in=missing).delete()
+
+
+def rebuild_product_cards(batch_size=CARD_BATCH_SIZE, using=None):
+    """Полная перестройка карточек пачками. Возвращает число товаров."""
+    using = using or router.db_for_write(ProductCard)
+    total = 0
+    batch = []
+    for pk in Product.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            _refresh_batch(batch, using)
+            total += len(batch)
+            batch = []
+    if batch:
+        _refresh_batch(batch, using)
+        total += len(batch)
+    # Карточки без товаров остаются только после изменений в обход ORM
+    ProductCard.objects.using(using).exclude(product__in=Product.objects.using(using).all()).delete()
+    bump_catalog_version()
+    return total
+
+
+# --- Синхронизация ---
+def _product_ids_changed(product_ids, using):
+    defer_on_commit(refresh_product_cards, product_ids, using=using)
+
+
+@receiver(post_save, sender=Product)
+def product_card_receiver(sender, instance, using=None, raw=False, **kwargs):
+    # Удаление товара удаляет и карточку (CASCADE)
+    if not raw:
+        _product_ids_changed([instance.pk], using)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=Review)
+def product_part_card_receiver(sender, instance, using=None, raw=False, **kwargs):
+    # Сводка рейтинга товара уже обновлена обработчиками Review в st.models
+    if not raw:
+        _product_ids_changed([instance.product_id], using)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_card_receiver(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    _product_ids_changed(m2m_product_ids(instance, action, pk_set, instance.products if reverse else None), using)
+
+
+@receiver(post_save, sender=Category)
+def category_card_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    if not created and not raw:
+        _product_ids_changed(instance.products.values_list('pk', flat=True), using)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted_card_receiver(sender, instance, using=None, **kwargs):
+    # Связи удаляются каскадом без m2m_changed: товары запоминаем до удаления
+    _product_ids_changed(instance.products.values_list('pk', flat=True), using)
+
+
+@receiver(post_save, sender=TechType)
+def tech_type_card_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    if not created and not raw:
+        _product_ids_changed(instance.product_set.values_list('pk', flat=True), using)
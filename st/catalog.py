@@ -0,0 +1,244 @@
+# st/catalog.py
+"""
+Фасетная фильтрация каталога.
+
+Фильтры: тип техники, категория (вместе с подкатегориями), бренд, цвет и размер варианта,
+диапазон цены и наличие на складе. Ограничения по вариантам (цвет, размер, цена, наличие)
+должны выполняться одним и тем же вариантом товара.
+
+Счетчики фасетов «дизъюнктивные»: для каждого измерения считаются товары, прошедшие все
+остальные фильтры, кроме фильтра этого измерения. Счетчик категории включает товары ее подкатегорий. Каждое измерение - один сгруппированный
+запрос, поэтому число запросов постоянно и не зависит от числа значений фасетов.
+Результат подсчета кэшируется по ключу из фильтров и версии каталога (st.versions); версия
+увеличивается при любом изменении товаров, вариантов и справочников.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Color, Product, ProductVariant, Review, Size, TechType
+from .versions import aget_version, bump_version, get_version
+
+CATALOG_VERSION_KEY = 'st:catalog:version'
+REVIEWS_VERSION_KEY = 'st:reviews:version'
+FACETS_CACHE_TIMEOUT = 60 * 60
+
+
+# --- Версия каталога ---
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+async def aget_catalog_version():
+    return await aget_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Делает недействительными все закэшированные фасеты (старые ключи просто устаревают)."""
+    bump_version(CATALOG_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=TechType)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Size)
+def catalog_changed_receiver(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed_receiver(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
+
+
+# --- Версия отзывов ---
+# Отдельно от версии каталога: отзывы меняются чаще, а фасеты от них не зависят.
+# Меняет и сводку рейтинга товаров (rating_avg, rating_count).
+def get_reviews_version():
+    return get_version(REVIEWS_VERSION_KEY)
+
+
+def bump_reviews_version():
+    """Вызывается сигналами Review; после массовых изменений без сигналов (set_moderated) - явно."""
+    bump_version(REVIEWS_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed_receiver(sender, **kwargs):
+    bump_reviews_version()
+
+
+# --- Категории ---
+def category_subtree_ids(category_id):
+    """id категории и всех ее потомков - один запрос по материализованному пути."""
+    path = Category.objects.filter(pk=category_id).values('path')
+    return list(Category.objects.filter(path__startswith=Subquery(path)).values_list('pk', flat=True))
+
+
+# --- Фильтры ---
+def _int_list(values):
+    return sorted({int(value) for value in values if value != ''})
+
+
+def _decimal_or_none(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Некорректная цена: {value}")
+
+
+class CatalogFilters:
+    """Разобранные параметры фильтрации каталога. Некорректные значения дают ValueError."""
+
+    def __init__(self, tech_types=(), category=None, brands=(), colors=(), sizes=(),
+                 price_min=None, price_max=None, in_stock=False):
+        self.tech_types = list(tech_types)
+        self.category = category
+        self.brands = list(brands)
+        self.colors = list(colors)
+        self.sizes = list(sizes)
+        self.price_min = price_min
+        self.price_max = price_max
+        self.in_stock = in_stock
+
+    @classmethod
+    def from_query_dict(cls, params):
+        category = params.get('category')
+        return cls(
+            tech_types=_int_list(params.getlist('tech_type')),
+            category=int(category) if category else None,
+            brands=sorted({brand for brand in params.getlist('brand') if brand}),
+            colors=_int_list(params.getlist('color')),
+            sizes=_int_list(params.getlist('size')),
+            price_min=_decimal_or_none(params.get('price_min')),
+            price_max=_decimal_or_none(params.get('price_max')),
+            in_stock=params.get('in_stock') in ('1', 'true', 'on'),
+        )
+
+    def cache_key(self):
+        raw = repr((self.tech_types, self.category, self.brands, self.colors, self.sizes,
+                    str(self.price_min), str(self.price_max), self.in_stock))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    @cached_property
+    def category_ids(self):
+        return category_subtree_ids(self.category) if self.category is not None else []
+
+    def variant_q(self, exclude=None, prefix=''):
+        """Условия на вариант товара (без условий измерения exclude); prefix - путь к варианту, например 'variants__'."""
+        q = Q()
+        if self.colors and exclude != 'color':
+            q &= Q(**{f'{prefix}color_id__in': self.colors})
+        if self.sizes and exclude != 'size':
+            q &= Q(**{f'{prefix}size_id__in': self.sizes})
+        if exclude != 'price':
+            if self.price_min is not None:
+                q &= Q(**{f'{prefix}price__gte': self.price_min})
+            if self.price_max is not None:
+                q &= Q(**{f'{prefix}price__lte': self.price_max})
+        if self.in_stock and exclude != 'in_stock':
+            q &= Q(**{f'{prefix}stock_quantity__gt': 0})
+        return q
+
+    def products(self, exclude=None):
+        """Активные товары, прошедшие все фильтры, кроме фильтра измерения exclude."""
+        products = Product.active_products.all()
+        if self.tech_types and exclude != 'tech_type':
+            products = products.filter(tech_type_id__in=self.tech_types)
+        if self.brands and exclude != 'brand':
+            products = products.filter(brand__in=self.brands)
+        if self.category is not None and exclude != 'category':
+            subtree = Product.categories.through.objects.filter(
+                product_id=OuterRef('pk'), category_id__in=self.category_ids
+            )
+            products = products.filter(Exists(subtree))
+        variant_q = self.variant_q(exclude)
+        if variant_q:
+            products = products.filter(Exists(ProductVariant.objects.filter(variant_q, product_id=OuterRef('pk'))))
+        return products
+
+    def variants(self, exclude=None):
+        """Варианты, удовлетворяющие вариантным условиям, у товаров, прошедших остальные фильтры."""
+        return ProductVariant.objects.filter(
+            self.variant_q(exclude), product_id__in=self.products(exclude).values('pk')
+        ).order_by()
+
+
+# --- Фасеты ---
+def _facet(rows, value_key, label_key, selected):
+    return [
+        {'value': row[value_key], 'label': row[label_key], 'count': row['n'], 'selected': row[value_key] in selected}
+        for row in rows if row[value_key] is not None
+    ]
+
+
+def compute_facets(filters):
+    """Счетчики по всем измерениям: по одному сгруппированному запросу на измерение."""
+    tech_types = (
+        filters.products('tech_type').values('tech_type_id', 'tech_type__name')
+        .annotate(n=Count('pk')).order_by('tech_type__name')
+    )
+    brands = (
+        filters.products('brand').exclude(brand__isnull=True).exclude(brand='')
+        .values('brand').annotate(n=Count('pk')).order_by('brand')
+    )
+    # Как и фильтр, счетчик категории включает товары подкатегорий; выбранная категория выводится всегда
+    present = Q(subtree_product_count__gt=0)
+    if filters.category is not None:
+        present |= Q(pk=filters.category)
+    categories = (
+        Category.objects.with_subtree_product_count(filters.products('category').values('pk'))
+        .filter(present).values('pk', 'name', n=F('subtree_product_count')).order_by('name')
+    )
+    colors = (
+        filters.variants('color').values('color_id', 'color__name')
+        .annotate(n=Count('product_id', distinct=True)).order_by('color__name')
+    )
+    sizes = (
+        filters.variants('size').values('size_id', 'size__name')
+        .annotate(n=Count('product_id', distinct=True)).order_by('size__name')
+    )
+    price = filters.variants('price').aggregate(min=Min('price'), max=Max('price'))
+    in_stock = filters.variants('in_stock').filter(stock_quantity__gt=0).aggregate(n=Count('product_id', distinct=True))
+    return {
+        'tech_type': _facet(tech_types, 'tech_type_id', 'tech_type__name', filters.tech_types),
+        'category': _facet(categories, 'pk', 'name', [filters.category]),
+        'brand': _facet(brands, 'brand', 'brand', filters.brands),
+        'color': _facet(colors, 'color_id', 'color__name', filters.colors),
+        'size': _facet(sizes, 'size_id', 'size__name', filters.sizes),
+        'price': {
+            'min': str(price['min']) if price['min'] is not None else None,
+            'max': str(price['max']) if price['max'] is not None else None,
+        },
+        'in_stock': in_stock['n'],
+    }
+
+
+def get_facets(filters):
+    """compute_facets() с кэшированием до следующего изменения каталога."""
+    key = f'st:catalog:facets:{get_catalog_version()}:{filters.cache_key()}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
+
+
+def filtered_products(filters):
+    """Страница результатов: товары с типом техники и минимальной ценой подходящих вариантов."""
+    return (
+        filters.products()
+        .select_related('tech_type')
+        .annotate(min_price=Min('variants__price', filter=filters.variant_q(prefix='variants__') or None))
+        .order_by('-created_at', 'name', 'pk')
+    )
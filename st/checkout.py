@@ -0,0 +1,140 @@
+# st/checkout.py
+"""
+Оформление заказа с атомарным списанием остатков.
+
+Все позиции списываются одним условным UPDATE: каждая строка уменьшается на свое количество
+(CASE по id), но только если остатка хватает. Если число обновленных строк меньше числа
+позиций, хотя бы одной позиции не хватило - транзакция откатывается целиком и выбрасывается
+InsufficientStockError. Блокировки строк держатся только до конца короткой транзакции
+(UPDATE, чтение цен, вставка заказа и позиций), без SELECT ... FOR UPDATE заранее,
+поэтому параллельные оформления не продают больше, чем есть на складе.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from .catalog import bump_catalog_version
+from .models import Order, OrderItem, ProductCard, ProductVariant
+from .pricing import apply_discount, get_discounts
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, shortages):
+        # {id варианта: (запрошено, доступно)}; доступно = None, если варианта нет
+        self.shortages = shortages
+        details = ', '.join(
+            f"вариант {pk}: запрошено {requested}, доступно {available if available is not None else 'нет'}"
+            for pk, (requested, available) in sorted(shortages.items())
+        )
+        super().__init__(f"Недостаточно товара на складе ({details})")
+
+
+def normalize_lines(lines):
+    """[(id варианта, количество), ...] или {id: количество} -> OrderedDict с объединенными повторами."""
+    items = lines.items() if hasattr(lines, 'items') else lines
+    quantities = OrderedDict()
+    for variant_id, quantity in items:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise CheckoutError(f"Количество должно быть положительным (вариант {variant_id})")
+        quantities[int(variant_id)] = quantities.get(int(variant_id), 0) + quantity
+    if not quantities:
+        raise CheckoutError("Заказ без позиций")
+    return quantities
+
+
+def _per_row(quantities):
+    """CASE id WHEN ... THEN количество END - количество для каждой строки одного UPDATE (ключ - pk)."""
+    return Case(
+        *(When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()),
+        output_field=IntegerField(),
+    )
+
+
+class _StockConflict(Exception):
+    """Условный UPDATE обновил не все строки: откатываем транзакцию и выясняем, чего не хватило."""
+
+
+def reserve_stock(quantities, using=None):
+    """
+    Списывает остатки всех позиций одним условным UPDATE и возвращает число списанных позиций.
+    Если оно меньше len(quantities), часть строк уже уменьшена - вызывающий должен откатить транзакцию.
+    """
+    requested = _per_row(quantities)
+    return (
+        ProductVariant.objects.using(using)
+        .filter(pk__in=quantities, stock_quantity__gte=requested)
+        .update(stock_quantity=F('stock_quantity') - requested)
+    )
+
+
+def _shortages(quantities, using=None):
+    available = dict(
+        ProductVariant.objects.using(using).filter(pk__in=quantities).values_list('pk', 'stock_quantity')
+    )
+    shortages = {
+        pk: (quantity, available.get(pk))
+        for pk, quantity in quantities.items()
+        if available.get(pk) is None or available[pk] < quantity
+    }
+    # Остаток могли пополнить сразу после отката: тогда сообщаем о всех позициях
+    return shortages or {pk: (quantity, available.get(pk)) for pk, quantity in quantities.items()}
+
+
+def place_order(lines, *, user=None, shipping_address, payment_method=Order.PAYMENT_CARD_ONLINE,
+                guest_name=None, guest_email=None, guest_phone=None, apply_promotions=True, using=None):
+    """
+    Создает заказ с позициями в одной транзакции. price_at_time - текущая цена варианта
+    (со скидкой по действующим акциям, если apply_promotions). Итог заказа считается сразу,
+    поэтому отложенный пересчет total_price не нужен.
+    Бросает InsufficientStockError (остатки при этом не меняются) или CheckoutError.
+    """
+    quantities = normalize_lines(lines)
+    using = using or router.db_for_write(Order)
+    try:
+        with transaction.atomic(using=using):
+            # Первым - запись: строки блокируются только на время этой короткой транзакции
+            if reserve_stock(quantities, using=using) != len(quantities):
+                raise _StockConflict
+            variants = {}
+            sold_out = False
+            for pk, price, product_id, stock in (
+                ProductVariant.objects.using(using).filter(pk__in=quantities)
+                .values_list('pk', 'price', 'product_id', 'stock_quantity')
+            ):
+                variants[pk] = (price, product_id)
+                sold_out = sold_out or stock == 0
+            discounts = get_discounts(product_id for _, product_id in variants.values()) if apply_promotions else {}
+            prices = {pk: apply_discount(price, discounts.get(product_id)) for pk, (price, product_id) in variants.items()}
+
+            order = Order.objects.using(using).create(
+                user=user, shipping_address=shipping_address, payment_method=payment_method,
+                guest_name=guest_name, guest_email=guest_email, guest_phone=guest_phone,
+                total_price=sum((prices[pk] * quantity for pk, quantity in quantities.items()), Decimal('0.00')),
+            )
+            # _base_manager: обычный bulk_create без отложенного пересчета итогов (итог уже верен)
+            OrderItem._base_manager.using(using).bulk_create([
+                OrderItem(order=order, variant_id=pk, quantity=quantity, price_at_time=prices[pk])
+                for pk, quantity in quantities.items()
+            ])
+            # Остаток в карточках товаров (st.cards) уменьшается тем же способом, в той же транзакции
+            sold = {}
+            for pk, quantity in quantities.items():
+                sold[variants[pk][1]] = sold.get(variants[pk][1], 0) + quantity
+            ProductCard.objects.using(using).filter(pk__in=sold).update(
+                # Устаревшая карточка не должна срывать заказ ошибкой CHECK (total_stock >= 0)
+                total_stock=Greatest(F('total_stock') - _per_row(sold), Value(0)),
+            )
+            if sold_out:
+                # Вариант закончился - меняются фасет «в наличии» и его счетчики
+                transaction.on_commit(bump_catalog_version, using=using)
+    except _StockConflict:
+        raise InsufficientStockError(_shortages(quantities, using=using))
+    return order
@@ -0,0 +1,49 @@
+# st/deferred.py
+"""
+Отложенные пересчеты «один раз на транзакцию».
+
+Сигналы отдельных объектов (например, OrderItem) только помечают ключи как «грязные».
+Все ключи, накопленные за транзакцию, передаются в callback один раз при коммите.
+Вне транзакции (autocommit) callback вызывается сразу.
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+class _PendingBatch:
+    def __init__(self, callback, using):
+        self.callback = callback
+        self.using = using
+        self.keys = set()
+
+    def flush(self):
+        keys, self.keys = self.keys, set()
+        if keys:
+            self.callback(keys, using=self.using)
+
+
+def defer_on_commit(callback, keys, using=None):
+    """
+    Накапливает keys для callback(keys, using=...) до коммита текущей транзакции.
+    Повторные вызовы в той же транзакции дополняют уже запланированную пачку.
+    Пересчет должен быть идемпотентным: ключи отмененной точки сохранения (или всей
+    транзакции) могут остаться в пачке и попасть в следующий вызов callback.
+    """
+    keys = {key for key in keys if key is not None}
+    if not keys:
+        return
+    using = using or DEFAULT_DB_ALIAS
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        callback(keys, using=using)
+        return
+
+    # Соединение принадлежит потоку: одна пачка на callback для соединения этого потока
+    batches = connection.__dict__.setdefault('_st_pending_batches', {})
+    batch = batches.get(callback)
+    if batch is None:
+        batch = batches[callback] = _PendingBatch(callback, using)
+    batch.keys.update(keys)
+    # flush ставится в очередь при каждом вызове: при откате точки сохранения Django убирает
+    # только ее callbacks, а пачку выполнит первый уцелевший flush (остальные найдут ее пустой).
+    # Так ключ не теряется, если его flush откатили, без разбора приватной очереди on_commit
+    transaction.on_commit(batch.flush, using=using)
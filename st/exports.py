@@ -0,0 +1,167 @@
+# st/exports.py
+"""
+Потоковый экспорт в CSV.
+
+Ответ формируется StreamingHttpResponse по мере чтения QuerySet пачками через iterator(chunk_size=...),
+поэтому потребление памяти не зависит от числа экспортируемых строк. Связанные данные загружаются
+prefetch_related для каждой пачки (несколько запросов на пачку, без N+1).
+"""
+import csv
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .models import Category, OrderItem, ProductSpecification, ProductVariant
+
+EXPORT_CHUNK_SIZE = 2000  # объектов на один запрос к БД
+ROWS_PER_WRITE = 500      # строк CSV в одном фрагменте ответа
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: вместо записи возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    """Генерирует CSV фрагментами по ROWS_PER_WRITE строк."""
+    writer = csv.writer(Echo())
+    buffer = [writer.writerow(header)]
+    for row in rows:
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_csv_response(filename, header, rows):
+    response = StreamingHttpResponse(iter_csv(header, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def _format_datetime(value):
+    return timezone.localtime(value).strftime("%d.%m.%Y %H:%M") if value else ""
+
+
+def _variant_description(variant):
+    parts = []
+    if variant.color:
+        parts.append(variant.color.name)
+    if variant.size:
+        parts.append(variant.size.name)
+    return ", ".join(parts)
+
+
+# --- Товары ---
+PRODUCT_EXPORT_HEADER = [
+    "ID", "Название товара", "Бренд", "Тип техники", "Активен", "Дата создания", "Сайт производителя",
+    "Средний рейтинг", "Количество оценок", "Категории", "Характеристики",
+    "Варианты (SKU: цена / остаток)",
+]
+
+
+def product_export_queryset(queryset):
+    """Готовит QuerySet товаров к экспорту: сбрасывает чужие prefetch и подгружает только нужные поля."""
+    return (
+        queryset.order_by('pk')
+        .select_related('tech_type')
+        .prefetch_related(None)
+        .prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'name').order_by('name')),
+            Prefetch('specifications', queryset=ProductSpecification.objects.only('id', 'product_id', 'name', 'value')),
+            Prefetch(
+                'variants',
+                queryset=ProductVariant.objects.only('id', 'product_id', 'sku', 'price', 'stock_quantity')
+                .order_by('price', 'sku'),
+            ),
+        )
+    )
+
+
+def iter_product_rows(queryset):
+    for product in product_export_queryset(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            product.pk,
+            product.name,
+            product.brand or "",
+            product.tech_type.name,
+            "Да" if product.is_active else "Нет",
+            _format_datetime(product.created_at),
+            product.manufacturer_url or "",
+            f"{product.rating_avg:.2f}" if product.rating_avg is not None else "",
+            product.rating_count,
+            "; ".join(category.name for category in product.categories.all()),
+            "; ".join(f"{spec.name}: {spec.value}" for spec in product.specifications.all()),
+            "; ".join(
+                f"{variant.sku}: {variant.price} / {variant.stock_quantity}" for variant in product.variants.all()
+            ),
+        ]
+
+
+def export_products_csv(queryset, filename="products.csv"):
+    return streaming_csv_response(filename, PRODUCT_EXPORT_HEADER, iter_product_rows(queryset))
+
+
+# --- Заказы ---
+ORDER_EXPORT_HEADER = [
+    "Заказ №", "Дата заказа", "Статус", "Клиент", "Email", "Телефон", "Метод оплаты", "Адрес доставки",
+    "Итоговая стоимость", "SKU", "Товар", "Вариант", "Количество", "Цена на момент покупки", "Сумма по позиции",
+]
+
+
+def order_export_queryset(queryset):
+    return (
+        queryset.order_by('pk')
+        .select_related('user')
+        .prefetch_related(None)
+        .prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related('variant__product', 'variant__color', 'variant__size')
+                .order_by('pk'),
+            ),
+        )
+    )
+
+
+def iter_order_rows(queryset):
+    """Одна строка на позицию заказа; заказ без позиций выводится одной строкой с пустыми колонками позиции."""
+    for order in order_export_queryset(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        if order.user:
+            email, phone = order.user.email, order.user.phone
+        else:
+            email, phone = order.guest_email, order.guest_phone
+        order_columns = [
+            order.pk,
+            _format_datetime(order.order_date),
+            order.get_status_display(),
+            order.get_customer_full_name(),
+            email or "",
+            phone or "",
+            order.get_payment_method_display(),
+            order.shipping_address,
+            order.total_price,
+        ]
+        items = order.items.all()
+        if not items:
+            yield order_columns + [""] * 6
+            continue
+        for item in items:
+            yield order_columns + [
+                item.variant.sku,
+                item.variant.product.name,
+                _variant_description(item.variant),
+                item.quantity,
+                item.price_at_time,
+                item.item_total_price,
+            ]
+
+
+def export_orders_csv(queryset, filename="orders.csv"):
+    return streaming_csv_response(filename, ORDER_EXPORT_HEADER, iter_order_rows(queryset))
@@ -45,4 +45,13 @@ class ProductUserForm(forms.ModelForm): # Форма для пользовате
             'instruction_manual': forms.ClearableFileInput(attrs={'class': 'form-control'}), # КРИТЕРИЙ (Часть 3): models.FileField
             'manufacturer_url': forms.URLInput(attrs={'class': 'form-control'}), # КРИТЕРИЙ (Часть 4): models.URLField()
             'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        }
\ No newline at end of file
+        }
+
+class CatalogImportForm(forms.Form):
+    """Загрузка фида каталога в админке (st/imports.py)."""
+    file = forms.FileField(label="Файл фида", help_text="CSV, JSON или JSON Lines в UTF-8; одна строка - один вариант (SKU)")
+    format = forms.ChoiceField(
+        label="Формат", required=False,
+        choices=[('', "По расширению файла"), ('csv', "CSV"), ('json', "JSON / JSON Lines")],
+    )
+    dry_run = forms.BooleanField(label="Только проверить, без изменений", required=False)
@@ -0,0 +1,430 @@
+# st/imports.py
+"""
+Потоковый импорт каталога из CSV и JSON.
+
+Строка фида - один вариант товара (SKU) вместе с полями его товара, характеристиками и категориями:
+
+    sku, name, tech_type, price, stock      - обязательные;
+    brand, description, manufacturer_url, is_active - поля товара (отсутствующие не меняются);
+    color, size                             - названия существующих цвета и размера;
+    categories                              - категории через «|» (полное название «Родитель -> Категория»
+                                              или уникальное название);
+    spec:<название>                         - характеристика (в JSON - объект specifications).
+
+JSON - массив объектов или JSON Lines (объект на строку); в JSON categories - список.
+Файл читается потоково (csv.reader, JSONDecoder.raw_decode по фрагментам), поэтому память
+не зависит от его размера.
+
+Варианты сопоставляются по SKU: существующий вариант обновляется вместе со своим товаром,
+для нового SKU товар ищется по паре (бренд, название) и создается, если не найден. Строки
+обрабатываются пачками по IMPORT_BATCH_SIZE: несколько запросов на чтение, bulk_create/bulk_update
+товаров, bulk_create(update_conflicts=True) вариантов и характеристик, bulk_create связей
+с категориями (связи только добавляются). Пачка - одна транзакция. Массовые операции не отправляют
+сигналов, поэтому карточки, поисковый индекс и кэш страниц обновляются здесь же, один раз на пачку.
+
+Ошибки проверяются по строкам: строка с ошибкой пропускается, остальные импортируются.
+"""
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, router, transaction
+
+from .cards import refresh_product_cards
+from .models import Category, Color, Product, ProductSpecification, ProductVariant, Size, TechType
+from .pagecache import bump_section_versions, touch_products
+from .search import index_products
+
+IMPORT_BATCH_SIZE = 1000
+# Импорт создает и меняет товары (включая is_active и тип техники), их связи с категориями,
+# варианты и характеристики: загрузка в админке требует прав на все эти модели
+IMPORT_PERMISSIONS = (
+    'st.add_product', 'st.change_product',
+    'st.add_productvariant', 'st.change_productvariant',
+    'st.add_productspecification', 'st.change_productspecification',
+)
+# Сколько ошибок хранится для отчета (считаются все)
+MAX_REPORTED_ERRORS = 1000
+CATEGORY_SEPARATOR = '|'
+SPEC_PREFIX = 'spec:'
+REQUIRED_COLUMNS = ('sku', 'name', 'tech_type', 'price', 'stock')
+# Поля товара, которые фид может задавать (кроме tech_type)
+PRODUCT_FIELDS = ('name', 'brand', 'description', 'manufacturer_url', 'is_active')
+JSON_READ_SIZE = 64 * 1024
+FORMATS = ('csv', 'json')
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя разобрать дальше (нет обязательных колонок, испорченный JSON)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.products_created = 0
+        self.products_updated = 0
+        self.variants_created = 0
+        self.variants_updated = 0
+        self.error_count = 0
+        self.errors = []  # (номер строки или объекта, SKU, сообщение)
+
+    def add_error(self, line, sku, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, sku, message))
+
+    def summary(self):
+        return (
+            f"строк: {self.rows}, товаров создано: {self.products_created}, обновлено: {self.products_updated}, "
+            f"вариантов создано: {self.variants_created}, обновлено: {self.variants_updated}, ошибок: {self.error_count}"
+        )
+
+
+# --- Чтение фидов ---
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'json'
+    if extension == 'csv':
+        return 'csv'
+    raise ImportFormatError(f"Не удалось определить формат файла {filename}: укажите csv или json.")
+
+
+def iter_csv_rows(f):
+    """(номер строки файла, запись) для CSV с заголовком; f - текстовый файл, открытый с newline=''."""
+    reader = csv.reader(f)
+    header = [column.strip() for column in next(reader, [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ImportFormatError(f"В заголовке CSV нет колонок: {', '.join(missing)}.")
+    for values in reader:
+        if not any(values):
+            continue
+        record = {'specifications': {}}
+        for column, value in zip(header, values):
+            value = value.strip()
+            if column.startswith(SPEC_PREFIX):
+                if value:
+                    record['specifications'][column[len(SPEC_PREFIX):].strip()] = value
+            elif column == 'categories':
+                record['categories'] = [name.strip() for name in value.split(CATEGORY_SEPARATOR) if name.strip()]
+            elif column:
+                record[column] = value
+        yield reader.line_num, record
+
+
+def iter_json_rows(f):
+    """
+    (номер объекта, запись) для JSON-массива объектов или JSON Lines. Файл читается
+    фрагментами по JSON_READ_SIZE символов, объекты разбираются по одному.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    array = None  # массив или JSON Lines - становится известно по первому значащему символу
+    number = 0
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(JSON_READ_SIZE)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (array and buffer[position] == ',')):
+            position += 1
+        if position == len(buffer):
+            if not eof:
+                fill()
+                continue
+            if array:
+                raise ImportFormatError("JSON-массив не закрыт.")
+            return
+        if array is None:
+            array = buffer[position] == '['
+            if array:
+                position += 1
+                continue
+        if array and buffer[position] == ']':
+            return
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            # Объект мог не поместиться в прочитанный фрагмент
+            if eof:
+                raise ImportFormatError(f"Ошибка JSON в объекте {number + 1}: {e.msg}.") from None
+            fill()
+            continue
+        number += 1
+        yield number, record
+
+
+def iter_feed(f, fmt):
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Неизвестный формат {fmt}: ожидается csv или json.")
+    return iter_csv_rows(f) if fmt == 'csv' else iter_json_rows(f)
+
+
+# --- Импорт ---
+class CatalogImporter:
+    """
+    Импортирует записи фида пачками. progress(result) вызывается после каждой пачки.
+    Цвета, размеры, типы техники и категории загружаются один раз: фид ссылается на них по названию.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, using=None, progress=None):
+        self.batch_size = batch_size
+        self.using = using or router.db_for_write(ProductVariant)
+        self.progress = progress
+        self.result = ImportResult()
+        self._fields = {
+            name: ProductVariant._meta.get_field(name) for name in ('sku', 'price', 'stock_quantity')
+        }
+        self._fields.update((name, Product._meta.get_field(name)) for name in PRODUCT_FIELDS)
+        self._fields.update(
+            (f'spec_{name}', ProductSpecification._meta.get_field(name)) for name in ('name', 'value')
+        )
+        self._references = None
+
+    def run(self, records):
+        batch = []
+        for line, record in records:
+            self.result.rows += 1
+            row = self._clean(line, record)
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.result
+
+    # --- Проверка строк ---
+    def _load_references(self):
+        objects = lambda model: model.objects.using(self.using)  # noqa: E731
+        categories = {}
+        names = {}
+        for pk, name, full_name in objects(Category).values_list('pk', 'name', 'full_name'):
+            categories[full_name] = pk
+            names.setdefault(name, []).append(pk)
+        for name, pks in names.items():
+            if len(pks) == 1:
+                categories.setdefault(name, pks[0])
+        return {
+            'tech_type': dict(objects(TechType).values_list('name', 'pk')),
+            'color': dict(objects(Color).values_list('name', 'pk')),
+            'size': dict(objects(Size).values_list('name', 'pk')),
+            'categories': categories,
+            'ambiguous': {name for name, pks in names.items() if len(pks) > 1},
+        }
+
+    def _clean_field(self, name, value, errors, column=None):
+        try:
+            return self._fields[name].clean(value, None)
+        except ValidationError as e:
+            errors.append(f"{column or name}: {' '.join(e.messages)}")
+
+    def _clean(self, line, record):
+        """Проверенная строка или None (ошибка записана в результат)."""
+        if not isinstance(record, dict):
+            self.result.add_error(line, '', "Ожидается объект.")
+            return None
+        if self._references is None:
+            self._references = self._load_references()
+        refs = self._references
+        record = {key: value.strip() if isinstance(value, str) else value for key, value in record.items()}
+        sku = str(record.get('sku') or '')
+        errors = []
+        row = {'line': line, 'sku': self._clean_field('sku', sku, errors)}
+        row['price'] = self._clean_field('price', record.get('price'), errors)
+        row['stock_quantity'] = self._clean_field('stock_quantity', record.get('stock'), errors, 'stock')
+        if row['price'] is not None and row['price'] < 0:
+            errors.append("price: цена не может быть отрицательной.")
+        row['product'] = {}
+        for name in PRODUCT_FIELDS:
+            if name in record:
+                value = record[name]
+                if name == 'is_active' and value == '':
+                    continue
+                if value == '' and self._fields[name].null:
+                    value = None
+                row['product'][name] = self._clean_field(name, value, errors)
+        if 'name' not in record:
+            errors.append("name: Обязательное поле.")
+
+        tech_type = record.get('tech_type')
+        row['tech_type_id'] = refs['tech_type'].get(tech_type)
+        if row['tech_type_id'] is None:
+            errors.append(f"tech_type: неизвестный тип техники «{tech_type or ''}».")
+        for name in ('color', 'size'):
+            value = record.get(name)
+            row[f'{name}_id'] = refs[name].get(value) if value else None
+            if value and row[f'{name}_id'] is None:
+                errors.append(f"{name}: «{value}» не найден.")
+
+        categories = record.get('categories') or []
+        if isinstance(categories, str):
+            categories = [name.strip() for name in categories.split(CATEGORY_SEPARATOR) if name.strip()]
+        row['category_ids'] = set()
+        for name in categories:
+            if name in refs['categories']:
+                row['category_ids'].add(refs['categories'][name])
+            elif name in refs['ambiguous']:
+                errors.append(f"categories: несколько категорий «{name}», укажите полное название.")
+            else:
+                errors.append(f"categories: категория «{name}» не найдена.")
+        specifications = record.get('specifications') or {}
+        if not isinstance(specifications, dict):
+            errors.append("specifications: ожидается объект {название: значение}.")
+            specifications = {}
+        row['specifications'] = {
+            self._clean_field('spec_name', str(name), errors, f'{SPEC_PREFIX}{name}'):
+            self._clean_field('spec_value', str(value), errors, f'{SPEC_PREFIX}{name}')
+            for name, value in specifications.items() if value not in (None, '')
+        }
+
+        if errors:
+            self.result.add_error(line, sku, '; '.join(errors))
+            return None
+        return row
+
+    # --- Запись пачки ---
+    def _flush(self, rows):
+        # Повтор SKU в пачке: действует последняя строка, как при построчной загрузке
+        rows = list({row['sku']: row for row in rows}.values())
+        try:
+            with transaction.atomic(using=self.using):
+                product_ids, spec_product_ids = self._write(rows)
+        except DatabaseError as e:
+            for row in rows:
+                self.result.add_error(row['line'], row['sku'], f"Пачка не записана: {e}")
+            return
+        if product_ids:
+            refresh_product_cards(product_ids, using=self.using)
+            index_products(product_ids, using=self.using)
+            bump_section_versions(product_ids, 'variants')
+            bump_section_versions(spec_product_ids, 'specs')
+            touch_products(product_ids, using=self.using)
+        if self.progress:
+            self.progress(self.result)
+
+    def _resolve_products(self, rows):
+        """Товар (сохраненный или новый) для каждой строки; новые товары с одной парой (бренд, название) общие."""
+        db = self.using
+        existing = {
+            sku: product_id
+            for sku, product_id in ProductVariant.objects.using(db)
+            .filter(sku__in=[row['sku'] for row in rows]).values_list('sku', 'product_id')
+        }
+        by_key = {}
+        names = {row['product']['name'] for row in rows if row['sku'] not in existing}
+        for pk, name, brand in Product.objects.using(db).filter(name__in=names).order_by('pk').values_list('pk', 'name', 'brand'):
+            by_key.setdefault((brand or '', name), pk)
+        ids = set(existing.values()) | set(by_key.values())
+        products = Product.objects.using(db).only('pk', 'tech_type', *PRODUCT_FIELDS).in_bulk(ids)
+        new = {}
+        for row in rows:
+            product_id = existing.get(row['sku'])
+            row['created'] = product_id is None
+            key = (row['product'].get('brand') or '', row['product']['name'])
+            if product_id is None:
+                product_id = by_key.get(key)
+            if product_id is not None:
+                row['product_obj'] = products[product_id]
+            else:
+                row['product_obj'] = new.setdefault(key, Product())
+        return list(new.values())
+
+    def _reject_duplicate_options(self, rows):
+        """Убирает строки, у которых (товар, цвет, размер) занят другим SKU (unique_together варианта)."""
+        saved = [row['product_obj'].pk for row in rows if row['product_obj'].pk]
+        taken = {
+            (product_id, color_id, size_id): sku
+            for product_id, color_id, size_id, sku in ProductVariant.objects.using(self.using)
+            .filter(product_id__in=saved, color__isnull=False, size__isnull=False)
+            .values_list('product_id', 'color_id', 'size_id', 'sku')
+        }
+        accepted = []
+        for row in rows:
+            if row['color_id'] is not None and row['size_id'] is not None:
+                product = row['product_obj']
+                key = (product.pk or id(product), row['color_id'], row['size_id'])
+                owner = taken.setdefault(key, row['sku'])
+                if owner != row['sku']:
+                    self.result.add_error(row['line'], row['sku'], f"Цвет и размер уже заняты вариантом {owner}.")
+                    continue
+            accepted.append(row)
+        return accepted
+
+    def _write(self, rows):
+        db = self.using
+        new_products = self._resolve_products(rows)
+        rows = self._reject_duplicate_options(rows)
+        used = {id(row['product_obj']) for row in rows}
+        new_products = [product for product in new_products if id(product) in used]
+
+        changed = {}
+        for row in rows:
+            product = row['product_obj']
+            values = {**row['product'], 'tech_type_id': row['tech_type_id']}
+            if product.pk and any(getattr(product, name) != value for name, value in values.items()):
+                changed[product.pk] = product
+            for name, value in values.items():
+                setattr(product, name, value)
+        Product.objects.using(db).bulk_create(new_products, batch_size=self.batch_size)
+        if changed:
+            Product.objects.using(db).bulk_update(
+                changed.values(), ['tech_type', *PRODUCT_FIELDS], batch_size=self.batch_size,
+            )
+
+        variants = [
+            ProductVariant(
+                product=row['product_obj'], sku=row['sku'], color_id=row['color_id'], size_id=row['size_id'],
+                price=row['price'], stock_quantity=row['stock_quantity'],
+            )
+            for row in rows
+        ]
+        # Один INSERT ... ON CONFLICT(sku) DO UPDATE на пачку; изображения вариантов не меняются
+        ProductVariant.objects.using(db).bulk_create(
+            variants, update_conflicts=True, unique_fields=['sku'],
+            update_fields=['product', 'color', 'size', 'price', 'stock_quantity'], batch_size=self.batch_size,
+        )
+
+        specifications = {}
+        links = set()
+        for row in rows:
+            product_id = row['product_obj'].pk
+            for name, value in row['specifications'].items():
+                specifications[(product_id, name)] = ProductSpecification(product_id=product_id, name=name, value=value)
+            links.update((product_id, category_id) for category_id in row['category_ids'])
+        ProductSpecification.objects.using(db).bulk_create(
+            specifications.values(), update_conflicts=True, unique_fields=['product', 'name'],
+            update_fields=['value'], batch_size=self.batch_size,
+        )
+        Through = Product.categories.through
+        Through.objects.using(db).bulk_create(
+            [Through(product_id=product_id, category_id=category_id) for product_id, category_id in links],
+            ignore_conflicts=True, batch_size=self.batch_size,
+        )
+
+        created = sum(1 for row in rows if row['created'])
+        self.result.variants_created += created
+        self.result.variants_updated += len(rows) - created
+        self.result.products_created += len(new_products)
+        self.result.products_updated += len(changed)
+        return {row['product_obj'].pk for row in rows}, {product_id for product_id, _ in specifications}
+
+
+def import_catalog(f, fmt, batch_size=IMPORT_BATCH_SIZE, using=None, progress=None, dry_run=False):
+    """
+    Импортирует фид из текстового файла f (fmt - 'csv' или 'json') и возвращает ImportResult.
+    dry_run - импорт в транзакции, которая затем откатывается (проверка файла без изменений).
+    Ошибки формата (ImportFormatError) прерывают импорт; пачки до ошибки уже записаны (кроме dry_run).
+    """
+    importer = CatalogImporter(batch_size=batch_size, using=using, progress=progress)
+    if not dry_run:
+        return importer.run(iter_feed(f, fmt))
+    with transaction.atomic(using=importer.using):
+        result = importer.run(iter_feed(f, fmt))
+        transaction.set_rollback(True, using=importer.using)
+    return result
@@ -0,0 +1,214 @@
+# st/invoices.py
+"""
+Рендеринг счетов (PDF) по заказам с кэшированием на диске.
+
+Готовый PDF хранится в MEDIA_ROOT/invoices/order_<id>/<ключ>.pdf. Ключ зависит от id заказа,
+Order.updated_at и версии шаблона/CSS, поэтому любое изменение заказа или его позиций
+(пересчет итогов обновляет updated_at) автоматически дает новый ключ, а устаревшие файлы удаляются.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Prefetch
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.template.loader import get_template, render_to_string
+
+from .models import Order, OrderItem
+
+INVOICE_TEMPLATE = 'st/order/pdf.html'
+INVOICE_STYLESHEET = 'st/css/pdf.css'
+INVOICE_CACHE_DIR = 'invoices'
+# Увеличьте при изменении логики рендеринга, не отраженной в шаблоне или CSS
+INVOICE_RENDER_VERSION = 1
+# Массовая выгрузка: заказов на одну пачку запросов и число процессов рендеринга (None - по числу CPU)
+INVOICE_BATCH_SIZE = 200
+INVOICE_PDF_WORKERS = getattr(settings, 'INVOICE_PDF_WORKERS', None)
+
+
+@lru_cache(maxsize=None)
+def invoice_stylesheet_path():
+    """Абсолютный путь к pdf.css (через staticfiles finders) или None."""
+    return finders.find(INVOICE_STYLESHEET)
+
+
+@lru_cache(maxsize=None)
+def invoice_version():
+    """Хэш шаблона счета и CSS: меняется при их правке и сбрасывает кэш PDF после перезапуска."""
+    digest = hashlib.sha1(str(INVOICE_RENDER_VERSION).encode())
+    for path in (get_template(INVOICE_TEMPLATE).origin.name, invoice_stylesheet_path()):
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def invoice_stylesheets():
+    """Разобранный WeasyPrint-стиль pdf.css; разбирается один раз на процесс."""
+    import weasyprint  # тяжелый импорт: только там, где действительно рендерим PDF
+
+    path = invoice_stylesheet_path()
+    return [weasyprint.CSS(filename=path)] if path else []
+
+
+def invoice_etag(order_id, updated_at):
+    raw = f"{order_id}:{updated_at.isoformat()}:{invoice_version()}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def invoice_cache_dir(order_id):
+    return os.path.join(settings.MEDIA_ROOT, INVOICE_CACHE_DIR, f'order_{order_id}')
+
+
+def invoice_cache_path(order_id, updated_at):
+    return os.path.join(invoice_cache_dir(order_id), f'{invoice_etag(order_id, updated_at)}.pdf')
+
+
+def render_invoice_html(order):
+    return render_to_string(INVOICE_TEMPLATE, {'order': order})
+
+
+def html_to_pdf(html):
+    import weasyprint
+
+    return weasyprint.HTML(string=html).write_pdf(stylesheets=invoice_stylesheets())
+
+
+def store_invoice(order_id, updated_at, pdf):
+    """Атомарно сохраняет PDF в кэш и удаляет устаревшие версии счета этого заказа."""
+    path = invoice_cache_path(order_id, updated_at)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and os.path.join(directory, name) != path:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def get_invoice_path(order):
+    """
+    Возвращает путь к PDF счета заказа, рендеря его только при отсутствии в кэше.
+    order должен быть загружен с user и позициями (см. invoice_queryset).
+    """
+    path = invoice_cache_path(order.pk, order.updated_at)
+    if not os.path.exists(path):
+        path = store_invoice(order.pk, order.updated_at, html_to_pdf(render_invoice_html(order)))
+    return path
+
+
+def open_invoice(order_id, updated_at):
+    """
+    Открытый файл PDF счета заказа (для FileResponse), Order.DoesNotExist - если заказа нет.
+    Файл мог быть удален между проверкой и открытием: store_invoice другой версии счета
+    удаляет остальные. Тогда счет рендерится заново, а если удален и новый файл -
+    отдается PDF из памяти.
+    """
+    try:
+        return open(invoice_cache_path(order_id, updated_at), 'rb')
+    except FileNotFoundError:
+        pass
+    order = invoice_queryset().get(id=order_id)
+    try:
+        return open(get_invoice_path(order), 'rb')
+    except FileNotFoundError:
+        return io.BytesIO(html_to_pdf(render_invoice_html(order)))
+
+
+def invoice_queryset():
+    """Заказы со всем, что нужно шаблону счета: два запроса на любое число заказов."""
+    return Order.objects.select_related('user').prefetch_related(
+        Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('variant__product', 'variant__color', 'variant__size')
+            .order_by('pk'),
+        )
+    )
+
+
+def iter_invoice_paths(order_ids, workers=INVOICE_PDF_WORKERS, batch_size=INVOICE_BATCH_SIZE):
+    """
+    Генерирует (order, путь к PDF) для заказов в порядке order_ids.
+    Заказы загружаются пачками (invoice_queryset), HTML рендерится в текущем процессе,
+    а отсутствующие в кэше PDF - параллельно в пуле процессов WeasyPrint.
+    """
+    order_ids = list(order_ids)
+    executor = None
+    try:
+        for start in range(0, len(order_ids), batch_size):
+            batch_ids = order_ids[start:start + batch_size]
+            orders = invoice_queryset().in_bulk(batch_ids)
+            orders = [orders[pk] for pk in batch_ids if pk in orders]
+            paths = {order.pk: invoice_cache_path(order.pk, order.updated_at) for order in orders}
+            missing = [order for order in orders if not os.path.exists(paths[order.pk])]
+            if len(missing) > 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                pdfs = executor.map(html_to_pdf, [render_invoice_html(order) for order in missing])
+            else:
+                pdfs = (html_to_pdf(render_invoice_html(order)) for order in missing)
+            for order, pdf in zip(missing, pdfs):
+                paths[order.pk] = store_invoice(order.pk, order.updated_at, pdf)
+            for order in orders:
+                yield order, paths[order.pk]
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+class _ZipChunks(io.RawIOBase):
+    """Несмещаемый поток для zipfile: накапливает записанные байты, чтобы отдавать их частями."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_invoices_zip(order_ids, workers=INVOICE_PDF_WORKERS):
+    """Генерирует ZIP-архив со счетами заказов по частям (для StreamingHttpResponse или записи в файл)."""
+    stream = _ZipChunks()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for order, path in iter_invoice_paths(order_ids, workers=workers):
+            try:
+                archive.write(path, arcname=f'order_{order.pk}.pdf')
+            except FileNotFoundError:
+                # Удален параллельным store_invoice (см. open_invoice)
+                archive.writestr(f'order_{order.pk}.pdf', html_to_pdf(render_invoice_html(order)))
+            yield stream.pop()
+    yield stream.pop()
+
+
+def invalidate_invoice(order_id):
+    shutil.rmtree(invoice_cache_dir(order_id), ignore_errors=True)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted_receiver(sender, instance, **kwargs):
+    invalidate_invoice(instance.pk)
@@ -0,0 +1,154 @@
+# st/management/commands/benchmark_asgi.py
+import asyncio
+import itertools
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from st.models import Product
+
+# Эндпоинт -> (URL синхронной вьюхи для WSGI, URL асинхронной вьюхи для ASGI)
+ENDPOINTS = {
+    'list': ('product_user_list', 'async_product_list'),
+    'detail': ('product_detail_view', 'async_product_detail'),
+    'search': ('product_search', 'async_product_search'),
+}
+DEFAULT_CONCURRENCY = (1, 50, 500)
+SAMPLE_PRODUCTS = 200
+
+
+def _percentiles(latencies):
+    """(p50, p95, p99) в миллисекундах."""
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение WSGI и ASGI в одном процессе: синхронные вьюхи списка, страницы товара и поиска "
+        "через django.test.Client в пуле потоков и их асинхронные версии через AsyncClient "
+        "в цикле событий. Для каждого числа одновременных соединений выводит запросы/с и p50/p95/p99."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=list(DEFAULT_CONCURRENCY),
+            help="Числа одновременных соединений (по умолчанию 1 50 500)",
+        )
+        parser.add_argument('--requests', type=int, default=1000, help="Запросов на каждый замер")
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=list(ENDPOINTS), help="Эндпоинты",
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help="DummyCache вместо кэша из настроек: каждый запрос рендерит страницу и ходит в БД",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора URL")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or min(options['concurrency']) < 1:
+            raise CommandError("--requests и --concurrency должны быть положительными.")
+        products = list(
+            Product.objects.filter(is_active=True).order_by('-pk').values_list('pk', 'name')[:SAMPLE_PRODUCTS]
+        )
+        if not products:
+            raise CommandError("Нет активных товаров: сначала выполните seed_store.")
+        words = sorted({word for _, name in products for word in name.split() if len(word) > 3}) or ['товар']
+
+        # Клиенты обращаются к хосту testserver
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['no_cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        self.stdout.write(
+            f"Запросов на замер: {options['requests']}, кэш: {'выключен' if options['no_cache'] else 'из настроек'}"
+        )
+        self.stdout.write(
+            f"{'эндпоинт':<8} {'соединений':>10} {'сервер':<6} {'запр/с':>9} {'p50, мс':>9} "
+            f"{'p95, мс':>9} {'p99, мс':>9} {'ошибок':>7}"
+        )
+        with override_settings(**overrides):
+            for endpoint in options['endpoints']:
+                rnd = random.Random(options['seed'])
+                urls = [self._url(endpoint, i, rnd, products, words) for i in range(options['requests'])]
+                for concurrency in options['concurrency']:
+                    wsgi = self._run_wsgi([sync for sync, _ in urls], concurrency)
+                    asgi = asyncio.run(self._run_asgi([url for _, url in urls], concurrency))
+                    for server, result in (('WSGI', wsgi), ('ASGI', asgi)):
+                        self._report(endpoint, concurrency, server, *result)
+        self.stdout.write(
+            "Запросы асинхронного ORM и асинхронного API локального кэша выполняются по одному в общем потоке "
+            "(sync_to_async), поэтому ASGI не ускоряет работу с SQLite: он экономит потоки на ожидании "
+            "(медленные клиенты, внешние сервисы)."
+        )
+        self.stdout.write(self.style.SUCCESS("Готово."))
+
+    def _url(self, endpoint, index, rnd, products, words):
+        sync_name, async_name = ENDPOINTS[endpoint]
+        if endpoint == 'detail':
+            pk = rnd.choice(products)[0]
+            return reverse(sync_name, args=[pk]), reverse(async_name, args=[pk])
+        query = f'?q={rnd.choice(words)}' if endpoint == 'search' else ''
+        return reverse(sync_name) + query, reverse(async_name) + query
+
+    def _run_wsgi(self, urls, concurrency):
+        """Синхронные вьюхи: concurrency потоков, у каждого свой Client и свои соединения с БД."""
+        pending = iter(urls)
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            latencies, errors = [], 0
+            try:
+                while True:
+                    with lock:
+                        url = next(pending, None)
+                    if url is None:
+                        return latencies, errors
+                    started = time.perf_counter()
+                    status = client.get(url).status_code
+                    latencies.append(time.perf_counter() - started)
+                    errors += status != 200
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = [future.result() for future in [executor.submit(worker) for _ in range(concurrency)]]
+        elapsed = time.perf_counter() - started
+        return elapsed, list(itertools.chain.from_iterable(r[0] for r in results)), sum(r[1] for r in results)
+
+    async def _run_asgi(self, urls, concurrency):
+        """Асинхронные вьюхи: concurrency задач в одном цикле событий."""
+        pending = iter(urls)
+        latencies, errors = [], 0
+
+        async def worker():
+            nonlocal errors
+            client = AsyncClient()
+            for url in pending:
+                started = time.perf_counter()
+                status = (await client.get(url)).status_code
+                latencies.append(time.perf_counter() - started)
+                errors += status != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+    def _report(self, endpoint, concurrency, server, elapsed, latencies, errors):
+        p50, p95, p99 = _percentiles(latencies)
+        rps = len(latencies) / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"{endpoint:<8} {concurrency:>10} {server:<6} {rps:>9.1f} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {errors:>7}"
+        )
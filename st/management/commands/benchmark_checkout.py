@@ -0,0 +1,142 @@
+# st/management/commands/benchmark_checkout.py
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import Sum
+
+from st.checkout import InsufficientStockError, place_order
+from st.models import Order, OrderItem, Product, ProductVariant, TechType
+
+BENCH_PREFIX = 'BENCH-CHECKOUT'
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочная проверка оформления заказов: несколько потоков одновременно покупают "
+        "одни и те же варианты. Выводит пропускную способность и проверяет, что проданное "
+        "количество совпадает со списанным остатком и остатки не ушли в минус."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Число потоков")
+        parser.add_argument('--orders', type=int, default=200, help="Попыток оформления на поток")
+        parser.add_argument('--variants', type=int, default=5, help="Число вариантов, за которые идет конкуренция")
+        parser.add_argument('--stock', type=int, default=100, help="Начальный остаток каждого варианта")
+        parser.add_argument('--max-lines', type=int, default=3, help="Максимум позиций в заказе")
+        parser.add_argument('--max-quantity', type=int, default=3, help="Максимум штук в позиции")
+        parser.add_argument('--retries', type=int, default=10, help="Повторов при «database is locked»")
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора")
+        parser.add_argument('--keep', action='store_true', help="Не удалять созданные товары и заказы")
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['variants'] < 1 or options['max_lines'] < 1:
+            raise CommandError("--threads, --variants и --max-lines должны быть положительными.")
+
+        variant_ids = self._create_variants(options['variants'], options['stock'])
+        stats = {'placed': 0, 'rejected': 0, 'locked': 0, 'errors': []}
+        order_ids = []
+        lock = threading.Lock()
+
+        def worker(index):
+            rnd = random.Random(options['seed'] * 1000 + index)
+            local = {'placed': 0, 'rejected': 0, 'locked': 0}
+            local_orders = []
+            try:
+                for _ in range(options['orders']):
+                    lines = [
+                        (variant_id, rnd.randint(1, options['max_quantity']))
+                        for variant_id in rnd.sample(variant_ids, min(rnd.randint(1, options['max_lines']), len(variant_ids)))
+                    ]
+                    for attempt in range(options['retries'] + 1):
+                        try:
+                            order = place_order(lines, shipping_address=f'{BENCH_PREFIX} поток {index}')
+                        except InsufficientStockError:
+                            local['rejected'] += 1
+                        except OperationalError as e:
+                            # SQLite допускает одного писателя: ждем и повторяем всю транзакцию
+                            if 'locked' not in str(e) or attempt == options['retries']:
+                                raise
+                            local['locked'] += 1
+                            time.sleep(0.001 * 2 ** min(attempt, 6))
+                            continue
+                        else:
+                            local['placed'] += 1
+                            local_orders.append(order.pk)
+                        break
+            except Exception as e:
+                with lock:
+                    stats['errors'].append(f"поток {index}: {e!r}")
+            finally:
+                connections.close_all()
+                with lock:
+                    for key, value in local.items():
+                        stats[key] += value
+                    order_ids.extend(local_orders)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            self._report(options, variant_ids, order_ids, stats, elapsed)
+        finally:
+            if not options['keep']:
+                self._cleanup(variant_ids)
+
+    def _create_variants(self, count, stock):
+        suffix = f'{time.time_ns():x}'
+        tech_type, _ = TechType.objects.get_or_create(name=f'{BENCH_PREFIX}')
+        product = Product.objects.create(
+            name=f'{BENCH_PREFIX} {suffix}', brand='Bench', description='Нагрузочный тест', tech_type=tech_type,
+        )
+        variants = ProductVariant.objects.bulk_create(
+            ProductVariant(product=product, price=Decimal('100.00'),
+                           stock_quantity=stock, sku=f'{BENCH_PREFIX}-{suffix}-{i}')
+            for i in range(count)
+        )
+        return [variant.pk for variant in variants]
+
+    def _report(self, options, variant_ids, order_ids, stats, elapsed):
+        attempts = stats['placed'] + stats['rejected']
+        self.stdout.write(
+            f"Потоков: {options['threads']}, попыток: {attempts}, заказов: {stats['placed']}, "
+            f"отказов по остаткам: {stats['rejected']}, повторов из-за блокировок: {stats['locked']}"
+        )
+        self.stdout.write(
+            f"Время: {elapsed:.2f} с, {attempts / elapsed:.1f} попыток/с, {stats['placed'] / elapsed:.1f} заказов/с"
+        )
+        for error in stats['errors']:
+            self.stderr.write(error)
+
+        initial = options['stock'] * len(variant_ids)
+        remaining = ProductVariant.objects.filter(pk__in=variant_ids).aggregate(total=Sum('stock_quantity'))['total'] or 0
+        sold = OrderItem.objects.filter(variant_id__in=variant_ids).aggregate(total=Sum('quantity'))['total'] or 0
+        negative = ProductVariant.objects.filter(pk__in=variant_ids, stock_quantity__lt=0).count()
+        orders_in_db = Order.objects.filter(pk__in=order_ids).count()
+        self.stdout.write(f"Остаток: было {initial}, стало {remaining}, продано {sold}")
+
+        problems = []
+        if initial - remaining != sold:
+            problems.append(f"списано {initial - remaining}, а продано {sold}")
+        if negative:
+            problems.append(f"отрицательный остаток у {negative} вариантов")
+        if orders_in_db != stats['placed']:
+            problems.append(f"в БД {orders_in_db} заказов из {stats['placed']} оформленных")
+        if stats['errors']:
+            problems.append(f"ошибок в потоках: {len(stats['errors'])}")
+        if problems:
+            raise CommandError("Нарушена согласованность: " + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS("Готово. Перепродаж нет, остатки согласованы."))
+
+    def _cleanup(self, variant_ids):
+        Order.objects.filter(items__variant_id__in=variant_ids).distinct().delete()
+        Product.objects.filter(variants__pk__in=variant_ids).distinct().delete()
+        TechType.objects.filter(name=BENCH_PREFIX, product__isnull=True).delete()
@@ -0,0 +1,152 @@
+# st/management/commands/benchmark_sqlite.py
+import copy
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from st.models import Product, ProductCard, ProductVariant
+
+from .benchmark_asgi import _percentiles
+
+# Режим -> описание; 'default' - SQLite и Django без настроек, 'tuned' - DATABASES['default'] из настроек
+MODES = {
+    'default': "журнал DELETE, BEGIN DEFERRED, соединение на запрос",
+    'tuned': "настройки DATABASES['default'] (WAL, PRAGMA, BEGIN IMMEDIATE) и CONN_MAX_AGE воркера WSGI",
+}
+# Потоки нагрузки живут, как потоки воркера WSGI: CONN_MAX_AGE по умолчанию из iat/wsgi.py
+WSGI_CONN_MAX_AGE = 600
+PAGE_SIZE = 24
+SAMPLE_VARIANTS = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Смешанная нагрузка чтения и записи на SQLite из нескольких потоков: чтение страниц списка "
+        "(ProductCard) и вариантов товара, запись - правка остатка варианта в транзакции, как в админке. "
+        "Каждый режим работает с отдельной копией базы; выводит операции/с, задержки и ошибки «database is locked»."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Число потоков (одновременных запросов)")
+        parser.add_argument('--operations', type=int, default=300, help="Операций на поток")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Доля операций записи (0..1)")
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES), help="Режимы")
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора")
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['operations'] < 1 or not 0 <= options['write_ratio'] <= 1:
+            raise CommandError("--threads и --operations должны быть положительными, --write-ratio - от 0 до 1.")
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if database['ENGINE'] != 'django.db.backends.sqlite3' or connections[DEFAULT_DB_ALIAS].is_in_memory_db():
+            raise CommandError("Нужна файловая база SQLite.")
+        variant_ids = list(ProductVariant.objects.order_by('-pk').values_list('pk', flat=True)[:SAMPLE_VARIANTS])
+        product_ids = list(Product.objects.order_by('-pk').values_list('pk', flat=True)[:SAMPLE_VARIANTS])
+        pages = max(1, ProductCard.objects.filter(is_active=True).count() // PAGE_SIZE)
+        if not variant_ids:
+            raise CommandError("Нет вариантов товаров: сначала выполните seed_store.")
+
+        self.stdout.write(
+            f"Потоков: {options['threads']}, операций на поток: {options['operations']}, "
+            f"доля записи: {options['write_ratio']:.0%}"
+        )
+        self.stdout.write(
+            f"{'режим':<8} {'опер/с':>8} {'чтение p50/p99, мс':>19} {'запись p50/p99, мс':>19} {'ошибок':>7}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in options['modes']:
+                alias = f'benchmark_{mode}'
+                self._register(alias, mode, os.path.join(directory, f'{mode}.sqlite3'), database)
+                try:
+                    result = self._run(alias, options, variant_ids, product_ids, pages)
+                finally:
+                    del connections.settings[alias]
+                self._report(mode, *result)
+        for mode in options['modes']:
+            self.stdout.write(f"  {mode}: {MODES[mode]}")
+        self.stdout.write(self.style.SUCCESS("Готово."))
+
+    def _register(self, alias, mode, path, database):
+        """Копирует базу в path и добавляет в connections алиас с настройками режима."""
+        with sqlite3.connect(database['NAME']) as source, sqlite3.connect(path) as target:
+            source.backup(target)
+            # Режим журнала хранится в файле: копия рабочей базы в WAL должна начать с DELETE
+            target.execute('PRAGMA journal_mode=DELETE')
+        source.close()
+        target.close()
+        settings_dict = copy.deepcopy(database)
+        settings_dict['NAME'] = path
+        if mode == 'default':
+            settings_dict.update(OPTIONS={}, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        elif not settings_dict.get('CONN_MAX_AGE'):
+            settings_dict['CONN_MAX_AGE'] = WSGI_CONN_MAX_AGE
+        # Заполняет недостающие ключи (TEST, TIME_ZONE и т. д.) так же, как для DATABASES
+        configured = connections.configure_settings({DEFAULT_DB_ALIAS: copy.deepcopy(database), alias: settings_dict})
+        connections.settings[alias] = configured[alias]
+
+    def _run(self, alias, options, variant_ids, product_ids, pages):
+        lock = threading.Lock()
+        reads, writes, errors = [], [], [0]
+
+        def worker(index):
+            rnd = random.Random(options['seed'] * 1000 + index)
+            local_reads, local_writes, local_errors = [], [], 0
+            try:
+                for _ in range(options['operations']):
+                    is_write = rnd.random() < options['write_ratio']
+                    started = time.perf_counter()
+                    try:
+                        if is_write:
+                            self._write(alias, rnd.choice(variant_ids))
+                        else:
+                            self._read(alias, rnd.randrange(pages), rnd.choice(product_ids))
+                    except OperationalError:
+                        # «database is locked»: запрос завершился бы ошибкой 500
+                        local_errors += 1
+                    else:
+                        (local_writes if is_write else local_reads).append(time.perf_counter() - started)
+                    # Как по сигналу request_finished: закрыть соединение, если CONN_MAX_AGE истек (0 - всегда)
+                    connections[alias].close_if_unusable_or_obsolete()
+            finally:
+                connections[alias].close()
+                with lock:
+                    reads.extend(local_reads)
+                    writes.extend(local_writes)
+                    errors[0] += local_errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            for future in [executor.submit(worker, index) for index in range(options['threads'])]:
+                future.result()
+        return time.perf_counter() - started, reads, writes, errors[0]
+
+    def _read(self, alias, page, product_id):
+        """Страница списка и варианты товара - запросы страниц каталога без кэша."""
+        cards = ProductCard.objects.using(alias).filter(is_active=True).order_by('-created_at', '-pk')
+        list(cards[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+        list(ProductVariant.objects.using(alias).filter(product_id=product_id).select_related('color', 'size'))
+
+    def _write(self, alias, variant_id):
+        """Правка из админки: транзакция сначала читает вариант, затем пишет вариант и товар."""
+        with transaction.atomic(using=alias):
+            variant = ProductVariant.objects.using(alias).only('product_id', 'stock_quantity').get(pk=variant_id)
+            ProductVariant.objects.using(alias).filter(pk=variant_id).update(stock_quantity=F('stock_quantity') + 1)
+            Product.objects.using(alias).filter(pk=variant.product_id).update(updated_at=timezone.now())
+
+    def _report(self, mode, elapsed, reads, writes, errors):
+        read_p50, _, read_p99 = _percentiles(reads)
+        write_p50, _, write_p99 = _percentiles(writes)
+        ops = (len(reads) + len(writes)) / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"{mode:<8} {ops:>8.1f} {f'{read_p50:.2f} / {read_p99:.2f}':>19} "
+            f"{f'{write_p50:.2f} / {write_p99:.2f}':>19} {errors:>7}"
+        )
@@ -0,0 +1,46 @@
+# st/management/commands/export_invoices.py
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from st.invoices import iter_invoices_zip
+from st.models import Order
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Некорректная дата '{value}', ожидается формат ГГГГ-ММ-ДД")
+
+
+class Command(BaseCommand):
+    help = "Формирует ZIP-архив со счетами (PDF) заказов за период или по списку номеров, рендеря PDF параллельно."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Путь к создаваемому ZIP-файлу")
+        parser.add_argument('--from', dest='date_from', help="Начальная дата заказа (ГГГГ-ММ-ДД), включительно")
+        parser.add_argument('--to', dest='date_to', help="Конечная дата заказа (ГГГГ-ММ-ДД), включительно")
+        parser.add_argument('--order', type=int, action='append', dest='order_ids', help="Номер заказа (можно повторять)")
+        parser.add_argument('--workers', type=int, default=None, help="Число процессов рендеринга (по умолчанию - по числу CPU)")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['order_ids']:
+            orders = orders.filter(pk__in=options['order_ids'])
+        tz = timezone.get_current_timezone()
+        if options['date_from']:
+            start = datetime.datetime.combine(_parse_date(options['date_from']), datetime.time.min, tzinfo=tz)
+            orders = orders.filter(order_date__gte=start)
+        if options['date_to']:
+            end = datetime.datetime.combine(_parse_date(options['date_to']) + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+            orders = orders.filter(order_date__lt=end)
+        if not (options['order_ids'] or options['date_from'] or options['date_to']):
+            raise CommandError("Укажите период (--from/--to) или номера заказов (--order).")
+
+        order_ids = list(orders.order_by('pk').values_list('pk', flat=True))
+        with open(options['output'], 'wb') as f:
+            for chunk in iter_invoices_zip(order_ids, workers=options['workers']):
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Готово. Счетов в архиве: {len(order_ids)} -> {options['output']}"))
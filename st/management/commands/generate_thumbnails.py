@@ -0,0 +1,22 @@
+# st/management/commands/generate_thumbnails.py
+from django.core.management.base import BaseCommand
+
+from st.thumbnails import THUMBNAIL_BATCH_SIZE, backfill_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Создает WebP- и JPEG-миниатюры изображений вариантов товаров, рендеря их параллельно."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Число процессов рендеринга (по умолчанию - по числу CPU)")
+        parser.add_argument('--batch-size', type=int, default=THUMBNAIL_BATCH_SIZE, help="Размер пачки изображений")
+        parser.add_argument('--all', action='store_true', dest='check_all',
+                            help="Проверить все варианты с изображением и досоздать недостающие файлы, а не только новые")
+
+    def handle(self, *args, **options):
+        total, failed = backfill_thumbnails(
+            workers=options['workers'], batch_size=options['batch_size'], check_all=options['check_all'],
+        )
+        if failed:
+            self.stderr.write(self.style.WARNING(f"Не удалось обработать изображений: {failed} (подробности в логе)"))
+        self.stdout.write(self.style.SUCCESS(f"Готово. Обработано вариантов: {total}"))
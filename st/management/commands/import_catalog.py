@@ -0,0 +1,52 @@
+# st/management/commands/import_catalog.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from st.imports import FORMATS, IMPORT_BATCH_SIZE, ImportFormatError, detect_format, import_catalog
+
+# Строк между сообщениями о ходе импорта (при --verbosity 2 - после каждой пачки)
+PROGRESS_EVERY = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует товары, варианты, характеристики и категории из CSV или JSON (см. st/imports.py). "
+        "Варианты сопоставляются по SKU; файл читается потоково и записывается пачками."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл фида (.csv, .json или .jsonl)")
+        parser.add_argument('--format', choices=FORMATS, help="Формат файла (по умолчанию - по расширению)")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Кодировка файла")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Строк в пачке (одна транзакция)")
+        parser.add_argument('--dry-run', action='store_true', help="Проверить файл и откатить изменения")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size должен быть положительным.")
+        started = time.perf_counter()
+        reported = [0]
+
+        def progress(result):
+            if options['verbosity'] > 1 or result.rows // PROGRESS_EVERY > reported[0]:
+                reported[0] = result.rows // PROGRESS_EVERY
+                self.stdout.write(f"{result.summary()} ({time.perf_counter() - started:.1f} с)")
+
+        try:
+            fmt = options['format'] or detect_format(options['path'])
+            with open(options['path'], encoding=options['encoding'], newline='') as f:
+                result = import_catalog(
+                    f, fmt, batch_size=options['batch_size'], progress=progress, dry_run=options['dry_run'],
+                )
+        except (ImportFormatError, OSError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        for line, sku, message in result.errors:
+            self.stderr.write(f"Строка {line} ({sku or 'без SKU'}): {message}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... и еще ошибок: {result.error_count - len(result.errors)}")
+        prefix = "Проверка без изменений" if options['dry_run'] else "Готово"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}. {result.summary()}; {time.perf_counter() - started:.1f} с"
+        ))
@@ -0,0 +1,12 @@
+# st/management/commands/rebuild_category_tree.py
+from django.core.management.base import BaseCommand
+
+from st.models import Category
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает материализованные пути (path, depth, full_name) дерева категорий."
+
+    def handle(self, *args, **options):
+        fixed = Category.objects.rebuild_tree()
+        self.stdout.write(self.style.SUCCESS(f"Готово. Исправлено категорий: {fixed}"))
@@ -0,0 +1,21 @@
+# st/management/commands/rebuild_product_cards.py
+from django.core.management.base import BaseCommand
+
+from st.cards import CARD_BATCH_SIZE, rebuild_product_cards, refresh_product_cards
+
+
+class Command(BaseCommand):
+    help = "Перестраивает карточки товаров (денормализованную read-модель списков) пачками."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CARD_BATCH_SIZE, help="Размер пачки товаров")
+        parser.add_argument('--product', type=int, action='append', dest='product_ids',
+                            help="Пересчитать только карточку указанного товара (можно повторять)")
+
+    def handle(self, *args, **options):
+        if options['product_ids']:
+            refresh_product_cards(options['product_ids'])
+            total = len(set(options['product_ids']))
+        else:
+            total = rebuild_product_cards(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Готово. Пересчитано карточек товаров: {total}"))
@@ -0,0 +1,20 @@
+# st/management/commands/rebuild_rating_summaries.py
+from django.core.management.base import BaseCommand
+
+from st.models import Product
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованную сводку рейтинга товаров и исправляет расхождения с отзывами."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Размер пачки товаров (по умолчанию 1000)")
+        parser.add_argument('--product', type=int, action='append', dest='product_ids',
+                            help="Пересчитать только указанный товар (можно повторять)")
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+        fixed = products.rebuild_rating_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Готово. Исправлена сводка рейтинга у {fixed} товаров."))
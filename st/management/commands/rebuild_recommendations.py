@@ -0,0 +1,21 @@
+# st/management/commands/rebuild_recommendations.py
+from django.core.management.base import BaseCommand
+
+from st.recommendations import rebuild_recommendations, update_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает рекомендации «часто покупают вместе» по всем заказам. С --incremental только "
+        "учитывает заказы, которые еще не вошли в счетчики (например, после массовой загрузки заказов)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help="Учесть только новые заказы")
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            orders, products = update_recommendations()
+        else:
+            orders, products = rebuild_recommendations()
+        self.stdout.write(self.style.SUCCESS(f"Готово. Заказов: {orders}, товаров в заказах: {products}"))
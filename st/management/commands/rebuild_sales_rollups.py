@@ -0,0 +1,29 @@
+# st/management/commands/rebuild_sales_rollups.py
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from st.analytics import rebuild_sales_rollups
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Некорректная дата '{value}', ожидается формат ГГГГ-ММ-ДД")
+
+
+class Command(BaseCommand):
+    help = "Перестраивает сводки продаж по дням (дашборд продаж) за период или за всю историю заказов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="Начальный день (ГГГГ-ММ-ДД), включительно")
+        parser.add_argument('--to', dest='date_to', help="Конечный день (ГГГГ-ММ-ДД), включительно")
+
+    def handle(self, *args, **options):
+        date_from = _parse_date(options['date_from']) if options['date_from'] else None
+        date_to = _parse_date(options['date_to']) if options['date_to'] else None
+        if date_from and date_to and date_from > date_to:
+            raise CommandError("Начальный день позже конечного.")
+        total = rebuild_sales_rollups(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(f"Готово. Пересчитано дней: {total}"))
@@ -0,0 +1,18 @@
+# st/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from st.search import INDEX_BATCH_SIZE, rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = "Полностью перестраивает полнотекстовый индекс товаров (SQLite FTS5)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=INDEX_BATCH_SIZE, help="Размер пачки товаров")
+
+    def handle(self, *args, **options):
+        if not search_available():
+            self.stdout.write(self.style.WARNING("Текущая БД не SQLite: полнотекстовый индекс не используется."))
+            return
+        total = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Готово. Проиндексировано товаров: {total}"))
@@ -0,0 +1,65 @@
+# st/management/commands/seed_store.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from st.analytics import rebuild_sales_rollups
+from st.cards import rebuild_product_cards
+from st.catalog import bump_catalog_version
+from st.search import rebuild_search_index, search_available
+from st.seeding import StoreSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует детерминированный синтетический каталог, пользователей, отзывы и заказы "
+        "заданного объема (bulk_create пачками, без сигналов) для нагрузочного тестирования."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Число товаров")
+        parser.add_argument('--variants-per-product', type=int, default=5, help="Вариантов на товар (не больше 48)")
+        parser.add_argument('--reviews', type=int, default=10000, help="Число отзывов всего")
+        parser.add_argument('--users', type=int, default=1000, help="Число пользователей")
+        parser.add_argument('--favorites', type=int, default=5000, help="Число записей «Избранное» всего")
+        parser.add_argument('--orders', type=int, default=2000, help="Число заказов")
+        parser.add_argument('--items-per-order', type=int, default=3, help="Среднее число позиций в заказе")
+        parser.add_argument('--categories', type=int, default=30, help="Число категорий")
+        parser.add_argument('--promos', type=int, default=10, help="Число промоакций")
+        parser.add_argument('--products-per-promo', type=int, default=100, help="Товаров в промоакции")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Строк на пачку bulk_create (и на транзакцию)")
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора; повторный запуск с тем же зерном запрещен")
+        parser.add_argument('--skip-search-index', action='store_true', help="Не перестраивать поисковый индекс в конце")
+
+    def handle(self, *args, **options):
+        seeder = StoreSeeder(
+            products=options['products'], variants_per_product=options['variants_per_product'],
+            reviews=options['reviews'], users=options['users'], favorites=options['favorites'],
+            orders=options['orders'], items_per_order=options['items_per_order'],
+            categories=options['categories'], promos=options['promos'],
+            products_per_promo=options['products_per_promo'], batch_size=options['batch_size'],
+            seed=options['seed'], log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None,
+        )
+        if seeder.check_conflicts():
+            raise CommandError(f"Данные с зерном {options['seed']} уже сгенерированы: укажите другое --seed.")
+
+        started = time.monotonic()
+        try:
+            created = seeder.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Производные данные, которые не поддерживаются по построению
+        if not options['skip_search_index'] and search_available():
+            self.stdout.write("Перестраиваем поисковый индекс...")
+            rebuild_search_index()
+        self.stdout.write("Перестраиваем карточки товаров...")
+        rebuild_product_cards()
+        self.stdout.write("Перестраиваем сводки продаж...")
+        rebuild_sales_rollups()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.monotonic() - started:.1f} с. Пользователей: {created['users']}, "
+            f"товаров: {created['products']}, вариантов: {created['variants']}."
+        ))
@@ -0,0 +1,32 @@
+# st/management/commands/sync_replicas.py
+import sqlite3
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from st.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в файлы реплик из ST_DB_REPLICAS (DJANGO_DB_REPLICAS) через "
+        "backup API: локальная замена репликации для проверки st/routers.py."
+    )
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError("Реплики не настроены: задайте DJANGO_DB_REPLICAS.")
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("Команда копирует только базы SQLite.")
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            # Открытое соединение реплики не увидит замену схемы
+            replica.close()
+            with closing(sqlite3.connect(replica.settings_dict['NAME'])) as target:
+                primary.connection.backup(target)
+            self.stdout.write(f"{alias}: {replica.settings_dict['NAME']}")
+        self.stdout.write(self.style.SUCCESS(f"Готово. Обновлено реплик: {len(replicas)}"))
@@ -0,0 +1,199 @@
+# st/metrics.py
+"""
+Метрики процесса в памяти и их вывод в текстовом формате Prometheus.
+
+Каждый процесс (воркер) копит свои значения; Prometheus собирает их с каждого воркера
+отдельно или через балансировщик. Запись - O(число корзин) под одной блокировкой,
+поэтому метрики можно держать включенными в продакшене.
+"""
+import bisect
+import threading
+
+# Корзины гистограмм: длительности в секундах и число SQL-запросов на запрос
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def samples(self):
+        for labels, value in self.items():
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (без накопления) + корзина +Inf, сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, [list(state[0]), state[1], state[2]]) for labels, state in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, [('le', _format_number(bound))])
+                yield f'{self.name}_bucket{le} {cumulative}'
+            plain = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{plain} {_format_number(total)}'
+            yield f'{self.name}_count{plain} {count}'
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class CallbackGauge:
+    """Gauge, значения которого вычисляются при выводе: callback() -> {метки: значение}."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        for labels, value in sorted(self.callback().items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+
+    def reset(self):
+        pass
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name, documentation, labelnames, callback):
+        return self._register(CallbackGauge(name, documentation, labelnames, callback))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (exposition format 0.0.4)."""
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+registry = Registry()
+
+# --- Метрики запросов (заполняются st.middleware.PerformanceMiddleware) ---
+REQUESTS_TOTAL = registry.counter(
+    'st_http_requests_total', "Число обработанных HTTP-запросов.", ('view', 'method', 'status'),
+)
+REQUEST_DURATION = registry.histogram(
+    'st_http_request_duration_seconds', "Полное время обработки запроса.", ('view',),
+)
+DB_QUERIES = registry.histogram(
+    'st_db_queries_per_request', "Число SQL-запросов на HTTP-запрос.", ('view',), buckets=QUERY_COUNT_BUCKETS,
+)
+DB_DURATION = registry.histogram(
+    'st_db_duration_seconds', "Суммарное время SQL-запросов на HTTP-запрос.", ('view',),
+)
+TEMPLATE_DURATION = registry.histogram(
+    'st_template_render_duration_seconds', "Время рендеринга TemplateResponse.", ('view',),
+)
+
+# --- Кэш страниц и фрагментов (заполняется st.pagecache) ---
+CACHE_REQUESTS = registry.counter(
+    'st_cache_requests_total', "Обращения к кэшу страниц и фрагментов.", ('cache', 'result'),
+)
+
+
+def cache_hit_ratios():
+    """{(имя кэша,): доля попаданий} по накопленным CACHE_REQUESTS."""
+    totals = {}
+    for (name, result), value in CACHE_REQUESTS.items():
+        hits, total = totals.get(name, (0, 0))
+        totals[name] = (hits + (value if result == 'hit' else 0), total + value)
+    return {(name,): hits / total for name, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO = registry.callback_gauge(
+    'st_cache_hit_ratio', "Доля попаданий в кэш страниц и фрагментов с запуска процесса.", ('cache',), cache_hit_ratios,
+)
@@ -0,0 +1,169 @@
+# st/middleware.py
+"""
+Инструментирование запросов: число и время SQL-запросов, время рендеринга шаблонов
+и полное время обработки по имени URL (resolver_match.view_name, например
+'product_detail_view' или 'admin:st_order_changelist').
+
+Значения отдаются клиенту в заголовке Server-Timing и копятся в гистограммах st.metrics,
+которые выводит staff-эндпоинт metrics/. Время SQL считается через execute_wrapper
+соединений, время шаблона - для TemplateResponse (от начала render() до post-render callback).
+
+Счетчик текущего запроса хранится в contextvar, а обертка ставится на каждое соединение один раз
+при его открытии (connection_created; модуль импортируется в StConfig.ready()). Асинхронный ORM
+выполняет запросы в другом потоке и через другие объекты соединений, но с копией контекста запроса.
+
+PrimaryPinningMiddleware - read-your-writes для реплик базы (st/routers.py).
+"""
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics, routers
+
+UNRESOLVED_VIEW = '<unresolved>'
+# Cookie клиента, который недавно писал в каталог: его чтение идет на основную базу
+PRIMARY_PIN_COOKIE = 'st_primary'
+
+
+class _QueryTimer:
+    """execute_wrapper: считает запросы и их суммарное время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+_current_timer = contextvars.ContextVar('st_query_timer', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def connection_created_receiver(sender, connection, **kwargs):
+    # Обертка остается у объекта соединения и после переподключения
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+class PerformanceMiddleware:
+    # Под ASGI цепочка middleware остается асинхронной: асинхронные вьюхи не переключаются в поток
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'ST_SERVER_TIMING_HEADER', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, timer, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self._finish(request, response, started, timer)
+
+    async def __acall__(self, request):
+        started, timer, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self._finish(request, response, started, timer)
+
+    def _start(self, request):
+        started = time.perf_counter()
+        request._st_template_duration = 0.0
+        timer = _QueryTimer()
+        return started, timer, _current_timer.set(timer)
+
+    def _finish(self, request, response, started, timer):
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else UNRESOLVED_VIEW
+        template = request._st_template_duration
+        metrics.REQUESTS_TOTAL.inc(view, request.method, str(response.status_code))
+        metrics.REQUEST_DURATION.observe(total, view)
+        metrics.DB_QUERIES.observe(timer.count, view)
+        metrics.DB_DURATION.observe(timer.duration, view)
+        if template:
+            metrics.TEMPLATE_DURATION.observe(template, view)
+
+        if self.server_timing:
+            entries = [f'db;dur={timer.duration * 1000:.2f};desc="{timer.count} queries"']
+            if template:
+                entries.append(f'tpl;dur={template * 1000:.2f}')
+            entries.append(f'total;dur={total * 1000:.2f}')
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = ', '.join(([existing] if existing else []) + entries)
+        return response
+
+    def process_template_response(self, request, response):
+        # Вызывается непосредственно перед render(); конец рендеринга отмечает post-render callback
+        render_started = time.perf_counter()
+
+        def rendered(response):
+            request._st_template_duration += time.perf_counter() - render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class PrimaryPinningMiddleware:
+    """
+    После запроса, записавшего каталог, ставит cookie на ST_DB_REPLICA_LAG секунд; пока она есть,
+    PrimaryReplicaRouter читает каталог из основной базы, а не с отстающей реплики.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.start_request(pinned=PRIMARY_PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        return self._finish(response, wrote)
+
+    async def __acall__(self, request):
+        token = routers.start_request(pinned=PRIMARY_PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        return self._finish(response, wrote)
+
+    def _finish(self, response, wrote):
+        if wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=routers.get_replica_lag(), httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:27
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_summaries(apps, schema_editor):
+    Product = apps.get_model('st', 'Product')
+    Review = apps.get_model('st', 'Review')
+    histograms = {}
+    rows = (
+        Review.objects.filter(is_moderated=True, rating__in=[1, 2, 3, 4, 5])
+        .values('product_id', 'rating')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        histograms.setdefault(row['product_id'], {})[row['rating']] = row['n']
+    products = []
+    for product in Product.objects.filter(pk__in=histograms):
+        histogram = histograms[product.pk]
+        for star in range(1, 6):
+            setattr(product, f'rating_{star}', histogram.get(star, 0))
+        product.rating_count = sum(histogram.values())
+        product.rating_avg = sum(star * n for star, n in histogram.items()) / product.rating_count
+        products.append(product)
+    Product.objects.bulk_update(
+        products,
+        ['rating_avg', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0004_alter_order_total_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «1»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «2»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «3»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «4»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок «5»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.RunPython(fill_rating_summaries, migrations.RunPython.noop),
+    ]
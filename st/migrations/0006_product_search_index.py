@@ -0,0 +1,48 @@
+# Полнотекстовый индекс товаров (SQLite FTS5), см. st/search.py
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS st_product_fts USING fts5("
+        "name, brand, description, specs, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    Product = apps.get_model('st', 'Product')
+    ProductSpecification = apps.get_model('st', 'ProductSpecification')
+    specs = {}
+    for product_id, name, value in ProductSpecification.objects.order_by('product_id', 'name').values_list('product_id', 'name', 'value'):
+        specs.setdefault(product_id, []).append(f'{name}: {value}')
+
+    def normalize(text):
+        return (text or '').lower().replace('ё', 'е')
+
+    rows = [
+        (pk, normalize(name), normalize(brand), normalize(description), normalize('\n'.join(specs.get(pk, []))))
+        for pk, name, brand, description in Product.objects.values_list('pk', 'name', 'brand', 'description').iterator()
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO st_product_fts (rowid, name, brand, description, specs) VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS st_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0005_product_rating_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
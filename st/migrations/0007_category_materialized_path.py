@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:33
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('st', 'Category')
+    categories = {category.pk: category for category in Category.objects.all()}
+    children = {}
+    for category in categories.values():
+        children.setdefault(category.parent_id if category.parent_id in categories else None, []).append(category)
+    stack = [(category, None) for category in children.get(None, [])]
+    while stack:
+        category, parent = stack.pop()
+        if parent:
+            category.path = f"{parent.path}{category.pk}/"
+            category.full_name = f"{parent.full_name} -> {category.name}"
+            category.depth = parent.depth + 1
+        else:
+            category.path = f"/{category.pk}/"
+            category.full_name = category.name
+            category.depth = 0
+        stack.extend((child, category) for child in children.get(category.pk, []))
+    Category.objects.bulk_update(categories.values(), ['path', 'full_name', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=1000, verbose_name='Полное название'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
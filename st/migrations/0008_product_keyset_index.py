@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0007_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', '-created_at', 'name', 'id'], name='st_product_keyset_idx'),
+        ),
+    ]
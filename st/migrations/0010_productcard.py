@@ -0,0 +1,77 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def fill_product_cards(apps, schema_editor):
+    Product = apps.get_model('st', 'Product')
+    ProductVariant = apps.get_model('st', 'ProductVariant')
+    ProductCard = apps.get_model('st', 'ProductCard')
+    stats = {
+        row['product_id']: row
+        for row in ProductVariant.objects.values('product_id').annotate(
+            min_price=Min('price'), max_price=Max('price'), total_stock=Sum('stock_quantity'), variants_count=Count('id'),
+        ).order_by()
+    }
+    images = {}
+    for product_id, image in (
+        ProductVariant.objects.exclude(image='').exclude(image__isnull=True)
+        .order_by('product_id', 'price', 'pk').values_list('product_id', 'image')
+    ):
+        images.setdefault(product_id, image)
+    categories = {}
+    for product_id, name in Product.categories.through.objects.order_by('product_id', 'category__name').values_list('product_id', 'category__name'):
+        categories.setdefault(product_id, []).append(name)
+    cards = []
+    for product in Product.objects.select_related('tech_type').iterator(chunk_size=1000):
+        row = stats.get(product.pk, {})
+        cards.append(ProductCard(
+            product_id=product.pk, name=product.name, brand=product.brand, description=product.description,
+            is_active=product.is_active, created_at=product.created_at, manufacturer_url=product.manufacturer_url,
+            tech_type_name=product.tech_type.name, category_names=categories.get(product.pk, []),
+            min_price=row.get('min_price'), max_price=row.get('max_price'),
+            total_stock=row.get('total_stock') or 0, variants_count=row.get('variants_count', 0),
+            rating_avg=product.rating_avg, rating_count=product.rating_count, image=images.get(product.pk),
+        ))
+    ProductCard.objects.bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0009_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='st.product', verbose_name='Товар')),
+                ('name', models.CharField(max_length=200, verbose_name='Название товара')),
+                ('brand', models.CharField(blank=True, max_length=100, null=True, verbose_name='Бренд')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('manufacturer_url', models.URLField(blank=True, null=True, verbose_name='Сайт производителя')),
+                ('tech_type_name', models.CharField(max_length=100, verbose_name='Тип техники')),
+                ('category_names', models.JSONField(default=list, verbose_name='Категории')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Минимальная цена')),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Максимальная цена')),
+                ('total_stock', models.PositiveIntegerField(default=0, verbose_name='Остаток (все варианты)')),
+                ('variants_count', models.PositiveIntegerField(default=0, verbose_name='Количество вариантов')),
+                ('rating_avg', models.FloatField(blank=True, null=True, verbose_name='Средний рейтинг')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Количество оценок')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='product_variants/', verbose_name='Изображение')),
+                ('refreshed_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+            ],
+            options={
+                'verbose_name': 'Карточка товара',
+                'verbose_name_plural': 'Карточки товаров',
+                'ordering': ['-created_at', 'name'],
+                'indexes': [models.Index(fields=['is_active', '-created_at', 'name', 'product'], name='st_card_keyset_idx')],
+            },
+        ),
+        migrations.RunPython(fill_product_cards, migrations.RunPython.noop),
+    ]
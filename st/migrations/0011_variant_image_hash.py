@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0010_productcard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcard',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Хэш изображения'),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='Хэш изображения'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_sales_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('st', 'OrderItem')
+    Order = apps.get_model('st', 'Order')
+    DailySalesRollup = apps.get_model('st', 'DailySalesRollup')
+    DailyOrderRollup = apps.get_model('st', 'DailyOrderRollup')
+    tz = timezone.get_current_timezone()
+    items = (
+        OrderItem.objects
+        .values(
+            day=TruncDate('order__order_date', tzinfo=tz), tech_type=F('variant__product__tech_type'),
+            brand=F('variant__product__brand'), payment_method=F('order__payment_method'), status=F('order__status'),
+        )
+        .annotate(revenue=Sum(F('quantity') * F('price_at_time')), units=Sum('quantity'), orders=Count('order', distinct=True))
+        .order_by()
+    )
+    DailySalesRollup.objects.bulk_create(
+        (
+            DailySalesRollup(
+                day=row['day'], tech_type_id=row['tech_type'], brand=row['brand'] or '',
+                payment_method=row['payment_method'], status=row['status'],
+                revenue=row['revenue'] or Decimal('0.00'), units=row['units'] or 0, orders=row['orders'],
+            )
+            for row in items
+        ),
+        batch_size=500,
+    )
+    orders = (
+        Order.objects.values('payment_method', 'status', day=TruncDate('order_date', tzinfo=tz))
+        .annotate(orders=Count('pk')).order_by()
+    )
+    DailyOrderRollup.objects.bulk_create((DailyOrderRollup(**row) for row in orders), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0011_variant_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('payment_method', models.CharField(choices=[('card_online', 'Картой онлайн'), ('cash_pickup', 'Наличными при самовывозе'), ('courier_cash', 'Курьеру наличными'), ('courier_card', 'Курьеру картой')], max_length=50, verbose_name='Метод оплаты')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'Собирается'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус заказа')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+            ],
+            options={
+                'verbose_name': 'Заказы за день',
+                'verbose_name_plural': 'Заказы по дням',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('brand', models.CharField(blank=True, default='', max_length=100, verbose_name='Бренд')),
+                ('payment_method', models.CharField(choices=[('card_online', 'Картой онлайн'), ('cash_pickup', 'Наличными при самовывозе'), ('courier_cash', 'Курьеру наличными'), ('courier_card', 'Курьеру картой')], max_length=50, verbose_name='Метод оплаты')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'Собирается'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус заказа')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Выручка')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Продано, шт.')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов с позициями группы')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='st_order_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyorderrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'payment_method', 'status'), name='st_order_rollup_unique'),
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='tech_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='st.techtype', verbose_name='Тип техники'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysalesrollup',
+            index=models.Index(fields=['day'], name='st_sales_rollup_day_idx'),
+        ),
+        migrations.RunPython(fill_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='st.product', verbose_name='Товар')),
+                ('items', models.JSONField(default=list, verbose_name='Рекомендуемые товары')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитаны')),
+            ],
+            options={
+                'verbose_name': 'Рекомендации к товару',
+                'verbose_name_plural': 'Рекомендации к товарам',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0, verbose_name='Последний учтенный заказ')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Учтено заказов')),
+            ],
+            options={
+                'verbose_name': 'Состояние рекомендаций',
+                'verbose_name_plural': 'Состояние рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='st.product', verbose_name='Товар в том же заказе')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='st.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Совместные покупки',
+                'verbose_name_plural': 'Совместные покупки',
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='st_pair_count_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:20
+
+from django.db import migrations, models
+
+
+def reset_recommendation_counts(apps, schema_editor):
+    # Для уже учтенных заказов нет состава, который можно вычесть: счетчики набираются заново
+    # (update_recommendations при коммитах заказов или rebuild_recommendations), списки остаются до пересчета
+    apps.get_model('st', 'ProductPairCount').objects.all().delete()
+    apps.get_model('st', 'RecommendationState').objects.update(last_order_id=0, orders=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0013_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountedOrder',
+            fields=[
+                ('order_id', models.PositiveBigIntegerField(primary_key=True, serialize=False, verbose_name='Заказ')),
+                ('products', models.JSONField(default=list, verbose_name='Товары')),
+            ],
+            options={
+                'verbose_name': 'Учтенный заказ',
+                'verbose_name_plural': 'Учтенные заказы',
+            },
+        ),
+        migrations.RunPython(reset_recommendation_counts, migrations.RunPython.noop),
+    ]
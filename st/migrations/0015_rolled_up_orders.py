@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:40
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.utils import timezone
+
+
+def fill_rolled_up_orders(apps, schema_editor):
+    # Сводки уже посчитаны по текущим заказам: вклад каждого заказа - его текущие позиции
+    Order = apps.get_model('st', 'Order')
+    OrderItem = apps.get_model('st', 'OrderItem')
+    RolledUpOrder = apps.get_model('st', 'RolledUpOrder')
+    orders = {
+        pk: RolledUpOrder(order_id=pk, day=timezone.localdate(order_date), payment_method=payment_method, status=status)
+        for pk, order_date, payment_method, status in Order.objects.values_list('pk', 'order_date', 'payment_method', 'status')
+    }
+    rows = (
+        OrderItem.objects.values_list('order_id', 'variant__product__tech_type', 'variant__product__brand')
+        .annotate(revenue=Sum(F('quantity') * F('price_at_time')), units=Sum('quantity'))
+        .order_by('order_id', 'variant__product__tech_type', 'variant__product__brand')
+    )
+    for order_id, tech_type, brand, revenue, units in rows:
+        orders[order_id].groups.append([tech_type, brand or '', str(revenue or 0), units or 0])
+    RolledUpOrder.objects.bulk_create(orders.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('st', '0014_counted_orders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolledUpOrder',
+            fields=[
+                ('order_id', models.PositiveBigIntegerField(primary_key=True, serialize=False, verbose_name='Заказ')),
+                ('day', models.DateField(verbose_name='День')),
+                ('payment_method', models.CharField(choices=[('card_online', 'Картой онлайн'), ('cash_pickup', 'Наличными при самовывозе'), ('courier_cash', 'Курьеру наличными'), ('courier_card', 'Курьеру картой')], max_length=50, verbose_name='Метод оплаты')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('processing', 'Собирается'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус заказа')),
+                ('groups', models.JSONField(default=list, verbose_name='Продажи по группам')),
+            ],
+            options={
+                'verbose_name': 'Заказ в сводках продаж',
+                'verbose_name_plural': 'Заказы в сводках продаж',
+                'indexes': [models.Index(fields=['day'], name='st_rolled_up_order_day_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rolled_up_orders, migrations.RunPython.noop),
+    ]
@@ -4,10 +4,17 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator, URLValidator
 from django.utils import timezone # КРИТЕРИЙ: Использование from django.utils import timezone
 from django.urls import reverse # КРИТЕРИЙ: reverse (для get_absolute_url)
-from django.db.models import Avg, Count, Sum, F, ExpressionWrapper, DecimalField, Q 
+from django.db.models import Avg, Count, Sum, F, ExpressionWrapper, DecimalField, Q, FloatField, Value
+from django.db.models import OuterRef, Subquery
+from django.db.models import Func
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Substr
+from django.core.exceptions import ValidationError
+from django.dispatch import Signal
 from decimal import Decimal # ИСПРАВЛЕНИЕ: Добавлен импорт Decimal
 import os # Для работы с путями файлов
 
+from .deferred import defer_on_commit
+
 # --- Собственный модельный менеджер ---
 # КРИТЕРИЙ: Использование собственного модельного менеджера
 class ActiveProductManager(models.Manager):
@@ -53,6 +60,51 @@ class TechType(models.Model):
     def __str__(self):
         return self.name
 
+CATEGORY_PATH_SEPARATOR = '/'
+CATEGORY_NAME_SEPARATOR = ' -> '
+
+
+class CategoryQuerySet(models.QuerySet):
+    def with_subtree_product_count(self, products=None):
+        """
+        Аннотирует subtree_product_count - число разных товаров в категории и всех ее подкатегориях
+        (только из products - queryset id товаров, если задан).
+        Один коррелированный подзапрос по материализованному пути вместо COUNT на каждую строку.
+        """
+        links = Product.categories.through.objects.filter(category__path__startswith=OuterRef('path'))
+        if products is not None:
+            links = links.filter(product_id__in=products)
+        subtree_products = (
+            links
+            .order_by()
+            .values(n=Func(F('product_id'), function='COUNT', template='COUNT(DISTINCT %(expressions)s)'))
+        )
+        return self.annotate(subtree_product_count=Coalesce(Subquery(subtree_products), 0))
+
+    def rebuild_tree(self):
+        """
+        Пересчитывает path/depth/full_name всех категорий по parent (исправляет расхождения).
+        Одно чтение всего дерева и bulk_update измененных. Возвращает число исправленных категорий.
+        """
+        categories = {category.pk: category for category in Category.objects.only('pk', 'name', 'parent_id', 'path', 'depth', 'full_name')}
+        children = {}
+        for category in categories.values():
+            parent_id = category.parent_id if category.parent_id in categories else None
+            children.setdefault(parent_id, []).append(category)
+        changed = []
+        stack = [(child, None) for child in children.get(None, [])]
+        while stack:
+            category, parent = stack.pop()
+            old_state = (category.path, category.depth, category.full_name)
+            category._fill_tree_fields(parent.path if parent else None, parent.full_name if parent else None,
+                                       parent.depth if parent else None)
+            if (category.path, category.depth, category.full_name) != old_state:
+                changed.append(category)
+            stack.extend((child, category) for child in children.get(category.pk, []))
+        Category.objects.bulk_update(changed, ['path', 'depth', 'full_name'], batch_size=500)
+        return len(changed)
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
@@ -67,6 +119,14 @@ class Category(models.Model):
         related_name='subcategories',
         verbose_name="Родительская категория"
     )
+    # Материализованный путь: id всех предков и самой категории, например "/1/5/12/".
+    # Потомки - path__startswith=self.path, предки - id из пути; поддерживается в save() и при удалении.
+    path = models.CharField(max_length=255, default='', db_index=True, editable=False, verbose_name="Путь в дереве")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень вложенности")
+    # Полное имя с предками ("Родитель -> Категория") для __str__ без обхода parent
+    full_name = models.CharField(max_length=1000, default='', editable=False, verbose_name="Полное название")
+
+    objects = CategoryQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Категория"
@@ -74,9 +134,132 @@ class Category(models.Model):
         ordering = ['name']
 
     def __str__(self):
-        if self.parent:
-            return f"{self.parent} -> {self.name}"
-        return self.name
+        return self.full_name or self.name
+
+    def _fill_tree_fields(self, parent_path, parent_full_name, parent_depth):
+        if parent_path:
+            self.path = f"{parent_path}{self.pk}{CATEGORY_PATH_SEPARATOR}"
+            self.full_name = f"{parent_full_name}{CATEGORY_NAME_SEPARATOR}{self.name}"
+            self.depth = parent_depth + 1
+        else:
+            self.path = f"{CATEGORY_PATH_SEPARATOR}{self.pk}{CATEGORY_PATH_SEPARATOR}"
+            self.full_name = self.name
+            self.depth = 0
+
+    def _is_own_subtree(self, path):
+        return bool(self.pk and path and f"{CATEGORY_PATH_SEPARATOR}{self.pk}{CATEGORY_PATH_SEPARATOR}" in path)
+
+    def clean(self):
+        super().clean()
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+            if self._is_own_subtree(parent_path):
+                raise ValidationError({'parent': "Категорию нельзя вложить в нее саму или в ее подкатегорию."})
+
+    def save(self, *args, **kwargs):
+        parent = None
+        if self.parent_id:
+            parent = Category.objects.filter(pk=self.parent_id).values_list('path', 'full_name', 'depth').first()
+            if parent and not parent[0]:
+                # Пути дерева не заполнены (например, после loaddata): без пути родителя категория стала бы корневой
+                Category.objects.rebuild_tree()
+                parent = Category.objects.filter(pk=self.parent_id).values_list('path', 'full_name', 'depth').first()
+                if not parent[0]:
+                    raise ValueError("Родительская категория вне дерева категорий: выполните rebuild_category_tree.")
+        if parent and self._is_own_subtree(parent[0]):
+            raise ValueError("Категорию нельзя вложить в нее саму или в ее подкатегорию.")
+        # Прежнее положение читаем из БД: объект в памяти мог устареть
+        old = None
+        if self.pk:
+            old = Category.objects.filter(pk=self.pk).values_list('path', 'full_name', 'depth').first()
+        super().save(*args, **kwargs)
+
+        self._fill_tree_fields(*(parent or (None, None, None)))
+        if old == (self.path, self.full_name, self.depth):
+            return
+        Category.objects.filter(pk=self.pk).update(path=self.path, full_name=self.full_name, depth=self.depth)
+        if old and old[0]:
+            # Перенос или переименование: одним UPDATE заменяем префиксы у всего поддерева
+            old_path, old_full_name, old_depth = old
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                full_name=Concat(Value(self.full_name), Substr('full_name', len(old_full_name) + 1)),
+                depth=F('depth') + (self.depth - old_depth),
+            )
+
+    @property
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.strip(CATEGORY_PATH_SEPARATOR).split(CATEGORY_PATH_SEPARATOR)[:-1] if pk]
+
+    def get_ancestors(self):
+        """Предки от корня к родителю (один запрос)."""
+        return Category.objects.filter(pk__in=self.ancestor_ids).order_by('depth')
+
+    def get_descendants(self, include_self=False):
+        """Все потомки на любой глубине (один запрос)."""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
+
+    def get_breadcrumbs(self):
+        """Цепочка категорий от корня до этой (один запрос)."""
+        return list(self.get_ancestors()) + [self]
+
+    def get_subtree_products(self):
+        """Товары этой категории и всех ее подкатегорий."""
+        return Product.objects.filter(categories__path__startswith=self.path).distinct()
+
+# --- Рейтинг товаров ---
+RATING_STARS = (1, 2, 3, 4, 5)
+RATING_HISTOGRAM_FIELDS = [f'rating_{star}' for star in RATING_STARS]
+
+
+class ProductQuerySet(models.QuerySet):
+    def rebuild_rating_summaries(self, batch_size=1000):
+        """
+        Пересчитывает денормализованную сводку рейтинга (среднее, количество, гистограмма)
+        для товаров из QuerySet по промодерированным отзывам.
+        Товары обрабатываются пачками: один сгруппированный запрос к отзывам на пачку
+        и bulk_update только для тех товаров, у которых сводка разошлась с отзывами.
+        Возвращает количество исправленных товаров.
+        """
+        fields = ['rating_avg', 'rating_count'] + RATING_HISTOGRAM_FIELDS
+        fixed = 0
+        products = self.order_by('pk').only('pk', *fields)
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                fixed += _rebuild_rating_batch(batch, fields)
+                batch = []
+        if batch:
+            fixed += _rebuild_rating_batch(batch, fields)
+        return fixed
+
+
+def _rebuild_rating_batch(products, fields):
+    histograms = {product.pk: dict.fromkeys(RATING_STARS, 0) for product in products}
+    rows = (
+        Review.objects.filter(product_id__in=histograms, is_moderated=True, rating__in=RATING_STARS)
+        .values('product_id', 'rating')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        histograms[row['product_id']][row['rating']] = row['n']
+
+    changed = []
+    now = timezone.now()
+    for product in products:
+        old_state = [getattr(product, field) for field in fields]
+        product.set_rating_histogram(histograms[product.pk])
+        if [getattr(product, field) for field in fields] != old_state:
+            # bulk_update не заполняет auto_now-поля
+            product.updated_at = now
+            changed.append(product)
+    if changed:
+        Product.objects.bulk_update(changed, fields + ['updated_at'])
+    return len(changed)
+
 
 def product_instruction_path(instance, filename):
     # КРИТЕРИЙ (Часть 3): File Uploads (особенности сохранения файлов)
@@ -128,8 +311,24 @@ class Product(models.Model):
         help_text="Например, https://www.apple.com"
     )
 
+    # Денормализованная сводка рейтинга по промодерированным отзывам.
+    # Поддерживается инкрементально сигналами Review (см. ниже) и ReviewQuerySet.set_moderated(),
+    # расхождения исправляет команда rebuild_rating_summaries.
+    rating_avg = models.FloatField(null=True, blank=True, editable=False, verbose_name="Средний рейтинг")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество оценок")
+    rating_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок «1»")
+    rating_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок «2»")
+    rating_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок «3»")
+    rating_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок «4»")
+    rating_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок «5»")
+
+    # Момент последнего изменения товара или того, что выводится на его странице: вариантов,
+    # характеристик, сводки рейтинга, категорий, участия в акциях. Кроме save() обновляется
+    # сигналами (см. st/pagecache.py) и пересчетами рейтинга; входит в ключи кэша страниц.
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
     # КРИТЕРИЙ: Использование собственного модельного менеджера
-    objects = models.Manager() 
+    objects = ProductQuerySet.as_manager()
     active_products = ActiveProductManager()
     recent_products = RecentProductManager()
 
@@ -138,6 +337,10 @@ class Product(models.Model):
         verbose_name_plural = "Товары"
         # КРИТЕРИЙ: class Meta: ordering
         ordering = ['-created_at', 'name'] # Сначала новые, потом по имени
+        indexes = [
+            # Keyset-пагинация публичного списка: активные товары в порядке ('-created_at', 'name', 'id')
+            models.Index(fields=['is_active', '-created_at', 'name', 'id'], name='st_product_keyset_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -156,11 +359,28 @@ class Product(models.Model):
     get_full_name_with_brand.short_description = "Полное название (с брендом)"
 
     def get_average_rating(self):
-        """Возвращает средний рейтинг товара или None, если отзывов нет."""
-        avg_data = self.reviews.aggregate(avg_rating=Avg('rating'))
-        return avg_data['avg_rating'] if avg_data['avg_rating'] is not None else None
+        """Возвращает средний рейтинг товара или None, если оценок нет. Запросов к БД не делает."""
+        return self.rating_avg
     get_average_rating.short_description = "Средний рейтинг"
 
+    @property
+    def rating_histogram(self):
+        """Гистограмма оценок: {5: n, 4: n, ..., 1: n}."""
+        return {star: getattr(self, f'rating_{star}') for star in reversed(RATING_STARS)}
+
+    def set_rating_histogram(self, histogram):
+        """Заполняет поля сводки рейтинга по гистограмме {оценка: количество} (без сохранения)."""
+        for star in RATING_STARS:
+            setattr(self, f'rating_{star}', histogram.get(star, 0))
+        self.rating_count = sum(histogram.get(star, 0) for star in RATING_STARS)
+        total = sum(star * histogram.get(star, 0) for star in RATING_STARS)
+        self.rating_avg = total / self.rating_count if self.rating_count else None
+
+    def update_rating_summary(self):
+        """Полностью пересчитывает и сохраняет сводку рейтинга этого товара."""
+        Product.objects.filter(pk=self.pk).rebuild_rating_summaries()
+        self.refresh_from_db(fields=['rating_avg', 'rating_count'] + RATING_HISTOGRAM_FIELDS)
+
 
 class ProductSpecification(models.Model):
     product = models.ForeignKey(
@@ -234,6 +454,9 @@ class ProductVariant(models.Model):
         null=True,
         verbose_name="Изображение варианта"
     )
+    # Хэш содержимого image: по нему строятся имена миниатюр (st/thumbnails.py).
+    # Пустой - миниатюры еще не готовы, выводится исходное изображение
+    image_hash = models.CharField(max_length=16, blank=True, default='', editable=False, verbose_name="Хэш изображения")
 
     class Meta:
         verbose_name = "Вариант товара"
@@ -249,6 +472,29 @@ class ProductVariant(models.Model):
             parts.append(f"Размер: {self.size.name}")
         return ", ".join(parts) + f" (Артикул: {self.sku})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя файла при загрузке: замена изображения сбрасывает image_hash (st/thumbnails.py)
+        if 'image' in instance.__dict__:
+            instance._loaded_image_name = instance.__dict__['image'] or ''
+        return instance
+
+class ReviewQuerySet(models.QuerySet):
+    def set_moderated(self, is_moderated):
+        """
+        Массово меняет флаг модерации и обновляет сводку рейтинга затронутых товаров.
+        QuerySet.update() не отправляет сигналы, поэтому пересчет выполняется явно,
+        одним сгруппированным запросом на пачку товаров. Возвращает число измененных отзывов.
+        """
+        changed = self.exclude(is_moderated=is_moderated)
+        product_ids = set(changed.values_list('product_id', flat=True))
+        count = changed.update(is_moderated=is_moderated)
+        if product_ids:
+            Product.objects.filter(pk__in=product_ids).rebuild_rating_summaries()
+        return count
+
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews', verbose_name="Товар")
@@ -260,6 +506,8 @@ class Review(models.Model):
     created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Дата создания")
     is_moderated = models.BooleanField(default=False, verbose_name="Промодерирован")
 
+    objects = ReviewQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
@@ -269,6 +517,22 @@ class Review(models.Model):
     def __str__(self):
         return f"Отзыв от {self.user.username} на {self.product.name} (Рейтинг: {self.rating})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._store_rating_snapshot()
+        return instance
+
+    def _store_rating_snapshot(self):
+        # Запоминаем, как отзыв учтен в сводке товара, чтобы сигналы могли применить только разницу
+        self._rating_snapshot = self._rating_contribution()
+
+    def _rating_contribution(self):
+        """(product_id, rating), если отзыв входит в сводку рейтинга товара, иначе None."""
+        if self.is_moderated and self.product_id and self.rating in RATING_STARS:
+            return (self.product_id, self.rating)
+        return None
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites', verbose_name="Пользователь")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='favorited_by', verbose_name="Товар")
@@ -281,6 +545,35 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} добавил в избранное {self.product.name}"
 
+class OrderQuerySet(models.QuerySet):
+    def recalculate_totals(self):
+        """
+        Пересчитывает total_price всех заказов QuerySet одним UPDATE с коррелированным
+        подзапросом SUM(quantity * price_at_time) по позициям и отмечает заказы как измененные.
+        Возвращает число обновленных заказов.
+        """
+        items_total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(total=Sum(F('quantity') * F('price_at_time'), output_field=DecimalField()))
+            .values('total')
+        )
+        # updated_at обновляется явно (update() не трогает auto_now): по нему инвалидируется кэш счетов
+        return self.update(
+            total_price=Coalesce(
+                Subquery(items_total), Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+        )
+
+
+def recalculate_order_totals(order_ids, using=None):
+    """Callback для defer_on_commit: пересчет итогов накопленных за транзакцию заказов."""
+    Order.objects.using(using).filter(pk__in=order_ids).recalculate_totals()
+
+
 class Order(models.Model):
     STATUS_PENDING = 'pending'
     STATUS_PROCESSING = 'processing'
@@ -332,15 +625,28 @@ class Order(models.Model):
     guest_name = models.CharField(max_length=150, verbose_name="Имя гостя", blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата последнего обновления")
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-order_date']
+        indexes = [
+            # Пересчет сводок продаж выбирает заказы по диапазону дат (st/analytics.py)
+            models.Index(fields=['order_date'], name='st_order_date_idx'),
+        ]
 
     def __str__(self):
         user_info = str(self.user.username) if self.user else f"Гость ({self.guest_email or 'N/A'})"
         return f"Заказ №{self.id} от {user_info} ({self.order_date.strftime('%d.%m.%Y %H:%M')})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Смена статуса учтенного заказа меняет его вклад в рекомендации (st/recommendations.py)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def get_customer_full_name(self):
         if self.user:
             return self.user.get_full_name() if self.user.get_full_name() else self.user.username
@@ -351,7 +657,11 @@ class Order(models.Model):
 
     def get_order_items_for_pdf(self):
         items_data = []
-        for item in self.items.all().select_related('variant__product', 'variant__color', 'variant__size'):
+        items = self.items.all()
+        # Если позиции уже подгружены prefetch_related (см. st.invoices.invoice_queryset), повторно не запрашиваем
+        if 'items' not in getattr(self, '_prefetched_objects_cache', {}):
+            items = items.select_related('variant__product', 'variant__color', 'variant__size')
+        for item in items:
             cost = item.quantity * item.price_at_time
             variant_description_parts = []
             if item.variant.color:
@@ -369,33 +679,56 @@ class Order(models.Model):
             })
         return items_data
 
-    # Метод для обновления total_price (будет вызываться сигналом или из save_formset)
     def update_total_price(self):
-        """Вычисляет и обновляет общую стоимость заказа на основе его позиций."""
+        """
+        Немедленно пересчитывает и сохраняет общую стоимость заказа на основе его позиций.
+        Изменения позиций пересчитываются автоматически один раз при коммите транзакции
+        (см. order_item_changed_receiver), так что явный вызов нужен редко.
+        """
         if not self.pk: # Если заказ еще не сохранен (нет pk), то и items быть не может.
             self.total_price = Decimal('0.00')
-            # Не вызываем save() здесь, т.к. объект еще не сохранен первично.
-            # default=Decimal('0.00') в поле total_price позаботится об этом при первом save().
             return
+        Order.objects.filter(pk=self.pk).recalculate_totals()
+        self.refresh_from_db(fields=['total_price'])
 
-        # Используем aggregate для подсчета суммы на стороне БД - эффективнее
-        # Убеждаемся, что items существуют, прежде чем пытаться агрегировать
-        aggregation = self.items.aggregate(
-            calculated_total=Sum(F('quantity') * F('price_at_time'), output_field=DecimalField())
-        )
-        new_total_price = aggregation['calculated_total'] or Decimal('0.00')
-        
-        # Обновляем поле и сохраняем только если значение изменилось,
-        # и только это поле, чтобы избежать рекурсии с сигналами/save()
-        if self.total_price != new_total_price:
-            self.total_price = new_total_price
-            # Важно: используем super().save() или save(update_fields=...)
-            # чтобы избежать бесконечной рекурсии, если этот метод вызывается из переопределенного save()
-            # или если есть сигнал post_save на Order, который тоже вызывает этот метод.
-            # В данном случае, если этот метод вызывается сигналом от OrderItem, то просто self.save()
-            # вызовет еще один сигнал post_save для Order, что нежелательно.
-            # Поэтому используем update_fields.
-            super(Order, self).save(update_fields=['total_price'])
+
+# Отправляется при любом изменении позиций заказов, в том числе массовом (order_ids - затронутые
+# заказы). Так производные данные по позициям (сводки продаж, st/analytics.py) не пропускают
+# bulk_create()/update(), которые не отправляют post_save/post_delete.
+order_items_changed = Signal()
+
+
+def mark_order_items_changed(order_ids, using=None):
+    """Пересчет итогов заказов при коммите и сигнал order_items_changed."""
+    order_ids = {pk for pk in order_ids if pk is not None}
+    defer_on_commit(recalculate_order_totals, order_ids, using=using)
+    order_items_changed.send(sender=OrderItem, order_ids=order_ids, using=using)
+
+
+class OrderItemQuerySet(models.QuerySet):
+    # Массовые операции не отправляют post_save/post_delete, поэтому заказы помечаются здесь
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        mark_order_items_changed((obj.order_id for obj in objs), using=self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        order_ids = {obj.order_id for obj in objs}
+        order_ids.update(obj._loaded_order_id for obj in objs if hasattr(obj, '_loaded_order_id'))
+        mark_order_items_changed(order_ids, using=self.db)
+        return updated
+
+    def update(self, **kwargs):
+        order_ids = set(self.values_list('order_id', flat=True))
+        updated = super().update(**kwargs)
+        if 'order' in kwargs or 'order_id' in kwargs:
+            new_order = kwargs.get('order', kwargs.get('order_id'))
+            order_ids.add(getattr(new_order, 'pk', new_order))
+        mark_order_items_changed(order_ids, using=self.db)
+        return updated
+    update.alters_data = True
 
 
 class OrderItem(models.Model):
@@ -405,13 +738,22 @@ class OrderItem(models.Model):
     # price_at_time должно быть обязательным, его значение устанавливается при создании OrderItem
     price_at_time = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена на момент покупки")
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Позиция заказа"
         verbose_name_plural = "Позиции заказа"
         ordering = ['order']
 
     def __str__(self):
-        return f"{self.quantity} x {self.variant.product.name} ({self.variant.sku}) в заказе №{self.order.id}"
+        return f"{self.quantity} x {self.variant.product.name} ({self.variant.sku}) в заказе №{self.order_id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Если позицию перенесут в другой заказ, пересчитать нужно и прежний
+        instance._loaded_order_id = instance.__dict__.get('order_id')
+        return instance
 
     @property
     def item_total_price(self):
@@ -424,19 +766,83 @@ class OrderItem(models.Model):
     item_total_price.fget.short_description = "Сумма по позиции"
 
 # --- Сигналы для автоматического обновления Order.total_price ---
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
 @receiver([post_save, post_delete], sender=OrderItem)
-def order_item_changed_receiver(sender, instance, **kwargs):
+def order_item_changed_receiver(sender, instance, using=None, **kwargs):
     """
     Сигнал, который вызывается после сохранения или удаления OrderItem.
-    Он пересчитывает и обновляет total_price связанного Order.
+    Заказ только помечается для пересчета: total_price всех затронутых заказов
+    пересчитывается одним запросом при коммите транзакции.
+    """
+    order_ids = {instance.order_id, getattr(instance, '_loaded_order_id', None)}
+    mark_order_items_changed(order_ids, using=using)
+    instance._loaded_order_id = instance.order_id
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted_receiver(sender, instance, **kwargs):
+    """
+    Дочерние категории при удалении родителя становятся корневыми (SET_NULL),
+    поэтому у всего поддерева отрезается префикс пути и полного названия удаляемой категории.
+    """
+    current = Category.objects.filter(pk=instance.pk).values_list('path', 'full_name', 'depth').first()
+    if not current or not current[0]:
+        return
+    path, full_name, depth = current
+    Category.objects.filter(path__startswith=path).exclude(pk=instance.pk).update(
+        path=Concat(Value(CATEGORY_PATH_SEPARATOR), Substr('path', len(path) + 1)),
+        full_name=Substr('full_name', len(full_name) + len(CATEGORY_NAME_SEPARATOR) + 1),
+        depth=F('depth') - (depth + 1),
+    )
+
+
+def _apply_rating_delta(product_id, delta):
     """
-    # instance - это объект OrderItem, который был сохранен или удален
-    # instance.order - это связанный заказ
-    if instance.order: # Убедимся, что есть связанный заказ
-        instance.order.update_total_price()
+    Применяет изменение гистограммы {оценка: +-n} к сводке товара одним UPDATE.
+    Новое среднее считается в том же запросе из старых значений счетчиков и дельты.
+    """
+    delta = {star: n for star, n in delta.items() if n}
+    if not delta:
+        return
+    count_delta = sum(delta.values())
+    total_delta = sum(star * n for star, n in delta.items())
+    new_count = F('rating_count') + count_delta
+    new_total = sum((F(f'rating_{star}') * star for star in RATING_STARS), Value(total_delta))
+    updates = {f'rating_{star}': F(f'rating_{star}') + n for star, n in delta.items()}
+    updates['rating_count'] = new_count
+    updates['rating_avg'] = Cast(new_total, FloatField()) / NullIf(new_count, Value(0))
+    updates['updated_at'] = timezone.now()
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+@receiver(post_save, sender=Review)
+def review_saved_receiver(sender, instance, raw=False, **kwargs):
+    """Инкрементально обновляет сводку рейтинга товара при создании/изменении отзыва."""
+    if raw:
+        # loaddata: снимка прежнего состояния нет, сводку восстановит rebuild_rating_summaries
+        return
+    old = getattr(instance, '_rating_snapshot', None)
+    new = instance._rating_contribution()
+    if old != new:
+        deltas = {}
+        if old:
+            deltas.setdefault(old[0], {})[old[1]] = -1
+        if new:
+            product_delta = deltas.setdefault(new[0], {})
+            product_delta[new[1]] = product_delta.get(new[1], 0) + 1
+        for product_id, delta in deltas.items():
+            _apply_rating_delta(product_id, delta)
+    instance._store_rating_snapshot()
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted_receiver(sender, instance, **kwargs):
+    """Убирает удаленный отзыв из сводки рейтинга товара."""
+    old = getattr(instance, '_rating_snapshot', instance._rating_contribution())
+    if old:
+        _apply_rating_delta(old[0], {old[1]: -1})
 
 
 class Promo(models.Model):
@@ -484,4 +890,216 @@ class PromoProduct(models.Model):
         unique_together = ('promo', 'product')
 
     def __str__(self):
-        return f"Товар '{self.product.name}' в акции '{self.promo.title}'"
\ No newline at end of file
+        return f"Товар '{self.product.name}' в акции '{self.promo.title}'"
+
+# --- Карточки товаров для списков ---
+class ProductCard(models.Model):
+    """
+    Денормализованная read-модель товара для списков: все, что выводится в строке списка
+    (тип техники, категории, диапазон цен, остаток, число вариантов, рейтинг, изображение),
+    в одной строке одной таблицы. Поддерживается сигналами (st/cards.py, один пересчет
+    на транзакцию), полностью перестраивается командой rebuild_product_cards.
+    Скидки по акциям сюда не входят: они зависят от даты и применяются при выводе (st.pricing).
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card',
+        verbose_name="Товар"
+    )
+    name = models.CharField(max_length=200, verbose_name="Название товара")
+    brand = models.CharField(max_length=100, blank=True, null=True, verbose_name="Бренд")
+    description = models.TextField(blank=True, null=True, verbose_name="Описание")
+    is_active = models.BooleanField(default=True, verbose_name="Активен")
+    created_at = models.DateTimeField(verbose_name="Дата создания")
+    manufacturer_url = models.URLField(max_length=200, blank=True, null=True, verbose_name="Сайт производителя")
+    tech_type_name = models.CharField(max_length=100, verbose_name="Тип техники")
+    # Названия категорий в порядке Category.Meta.ordering
+    category_names = models.JSONField(default=list, verbose_name="Категории")
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Минимальная цена")
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Максимальная цена")
+    total_stock = models.PositiveIntegerField(default=0, verbose_name="Остаток (все варианты)")
+    variants_count = models.PositiveIntegerField(default=0, verbose_name="Количество вариантов")
+    rating_avg = models.FloatField(null=True, blank=True, verbose_name="Средний рейтинг")
+    rating_count = models.PositiveIntegerField(default=0, verbose_name="Количество оценок")
+    # Изображение самого дешевого варианта, у которого оно есть
+    image = models.ImageField(upload_to='product_variants/', blank=True, null=True, verbose_name="Изображение")
+    image_hash = models.CharField(max_length=16, blank=True, default='', verbose_name="Хэш изображения")
+    refreshed_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        verbose_name = "Карточка товара"
+        verbose_name_plural = "Карточки товаров"
+        ordering = ['-created_at', 'name']
+        indexes = [
+            # Тот же порядок keyset-пагинации, что и st_product_keyset_idx
+            models.Index(fields=['is_active', '-created_at', 'name', 'product'], name='st_card_keyset_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('product_detail_view', kwargs={'pk': self.product_id})
+
+    def get_full_name_with_brand(self):
+        """Полное название с брендом, как Product.get_full_name_with_brand()."""
+        if self.brand:
+            return f"{self.brand} {self.name}"
+        return self.name
+
+    def get_average_rating(self):
+        return self.rating_avg
+
+    @property
+    def in_stock(self):
+        return self.total_stock > 0
+
+
+# --- Сводки продаж по дням ---
+class DailySalesRollup(models.Model):
+    """
+    Продажи за день в разрезе типа техники, бренда, способа оплаты и статуса заказа:
+    выручка и штуки по позициям. День - дата заказа в часовом поясе TIME_ZONE.
+    Поддерживается сигналами (st/analytics.py: при коммите к группам измененных заказов прибавляется
+    разность их вклада, см. RolledUpOrder), полностью перестраивается командой rebuild_sales_rollups.
+    """
+    day = models.DateField(verbose_name="День")
+    tech_type = models.ForeignKey(TechType, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Тип техники")
+    brand = models.CharField(max_length=100, blank=True, default='', verbose_name="Бренд")
+    payment_method = models.CharField(max_length=50, choices=Order.PAYMENT_METHOD_CHOICES, verbose_name="Метод оплаты")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Выручка")
+    units = models.PositiveIntegerField(default=0, verbose_name="Продано, шт.")
+    # Заказы с позициями этой группы. Заказ с товарами нескольких брендов или типов учитывается
+    # в каждой группе, поэтому число заказов за день берется из DailyOrderRollup
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов с позициями группы")
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['day'], name='st_sales_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.brand or '-'} / {self.status} / {self.payment_method}"
+
+
+class DailyOrderRollup(models.Model):
+    """Число заказов за день в разрезе способа оплаты и статуса (см. DailySalesRollup)."""
+    day = models.DateField(verbose_name="День")
+    payment_method = models.CharField(max_length=50, choices=Order.PAYMENT_METHOD_CHOICES, verbose_name="Метод оплаты")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        verbose_name = "Заказы за день"
+        verbose_name_plural = "Заказы по дням"
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_method', 'status'], name='st_order_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.status} / {self.payment_method} - {self.orders}"
+
+
+class RolledUpOrder(models.Model):
+    """
+    Вклад заказа в сводки продаж в том виде, в каком он в них учтен (st/analytics.py): при изменении
+    заказа или его позиций прежний вклад вычитается из сводок, а текущий прибавляется.
+    """
+    # Не внешний ключ: вклад удаленного заказа тоже нужно вычесть
+    order_id = models.PositiveBigIntegerField(primary_key=True, verbose_name="Заказ")
+    day = models.DateField(verbose_name="День")
+    payment_method = models.CharField(max_length=50, choices=Order.PAYMENT_METHOD_CHOICES, verbose_name="Метод оплаты")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    # [[id типа техники, бренд, выручка (строка Decimal), штук], ...]
+    groups = models.JSONField(default=list, verbose_name="Продажи по группам")
+
+    class Meta:
+        verbose_name = "Заказ в сводках продаж"
+        verbose_name_plural = "Заказы в сводках продаж"
+        indexes = [
+            models.Index(fields=['day'], name='st_rolled_up_order_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Заказ №{self.order_id} ({self.day})"
+
+
+# --- Рекомендации «часто покупают вместе» ---
+class ProductPairCount(models.Model):
+    """
+    Разреженная матрица совместных покупок (st/recommendations.py): число учтенных заказов,
+    в которых были оба товара. Хранится в обе стороны, (product, other) и (other, product),
+    чтобы все пары товара читались по индексу; на диагонали (product == other) - число заказов с товаром.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар в том же заказе")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        verbose_name = "Совместные покупки"
+        verbose_name_plural = "Совместные покупки"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='st_pair_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.orders}"
+
+
+class ProductRecommendation(models.Model):
+    """Top-k товаров, которые покупают вместе с товаром, по убыванию lift (st/recommendations.py)."""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recommendation',
+        verbose_name="Товар"
+    )
+    # [[id товара, lift, заказов вместе], ...]
+    items = models.JSONField(default=list, verbose_name="Рекомендуемые товары")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Пересчитаны")
+
+    class Meta:
+        verbose_name = "Рекомендации к товару"
+        verbose_name_plural = "Рекомендации к товарам"
+
+    def __str__(self):
+        return f"Рекомендации к товару {self.product_id}"
+
+
+class CountedOrder(models.Model):
+    """
+    Товары учтенного заказа в том виде, в каком они вошли в ProductPairCount (st/recommendations.py):
+    при смене статуса или позиций заказа его прежние пары вычитаются из счетчиков.
+    Заказы, не давшие пар (отмененные, оптовые), не хранятся.
+    """
+    # Не внешний ключ: вклад удаленного заказа тоже нужно вычесть
+    order_id = models.PositiveBigIntegerField(primary_key=True, verbose_name="Заказ")
+    products = models.JSONField(default=list, verbose_name="Товары")
+
+    class Meta:
+        verbose_name = "Учтенный заказ"
+        verbose_name_plural = "Учтенные заказы"
+
+    def __str__(self):
+        return f"Заказ №{self.order_id}: {len(self.products)} товаров"
+
+
+class RecommendationState(models.Model):
+    """Одна строка: до какого заказа учтены совместные покупки и сколько заказов учтено."""
+    last_order_id = models.PositiveBigIntegerField(default=0, verbose_name="Последний учтенный заказ")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Учтено заказов")
+
+    class Meta:
+        verbose_name = "Состояние рекомендаций"
+        verbose_name_plural = "Состояние рекомендаций"
+
+    def __str__(self):
+        return f"Заказы до №{self.last_order_id} ({self.orders})"
@@ -0,0 +1,186 @@
+# st/pagecache.py
+"""
+Кэш страниц и фрагментов каталога.
+
+Страница товара кэшируется целиком по ключу из id товара и Product.updated_at: проверка
+стоит одного запроса по первичному ключу, который вьюха делает в любом случае. updated_at
+обновляется не только при save() товара, но и при изменении всего, что выводится на его странице:
+вариантов, характеристик, категорий и участия в акциях (сигналы ниже, один UPDATE на
+транзакцию через defer_on_commit), а также сводки рейтинга (пересчеты в st.models).
+В ключ входит и граница окна акций (st.pricing): акции, начинающиеся или заканчивающиеся
+по дате, меняют цены без изменения данных.
+
+Фрагменты страницы товара (варианты, характеристики) кэшируются по версиям разделов товара,
+которые увеличиваются только сигналами своего раздела: после изменения, например, рейтинга
+страница собирается заново, но варианты и характеристики берутся из кэша без запросов.
+
+Список товаров кэшируется по курсору и версиям каталога и акций, без запросов к БД.
+Попадания и промахи считаются в st.metrics (st_cache_requests_total, st_cache_hit_ratio).
+
+Версии хранятся в кэше (st.versions), поэтому в продакшене кэш должен быть общим для всех
+воркеров (CACHES в settings.py); с локальным кэшем процесса устаревшие страницы других воркеров
+живут не дольше page_cache_timeout(). Функции с префиксом a - те же ключи и версии через асинхронный API кэша
+(для асинхронных вьюх в st.views).
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils import timezone
+
+from . import metrics
+from .deferred import defer_on_commit
+from .models import Category, Product, ProductSpecification, ProductVariant, Promo, PromoProduct, TechType
+from .pricing import acurrent_window, current_window
+from .versions import aget_versions, bump_version, get_versions, page_cache_timeout
+
+SECTIONS = ('variants', 'specs')
+
+
+def record(name, hit):
+    metrics.CACHE_REQUESTS.inc(name, 'hit' if hit else 'miss')
+
+
+# --- Product.updated_at ---
+def touch_products(product_ids, using=None):
+    """Отмечает товары измененными; QuerySet.update() не отправляет сигналов Product."""
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if product_ids:
+        Product.objects.using(using).filter(pk__in=product_ids).update(updated_at=timezone.now())
+
+
+# --- Версии разделов страницы товара ---
+def _section_key(product_id, section):
+    return f'st:product:{product_id}:{section}:version'
+
+
+def get_section_versions(product_id):
+    """{раздел: версия} для всех SECTIONS одним обращением к кэшу."""
+    keys = {section: _section_key(product_id, section) for section in SECTIONS}
+    versions = get_versions(list(keys.values()))
+    return {section: versions[key] for section, key in keys.items()}
+
+
+async def aget_section_versions(product_id):
+    keys = {section: _section_key(product_id, section) for section in SECTIONS}
+    versions = await aget_versions(list(keys.values()))
+    return {section: versions[key] for section, key in keys.items()}
+
+
+def bump_section_versions(product_ids, section):
+    for product_id in product_ids:
+        bump_version(_section_key(product_id, section))
+
+
+def _product_changed(product_ids, using, section=None):
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if section:
+        bump_section_versions(product_ids, section)
+    defer_on_commit(touch_products, product_ids, using=using)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def variant_changed_receiver(sender, instance, using=None, raw=False, **kwargs):
+    if not raw:
+        _product_changed({instance.product_id}, using, 'variants')
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def specification_changed_receiver(sender, instance, using=None, raw=False, **kwargs):
+    if not raw:
+        _product_changed({instance.product_id}, using, 'specs')
+
+
+def m2m_product_ids(instance, action, pk_set, related_products=None):
+    """
+    id товаров, затронутых m2m_changed. related_products - товары instance, если instance
+    не товар (например, category.products); для самого товара - None.
+    """
+    if action in ('post_add', 'post_remove'):
+        return set(pk_set or ()) if related_products is not None else {instance.pk}
+    if action == 'pre_clear':
+        # После очистки связей уже не узнать, каких товаров она коснулась
+        return set(related_products.values_list('pk', flat=True)) if related_products is not None else {instance.pk}
+    return set()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed_receiver(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    # reverse - изменение со стороны категории (category.products.add(...))
+    product_ids = m2m_product_ids(instance, action, pk_set, instance.products if reverse else None)
+    _product_changed(product_ids, using)
+
+
+@receiver(post_save, sender=Category)
+def category_changed_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    # На странице товара выводятся названия категорий
+    if not created and not raw:
+        _product_changed(instance.products.values_list('pk', flat=True), using)
+
+
+@receiver(post_save, sender=TechType)
+def tech_type_changed_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    if not created and not raw:
+        _product_changed(instance.product_set.values_list('pk', flat=True), using)
+
+
+@receiver([post_save, post_delete], sender=PromoProduct)
+def promo_product_changed_receiver(sender, instance, using=None, raw=False, **kwargs):
+    if not raw:
+        _product_changed({instance.product_id}, using, 'variants')
+
+
+@receiver(post_save, sender=Promo)
+def promo_saved_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    # Скидка или даты акции изменились: цены всех ее товаров
+    if not created and not raw:
+        _product_changed(instance.products.values_list('pk', flat=True), using, 'variants')
+
+
+@receiver(m2m_changed, sender=Promo.products.through)
+def promo_products_changed_receiver(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    # Прямая сторона - promo.products, reverse - со стороны товара
+    product_ids = m2m_product_ids(instance, action, pk_set, None if reverse else instance.products)
+    _product_changed(product_ids, using, 'variants')
+
+
+# --- Кэш страниц ---
+def page_cache_key(name, *parts):
+    _, boundary, _ = current_window()
+    return _page_cache_key(name, parts, boundary)
+
+
+async def apage_cache_key(name, *parts):
+    _, boundary, _ = await acurrent_window()
+    return _page_cache_key(name, parts, boundary)
+
+
+def _page_cache_key(name, parts, boundary):
+    raw = '|'.join(map(str, (*parts, boundary.isoformat())))
+    return f'st:page:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+class PageCacheMixin:
+    """
+    Кэширует отрендеренный ответ GET целиком. Вьюха задает page_cache_name и
+    get_page_cache_key() (None - не кэшировать этот запрос).
+    """
+    page_cache_name = None
+
+    def get_page_cache_key(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key()
+        if key is None:
+            return super().get(request, *args, **kwargs)
+        name = f'page:{self.page_cache_name}'
+        content = cache.get(key)
+        record(name, content is not None)
+        if content is not None:
+            return HttpResponse(content)
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(lambda rendered: cache.set(key, rendered.content, page_cache_timeout()))
+        return response
@@ -0,0 +1,144 @@
+# st/pagination.py
+"""
+Keyset-пагинация (по курсору).
+
+Вместо OFFSET страница выбирается условием «строго после/до последней показанной записи»
+по упорядочению из нескольких полей, например ('-created_at', 'name', 'id'). Стоимость любой
+страницы одинакова, COUNT(*) не выполняется, а вставка новых записей не сдвигает страницы.
+Последнее поле упорядочения должно быть уникальным (обычно id); поля не должны допускать NULL.
+
+Курсор - непрозрачная строка (base64 от JSON с направлением и значениями полей).
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value if isinstance(value, (int, float)) else str(value)
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return self.paginator.encode_cursor('next', self.object_list[-1]) if self._has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor('prev', self.object_list[0]) if self._has_previous else None
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.model = queryset.model
+        # (имя поля, по убыванию?, поле модели) для каждого элемента упорядочения
+        self.fields = []
+        for item in self.ordering:
+            name = item.lstrip('-')
+            model_field = self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+            self.fields.append((model_field.attname, item.startswith('-'), model_field))
+
+    # --- Курсоры ---
+    def encode_cursor(self, direction, obj):
+        payload = {'d': direction, 'v': [_encode_value(getattr(obj, attname)) for attname, _, _ in self.fields]}
+        raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            direction, values = payload['d'], payload['v']
+            if direction not in ('next', 'prev') or len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            return direction, [field.to_python(value) for value, (_, _, field) in zip(values, self.fields)]
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _after_q(self, values, reverse):
+        """Условие «строго после values» в порядке ordering (или до них, если reverse)."""
+        q = Q()
+        for i, (attname, descending, _) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition = Q(**{f'{attname}__{lookup}': values[i]})
+            for j, (prev_attname, _, _) in enumerate(self.fields[:i]):
+                condition &= Q(**{prev_attname: values[j]})
+            q |= condition
+        return q
+
+    # --- Страницы ---
+    def _page_query(self, cursor):
+        """(QuerySet на per_page + 1 записей, направление курсора или None для первой страницы)."""
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'next':
+            return self.queryset.filter(self._after_q(values, False)).order_by(*self.ordering)[:self.per_page + 1], direction
+        reversed_ordering = [item[1:] if item.startswith('-') else f'-{item}' for item in self.ordering]
+        return self.queryset.filter(self._after_q(values, True)).order_by(*reversed_ordering)[:self.per_page + 1], direction
+
+    def _make_page(self, objects, direction):
+        has_more = len(objects) > self.per_page
+        if direction is None:
+            return KeysetPage(objects[:self.per_page], self, has_more, False)
+        if direction == 'next':
+            return KeysetPage(objects[:self.per_page], self, has_more, True)
+        return KeysetPage(list(reversed(objects[:self.per_page])), self, True, has_more)
+
+    def page(self, cursor=None):
+        """Страница после/до курсора (без курсора - первая). Некорректный курсор дает InvalidCursor."""
+        queryset, direction = self._page_query(cursor)
+        return self._make_page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        """page() через асинхронную итерацию QuerySet."""
+        queryset, direction = self._page_query(cursor)
+        return self._make_page([obj async for obj in queryset], direction)
+
+
+class KeysetPaginationMixin:
+    """
+    Подмешивается к ListView вместо OFFSET-пагинации.
+    В контексте page_obj.next_cursor / page_obj.previous_cursor; курсор передается в GET-параметре cursor.
+    """
+    cursor_ordering = ('-pk',)
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.cursor_ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор страницы")
+        return (paginator, page, page.object_list, page.has_other_pages())
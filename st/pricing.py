@@ -0,0 +1,236 @@
+# st/pricing.py
+"""
+Итоговые цены с учетом промоакций.
+
+Скидка товара - максимальный discount_percent среди действующих акций (is_active и
+start_date <= сегодня <= end_date), в которых он участвует. Скидки для любого набора товаров
+считаются одним сгруппированным запросом и кэшируются по товарам.
+
+Ключи кэша содержат версию акций и границу текущего «окна»: ближайшую дату начала или окончания
+какой-либо акции. Любое изменение Promo/PromoProduct увеличивает версию, а при наступлении
+границы окно (и все ключи) сменяется само: таймаут записей истекает ровно на границе.
+
+Функции с префиксом a - то же для асинхронных вьюх (st.views): кэш и запросы
+через асинхронные API Django, без блокировки цикла событий.
+"""
+import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db.models import Max, Min, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Promo, PromoProduct
+from .versions import aget_version, bump_version, get_version
+
+PROMO_VERSION_KEY = 'st:promo:version'
+# Если впереди нет ни одной границы акций, окно все равно пересчитывается раз в сутки
+MAX_WINDOW_DAYS = 1
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+# --- Версия акций ---
+def get_promo_version():
+    return get_version(PROMO_VERSION_KEY)
+
+
+async def aget_promo_version():
+    return await aget_version(PROMO_VERSION_KEY)
+
+
+def bump_promo_version():
+    bump_version(PROMO_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Promo)
+@receiver([post_save, post_delete], sender=PromoProduct)
+def promo_changed_receiver(sender, **kwargs):
+    bump_promo_version()
+
+
+@receiver(m2m_changed, sender=Promo.products.through)
+def promo_products_changed_receiver(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_promo_version()
+
+
+# --- Окно действия скидок ---
+def promo_today():
+    # Та же «сегодняшняя» дата, что и в Promo.is_currently_active()
+    return timezone.now().date()
+
+
+def _boundary_datetime(day):
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def _boundary_aggregates(today):
+    return {
+        'next_start': Min('start_date', filter=Q(start_date__gt=today)),
+        'next_end': Min('end_date', filter=Q(end_date__gte=today)),
+    }
+
+
+def next_promo_boundary(today=None):
+    """Ближайшая дата (после today), с которой меняется набор действующих акций."""
+    today = today or promo_today()
+    return _window_boundary(today, Promo.objects.filter(is_active=True).aggregate(**_boundary_aggregates(today)))
+
+
+async def anext_promo_boundary(today=None):
+    today = today or promo_today()
+    return _window_boundary(today, await Promo.objects.filter(is_active=True).aaggregate(**_boundary_aggregates(today)))
+
+
+def _window_boundary(today, bounds):
+    candidates = [today + datetime.timedelta(days=MAX_WINDOW_DAYS)]
+    if bounds['next_start']:
+        candidates.append(bounds['next_start'])
+    if bounds['next_end']:
+        # Акция действует до конца end_date включительно
+        candidates.append(bounds['next_end'] + datetime.timedelta(days=1))
+    return min(candidates)
+
+
+def current_window():
+    """(версия акций, граница окна, секунд до границы) - основа ключей и таймаутов кэша."""
+    version = get_promo_version()
+    today = promo_today()
+    key = f'st:promo:window:{version}'
+    boundary = cache.get(key)
+    if boundary is None or boundary <= today:
+        boundary = next_promo_boundary(today)
+        cache.set(key, boundary, _seconds_until(boundary))
+    return version, boundary, _seconds_until(boundary)
+
+
+async def acurrent_window():
+    """current_window() для асинхронных вьюх: кэш и запрос - через асинхронные API."""
+    version = await aget_promo_version()
+    today = promo_today()
+    key = f'st:promo:window:{version}'
+    boundary = await cache.aget(key)
+    if boundary is None or boundary <= today:
+        boundary = await anext_promo_boundary(today)
+        await cache.aset(key, boundary, _seconds_until(boundary))
+    return version, boundary, _seconds_until(boundary)
+
+
+def _seconds_until(boundary):
+    return max(int((_boundary_datetime(boundary) - timezone.now()).total_seconds()), 1)
+
+
+# --- Скидки и цены ---
+def _discounts_queryset(product_ids, today):
+    return (
+        PromoProduct.objects
+        .filter(product_id__in=product_ids, promo__is_active=True,
+                promo__start_date__lte=today, promo__end_date__gte=today)
+        .values('product_id')
+        .annotate(best=Max('promo__discount_percent'))
+        .order_by()
+    )
+
+
+def compute_discounts(product_ids, today=None):
+    """{id товара: лучшая скидка в %} для товаров с действующими акциями; один запрос."""
+    rows = _discounts_queryset(product_ids, today or promo_today())
+    return {row['product_id']: row['best'] for row in rows}
+
+
+async def acompute_discounts(product_ids, today=None):
+    rows = _discounts_queryset(product_ids, today or promo_today())
+    return {row['product_id']: row['best'] async for row in rows}
+
+
+def get_discounts(product_ids):
+    """
+    compute_discounts() с кэшированием по товарам. Для товаров без скидки в кэше хранится 0,
+    поэтому повторные вызовы не делают запросов вовсе. Возвращает только товары со скидкой.
+    """
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if not product_ids:
+        return {}
+    version, boundary, timeout = current_window()
+    prefix = f'st:promo:discount:{version}:{boundary.isoformat()}:'
+    cached = cache.get_many([f'{prefix}{pk}' for pk in product_ids])
+    discounts = {int(key[len(prefix):]): value for key, value in cached.items()}
+    missing = product_ids - discounts.keys()
+    if missing:
+        computed = compute_discounts(missing)
+        fresh = {pk: computed.get(pk, Decimal('0')) for pk in missing}
+        cache.set_many({f'{prefix}{pk}': value for pk, value in fresh.items()}, timeout)
+        discounts.update(fresh)
+    return {pk: value for pk, value in discounts.items() if value}
+
+
+async def aget_discounts(product_ids):
+    """get_discounts() для асинхронных вьюх."""
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if not product_ids:
+        return {}
+    version, boundary, timeout = await acurrent_window()
+    prefix = f'st:promo:discount:{version}:{boundary.isoformat()}:'
+    cached = await cache.aget_many([f'{prefix}{pk}' for pk in product_ids])
+    discounts = {int(key[len(prefix):]): value for key, value in cached.items()}
+    missing = product_ids - discounts.keys()
+    if missing:
+        computed = await acompute_discounts(missing)
+        fresh = {pk: computed.get(pk, Decimal('0')) for pk in missing}
+        await cache.aset_many({f'{prefix}{pk}': value for pk, value in fresh.items()}, timeout)
+        discounts.update(fresh)
+    return {pk: value for pk, value in discounts.items() if value}
+
+
+def apply_discount(price, percent):
+    """Цена со скидкой percent%, округленная до копеек."""
+    if price is None or not percent:
+        return price
+    return (price * (HUNDRED - percent) / HUNDRED).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def annotate_variant_prices(variants):
+    """
+    Заполняет у вариантов discount_percent (None - без скидки) и final_price.
+    Возвращает {id варианта: итоговая цена}. Запросов - не больше одного на весь набор.
+    """
+    variants = list(variants)
+    return _apply_variant_discounts(variants, get_discounts(variant.product_id for variant in variants))
+
+
+async def aannotate_variant_prices(variants):
+    variants = list(variants)
+    return _apply_variant_discounts(variants, await aget_discounts(variant.product_id for variant in variants))
+
+
+def _apply_variant_discounts(variants, discounts):
+    prices = {}
+    for variant in variants:
+        variant.discount_percent = discounts.get(variant.product_id)
+        variant.final_price = apply_discount(variant.price, variant.discount_percent)
+        prices[variant.pk] = variant.final_price
+    return prices
+
+
+def annotate_product_prices(products, price_attr='min_price'):
+    """
+    Заполняет у товаров discount_percent и final_min_price (цена из атрибута price_attr,
+    например аннотации Min('variants__price'), со скидкой). Запросов - не больше одного.
+    """
+    products = list(products)
+    return _apply_product_discounts(products, get_discounts(product.pk for product in products), price_attr)
+
+
+async def aannotate_product_prices(products, price_attr='min_price'):
+    products = list(products)
+    return _apply_product_discounts(products, await aget_discounts(product.pk for product in products), price_attr)
+
+
+def _apply_product_discounts(products, discounts, price_attr):
+    for product in products:
+        product.discount_percent = discounts.get(product.pk)
+        product.final_min_price = apply_discount(getattr(product, price_attr, None), product.discount_percent)
+    return products
@@ -0,0 +1,390 @@
+# st/recommendations.py
+"""
+Рекомендации «часто покупают вместе» по совместным покупкам в заказах.
+
+Матрица совместных покупок хранится разреженно (ProductPairCount): для пары товаров - число заказов,
+в которых были оба, на диагонали - число заказов с товаром; N - число учтенных заказов
+(RecommendationState). Пара оценивается по lift = c(a, b) * N / (c(a) * c(b)) - во сколько раз
+совместная покупка чаще, чем при независимых покупках; PMI = log(lift) дает тот же порядок.
+Пары реже MIN_PAIR_ORDERS заказов не рекомендуются: у редких товаров lift велик случайно.
+Для каждого товара хранится top-k (ProductRecommendation).
+
+Обновление инкрементальное: заказы с id больше RecommendationState.last_order_id учитываются пачками.
+Пары товаров пачки строятся на NumPy, счетчики увеличиваются одним upsert (ON CONFLICT DO UPDATE),
+затем пересчитываются top-k товаров из этих заказов. Новые заказы учитываются при коммите (сигналы
+Order и order_items_changed, не больше ON_COMMIT_MAX_ORDERS заказов за раз, остальное - при следующих
+коммитах или командой rebuild_recommendations --incremental). Top-k остальных товаров не
+пересчитываются, хотя N и c(b) их пар растут.
+
+Состав учтенного заказа хранится в CountedOrder. Если уже учтенный заказ отменяют или возвращают
+из отмены, меняют его позиции или удаляют его, при коммите его прежние пары вычитаются из счетчиков,
+а текущие добавляются (recount_orders): счетчики совпадают с полной перестройкой без нее.
+
+Страница товара берет рекомендации из кэша (get_recommendations): карточки рекомендуемых товаров
+кладутся в кэш при пересчете, запросы к БД нужны только после вытеснения из кэша. Карточки
+в кэше могут отставать от каталога на ST_PAGE_CACHE_TIMEOUT, как и закэшированные страницы;
+скидки применяются при выводе.
+"""
+import numpy as np
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .catalog import aget_catalog_version, get_catalog_version
+from .deferred import defer_on_commit
+from .models import (
+    CountedOrder, Order, OrderItem, ProductCard, ProductPairCount, ProductRecommendation, RecommendationState,
+    order_items_changed,
+)
+from .pagecache import page_cache_timeout, record, touch_products
+from .pricing import aannotate_product_prices, annotate_product_prices
+
+RECOMMENDATIONS_TOP_K = 6
+MIN_PAIR_ORDERS = 2
+# Заказов в одной пачке подсчета (одна транзакция) и товаров в одной пачке пересчета top-k
+ORDER_BATCH_SIZE = 1000
+RESCORE_BATCH_SIZE = 500
+ON_COMMIT_MAX_ORDERS = 100
+# Заказы с большим числом товаров (оптовые) дают квадратичное число пар и не отражают «покупают вместе»
+MAX_ORDER_PRODUCTS = 50
+EXCLUDED_STATUSES = (Order.STATUS_CANCELLED,)
+STATE_PK = 1
+
+
+# --- Подсчет совместных покупок ---
+def order_pairs(order_ids, product_ids):
+    """
+    Совместные покупки в позициях (order_ids[i], product_ids[i]) без повторов товара в заказе.
+    Возвращает (a, b, заказов с a и b, число заказов) для всех упорядоченных пар, включая a == b;
+    заказы больше MAX_ORDER_PRODUCTS товаров пропускаются.
+    """
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(order_ids):
+        return empty, empty, empty, 0
+    ordering = np.lexsort((product_ids, order_ids))
+    order_ids, product_ids = order_ids[ordering], product_ids[ordering]
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    keep = np.repeat(sizes <= MAX_ORDER_PRODUCTS, sizes)
+    product_ids = product_ids[keep]
+    sizes = sizes[sizes <= MAX_ORDER_PRODUCTS]
+    if not len(sizes):
+        return empty, empty, empty, 0
+    starts = np.cumsum(sizes) - sizes
+
+    # Позиция i дает пары со всеми позициями своего заказа: left повторяет i size раз, right - весь заказ
+    group_sizes = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(product_ids)), group_sizes)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+    right = np.repeat(starts, sizes)[left] + offsets
+    # Пара (a, b) - одно число: так np.unique считает ее повторы без сортировки строк
+    base = int(product_ids.max()) + 1
+    keys, counts = np.unique(product_ids[left] * base + product_ids[right], return_counts=True)
+    return keys // base, keys % base, counts.astype(np.int64), len(sizes)
+
+
+def order_products(items):
+    """
+    {заказ: [товары по возрастанию id]} по позициям items без отмененных заказов и заказов больше
+    MAX_ORDER_PRODUCTS товаров - то, что входит в счетчики.
+    """
+    rows = (
+        items.exclude(order__status__in=EXCLUDED_STATUSES)
+        .values_list('order_id', 'variant__product_id').distinct().order_by('order_id', 'variant__product_id')
+    )
+    products = {}
+    for order_id, product_id in rows:
+        products.setdefault(order_id, []).append(product_id)
+    return {order_id: ids for order_id, ids in products.items() if len(ids) <= MAX_ORDER_PRODUCTS}
+
+
+def _products_pairs(products_by_order):
+    return order_pairs(
+        [order_id for order_id, ids in products_by_order.items() for _ in ids],
+        [product_id for ids in products_by_order.values() for product_id in ids],
+    )
+
+
+def pair_delta(old, new):
+    """Разность счетчиков (a, b, изменение) между наборами пар new и old (результаты order_pairs); без нулей."""
+    products = np.r_[new[0], old[0]]
+    others = np.r_[new[1], old[1]]
+    if not len(products):
+        return products, others, products
+    base = int(max(products.max(), others.max())) + 1
+    keys, inverse = np.unique(products * base + others, return_inverse=True)
+    delta = np.bincount(inverse, weights=np.r_[new[2], -old[2]]).astype(np.int64)
+    keep = delta != 0
+    return keys[keep] // base, keys[keep] % base, delta[keep]
+
+
+def _add_pair_counts(products, others, counts, using):
+    """Увеличивает счетчики пар одним upsert; новые пары создаются."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(ProductPairCount._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} ({qn('product_id')}, {qn('other_id')}, {qn('orders')}) VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({qn('product_id')}, {qn('other_id')}) "
+        f"DO UPDATE SET {qn('orders')} = {table}.{qn('orders')} + excluded.{qn('orders')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, list(zip(products.tolist(), others.tolist(), counts.tolist())))
+
+
+def _subtract_pair_counts(products, others, counts, using):
+    """Уменьшает счетчики пар (не ниже нуля); пары с нулевым счетчиком удаляются."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(ProductPairCount._meta.db_table)
+    # Не upsert с отрицательным числом: строка VALUES не проходит CHECK (orders >= 0) еще до конфликта
+    sql = (
+        f"UPDATE {table} SET {qn('orders')} = CASE WHEN {qn('orders')} > %s THEN {qn('orders')} - %s ELSE 0 END "
+        f"WHERE {qn('product_id')} = %s AND {qn('other_id')} = %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(n, n, a, b) for a, b, n in zip(products.tolist(), others.tolist(), counts.tolist())])
+    ProductPairCount.objects.using(using).filter(product_id__in=set(products.tolist()), orders=0).delete()
+
+
+def _get_state(using):
+    return RecommendationState.objects.using(using).get_or_create(pk=STATE_PK)[0]
+
+
+def count_new_orders(max_orders=None, using=None):
+    """
+    Добавляет в счетчики заказы после last_order_id (не больше max_orders, None - все).
+    Возвращает (просмотрено заказов, id товаров из учтенных заказов).
+    """
+    using = using or router.db_for_write(ProductPairCount)
+    seen, touched = 0, set()
+    while max_orders is None or seen < max_orders:
+        limit = ORDER_BATCH_SIZE if max_orders is None else min(ORDER_BATCH_SIZE, max_orders - seen)
+        last_order_id = _get_state(using).last_order_id
+        order_ids = list(
+            Order.objects.using(using).filter(pk__gt=last_order_id).order_by('pk').values_list('pk', flat=True)[:limit]
+        )
+        if not order_ids:
+            break
+        with transaction.atomic(using=using):
+            # Условный UPDATE состояния: параллельный пересчет тех же заказов не засчитает их дважды.
+            # Позиции читаются после него, чтобы recount_orders не разошелся с сохраненным составом
+            claimed = RecommendationState.objects.using(using).filter(
+                pk=STATE_PK, last_order_id=last_order_id,
+            ).update(last_order_id=order_ids[-1])
+            if claimed:
+                products_by_order = order_products(
+                    OrderItem.objects.using(using).filter(order_id__gt=last_order_id, order_id__lte=order_ids[-1])
+                )
+                products, others, counts, orders = _products_pairs(products_by_order)
+                RecommendationState.objects.using(using).filter(pk=STATE_PK).update(orders=F('orders') + orders)
+                if len(products):
+                    _add_pair_counts(products, others, counts, using)
+                CountedOrder.objects.using(using).bulk_create(
+                    [CountedOrder(order_id=pk, products=ids) for pk, ids in products_by_order.items()],
+                    update_conflicts=True, unique_fields=['order_id'], update_fields=['products'],
+                )
+        if claimed:
+            seen += len(order_ids)
+            touched.update(products.tolist())
+    return seen, touched
+
+
+def recount_orders(order_ids, using=None):
+    """
+    Пересчитывает вклад уже учтенных заказов из order_ids (смена статуса, позиций, удаление):
+    вычитает пары сохраненного состава и добавляет пары текущего. Заказы после last_order_id
+    пропускаются - их учтет count_new_orders. Возвращает id товаров с изменившимися счетчиками.
+    """
+    using = using or router.db_for_write(ProductPairCount)
+    with transaction.atomic(using=using):
+        # Блокировка состояния: count_new_orders не учтет те же заказы параллельно
+        state = RecommendationState.objects.using(using).select_for_update().filter(pk=STATE_PK).first()
+        order_ids = sorted(pk for pk in order_ids if pk is not None and state and pk <= state.last_order_id)
+        if not order_ids:
+            return set()
+        old = dict(CountedOrder.objects.using(using).filter(pk__in=order_ids).values_list('pk', 'products'))
+        new = order_products(OrderItem.objects.using(using).filter(order_id__in=order_ids))
+        changed = [pk for pk in order_ids if old.get(pk, []) != new.get(pk, [])]
+        if not changed:
+            return set()
+        products, others, delta = pair_delta(
+            _products_pairs({pk: old[pk] for pk in changed if pk in old}),
+            _products_pairs({pk: new[pk] for pk in changed if pk in new}),
+        )
+        if len(products):
+            _add_pair_counts(products[delta > 0], others[delta > 0], delta[delta > 0], using)
+            _subtract_pair_counts(products[delta < 0], others[delta < 0], -delta[delta < 0], using)
+        orders = sum(pk in new for pk in changed) - sum(pk in old for pk in changed)
+        if orders:
+            RecommendationState.objects.using(using).filter(pk=STATE_PK).update(orders=F('orders') + orders)
+        CountedOrder.objects.using(using).filter(pk__in=[pk for pk in changed if pk not in new]).delete()
+        CountedOrder.objects.using(using).bulk_create(
+            [CountedOrder(order_id=pk, products=new[pk]) for pk in changed if pk in new],
+            update_conflicts=True, unique_fields=['order_id'], update_fields=['products'],
+        )
+    return set(products.tolist())
+
+
+# --- Top-k ---
+def score_pairs(products, others, together, product_orders, other_orders, total_orders, top_k=RECOMMENDATIONS_TOP_K):
+    """
+    {товар: [[другой товар, lift, заказов вместе], ...]} - top_k пар каждого товара по убыванию lift
+    (при равенстве - по числу совместных заказов). Аргументы - массивы одной длины по парам.
+    """
+    products, others, together = (np.asarray(values, dtype=np.int64) for values in (products, others, together))
+    expected = np.asarray(product_orders, dtype=float) * np.asarray(other_orders, dtype=float)
+    lift = together * float(total_orders) / np.where(expected > 0, expected, np.inf)
+    ordering = np.lexsort((others, -together, -lift, products))
+    products, others, together, lift = products[ordering], others[ordering], together[ordering], lift[ordering]
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]]) if len(products) else np.zeros(0, dtype=int)
+    sizes = np.diff(np.r_[starts, len(products)])
+    rank = np.arange(len(products)) - np.repeat(starts, sizes)
+    top = {}
+    for i in np.flatnonzero((rank < top_k) & (lift > 0)):
+        top.setdefault(int(products[i]), []).append([int(others[i]), round(float(lift[i]), 4), int(together[i])])
+    return top
+
+
+def _diagonal(product):
+    return Subquery(ProductPairCount.objects.filter(product=product, other=product).values('orders')[:1])
+
+
+def _score_batch(product_ids, total_orders, using):
+    rows = (
+        ProductPairCount.objects.using(using)
+        .filter(product_id__in=product_ids, orders__gte=MIN_PAIR_ORDERS, other__is_active=True)
+        .exclude(other=F('product'))
+        .annotate(product_orders=_diagonal(OuterRef('product')), other_orders=_diagonal(OuterRef('other')))
+        .values_list('product_id', 'other_id', 'orders', 'product_orders', 'other_orders')
+    )
+    rows = np.array(list(rows), dtype=np.int64).reshape(-1, 5)
+    return score_pairs(*rows.T, total_orders)
+
+
+def refresh_recommendations(product_ids, using=None):
+    """
+    Пересчитывает top-k товаров product_ids по текущим счетчикам. Товарам, у которых изменился
+    список, обновляются кэш рекомендаций и Product.updated_at (кэш страницы). Возвращает их число.
+    """
+    using = using or router.db_for_write(ProductRecommendation)
+    product_ids = sorted({pk for pk in product_ids if pk is not None})
+    total_orders = _get_state(using).orders
+    changed = {}
+    for start in range(0, len(product_ids), RESCORE_BATCH_SIZE):
+        batch = product_ids[start:start + RESCORE_BATCH_SIZE]
+        top = _score_batch(batch, total_orders, using)
+        old = dict(ProductRecommendation.objects.using(using).filter(pk__in=batch).values_list('pk', 'items'))
+        ProductRecommendation.objects.using(using).bulk_create(
+            [ProductRecommendation(product_id=pk, items=top.get(pk, [])) for pk in batch if pk in top or pk in old],
+            update_conflicts=True, unique_fields=['product'], update_fields=['items', 'updated_at'],
+        )
+        for pk in batch:
+            items = top.get(pk, [])
+            # Оценки меняются с каждым заказом; страницу перестраивает только другой состав списка
+            if [item[0] for item in items] != [item[0] for item in old.get(pk, [])]:
+                changed[pk] = items
+    if changed:
+        cache.set_many(
+            {_cache_key(pk): cards for pk, cards in _recommended_cards(changed, using).items()},
+            page_cache_timeout(),
+        )
+        touch_products(changed, using=using)
+    return len(changed)
+
+
+def update_recommendations(max_orders=None, using=None):
+    """Учитывает новые заказы и пересчитывает top-k их товаров. Возвращает (заказов, товаров)."""
+    seen, touched = count_new_orders(max_orders, using=using)
+    if touched:
+        refresh_recommendations(touched, using=using)
+    return seen, len(touched)
+
+
+def rebuild_recommendations(using=None):
+    """Полная перестройка: счетчики и top-k заново по всем заказам. Возвращает (заказов, товаров)."""
+    using = using or router.db_for_write(ProductPairCount)
+    with transaction.atomic(using=using):
+        previous = list(ProductRecommendation.objects.using(using).values_list('pk', flat=True))
+        ProductPairCount.objects.using(using).all().delete()
+        CountedOrder.objects.using(using).all().delete()
+        ProductRecommendation.objects.using(using).all().delete()
+        RecommendationState.objects.using(using).update_or_create(
+            pk=STATE_PK, defaults={'last_order_id': 0, 'orders': 0},
+        )
+    cache.delete_many([_cache_key(pk) for pk in previous])
+    touch_products(previous, using=using)
+    return update_recommendations(using=using)
+
+
+# --- Синхронизация ---
+def _update_on_commit(order_ids, using=None):
+    # Уже учтенные заказы пересчитываются по id, новые - все после last_order_id
+    touched = recount_orders(order_ids, using=using)
+    touched.update(count_new_orders(max_orders=ON_COMMIT_MAX_ORDERS, using=using)[1])
+    if touched:
+        refresh_recommendations(touched, using=using)
+
+
+@receiver(post_save, sender=Order)
+def order_recommendations_receiver(sender, instance, created, using=None, raw=False, **kwargs):
+    status_changed = instance.status != getattr(instance, '_loaded_status', instance.status)
+    instance._loaded_status = instance.status
+    if not raw and (created or status_changed):
+        defer_on_commit(_update_on_commit, {instance.pk}, using=using)
+
+
+@receiver(order_items_changed)
+def order_items_recommendations_receiver(sender, order_ids, using=None, **kwargs):
+    # Массовая загрузка заказов (bulk_create) не отправляет post_save
+    defer_on_commit(_update_on_commit, order_ids, using=using)
+
+
+# --- Вывод ---
+def _cache_key(product_id):
+    return f'st:recommendations:{product_id}'
+
+
+def _recommended_cards(items_by_product, using=None):
+    """{товар: [ProductCard активных рекомендуемых товаров в порядке списка]}; один запрос."""
+    ids = {item[0] for items in items_by_product.values() for item in items}
+    cards = ProductCard.objects.using(using).filter(is_active=True).in_bulk(ids) if ids else {}
+    return {
+        pk: [cards[item[0]] for item in items if item[0] in cards]
+        for pk, items in items_by_product.items()
+    }
+
+
+def get_recommendations(product_id):
+    """
+    Карточки товаров, которые покупают вместе с product_id, со скидками (discount_percent,
+    final_min_price). При попадании в кэш - без запросов к БД.
+    """
+    key = _cache_key(product_id)
+    cards = cache.get(key)
+    record('recommendations', cards is not None)
+    if cards is None:
+        # Недавно сброшенная версия каталога закрепляет чтение за основной базой (st.routers)
+        get_catalog_version()
+        items = ProductRecommendation.objects.filter(pk=product_id).values_list('items', flat=True).first() or []
+        cards = _recommended_cards({product_id: items})[product_id]
+        cache.set(key, cards, page_cache_timeout())
+    return annotate_product_prices(cards)
+
+
+async def aget_recommendations(product_id):
+    key = _cache_key(product_id)
+    cards = await cache.aget(key)
+    record('recommendations', cards is not None)
+    if cards is None:
+        await aget_catalog_version()
+        items = await ProductRecommendation.objects.filter(pk=product_id).values_list('items', flat=True).afirst() or []
+        ids = [item[0] for item in items]
+        found = await ProductCard.objects.filter(is_active=True).ain_bulk(ids) if ids else {}
+        cards = [found[pk] for pk in ids if pk in found]
+        await cache.aset(key, cards, page_cache_timeout())
+    return await aannotate_product_prices(cards)
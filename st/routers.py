@@ -0,0 +1,158 @@
+# st/routers.py
+"""
+Разделение чтения и записи между основной базой и репликами (DATABASE_ROUTERS).
+
+Чтение каталога (товары, варианты, категории, отзывы и карточки списка) идет на случайную
+доступную реплику из ST_DB_REPLICAS, остальные модели (заказы, пользователи, сессии) читаются
+из основной базы. Запись всегда идет в основную базу. Каталог тоже читается из основной базы:
+
+- внутри транзакции основной базы (оформление заказа, правки в админке): ее данные
+  на реплике еще не видны, а проверка остатков должна видеть последнюю запись;
+- после записи в каталог - до конца запроса, а затем ST_DB_REPLICA_LAG секунд по cookie
+  (st.middleware.PrimaryPinningMiddleware): допустимое отставание реплики, в течение которого
+  клиент должен видеть свои изменения;
+- в запросах любых клиентов, прочитавших версию кэша (st.versions), сброшенную меньше
+  ST_DB_REPLICA_LAG секунд назад: иначе страницы, фрагменты, фасеты и ETag под новой версией
+  строились бы по данным реплики, которая ее еще не догнала, и отдавались бы всем;
+- если ни одна реплика недоступна. Реплика проверяется запросом к своей таблице товаров
+  не чаще раза в ST_DB_REPLICA_CHECK_INTERVAL секунд; при ошибке соединения или схемы
+  она исключается до следующей проверки.
+
+Связанные объекты читаются из той же базы, что и исходный объект (подсказка instance).
+Реплика SQLite - копия файла основной базы (DJANGO_DB_REPLICAS в iat/settings.py): локально ее
+обновляет команда sync_replicas, в продакшене - внешняя репликация файла (например, LiteFS).
+"""
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Модели, которые можно читать с реплик (Model._meta.label_lower)
+REPLICA_MODELS = frozenset({'st.product', 'st.productvariant', 'st.category', 'st.review', 'st.productcard'})
+HEALTH_CHECK_SQL = 'SELECT 1 FROM st_product LIMIT 1'
+
+
+def get_replicas():
+    return getattr(settings, 'ST_DB_REPLICAS', ())
+
+
+def get_replica_lag():
+    return getattr(settings, 'ST_DB_REPLICA_LAG', 5)
+
+
+def get_check_interval():
+    return getattr(settings, 'ST_DB_REPLICA_CHECK_INTERVAL', 30)
+
+
+# --- Закрепление чтения за основной базой ---
+class _RoutingState:
+    def __init__(self, pinned=False):
+        # Читать каталог из основной базы
+        self.pinned = pinned
+        # Была запись в каталог (PrimaryPinningMiddleware ставит cookie)
+        self.wrote = False
+
+
+# Общий объект на запрос: потоки sync_to_async получают копию контекста с тем же объектом
+_state = contextvars.ContextVar('st_db_routing', default=None)
+
+
+def start_request(pinned=False):
+    """Новое состояние маршрутизации на время запроса; токен передается в end_request()."""
+    return _state.set(_RoutingState(pinned))
+
+
+def end_request(token):
+    """Восстанавливает прежнее состояние; возвращает True, если запрос писал в каталог."""
+    state = _state.get()
+    _state.reset(token)
+    return state.wrote
+
+
+def _current_state():
+    state = _state.get()
+    if state is None:
+        # Вне запроса (команды, фоновые потоки): закрепление действует до конца контекста
+        state = _RoutingState()
+        _state.set(state)
+    return state
+
+
+def _pin_to_primary():
+    state = _current_state()
+    state.pinned = state.wrote = True
+
+
+def pin_reads_to_primary():
+    """
+    Чтение каталога из основной базы до конца запроса, без cookie (сам запрос ничего не записал).
+    Вызывается st.versions, если версия кэша сброшена меньше ST_DB_REPLICA_LAG секунд назад:
+    данные реплики могут быть старше версии, и кэш под новой версией заполнился бы ими.
+    """
+    if get_replicas():
+        _current_state().pinned = True
+
+
+# --- Доступность реплик ---
+# alias -> (доступна, time.monotonic() проверки); общее для потоков процесса
+_status = {}
+
+
+def _check_replica(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(HEALTH_CHECK_SQL)
+    except DatabaseError:
+        logger.warning("Реплика %s недоступна, чтение каталога переключено", alias, exc_info=True)
+        connections[alias].close()
+        return False
+    return True
+
+
+def is_replica_available(alias):
+    available, checked_at = _status.get(alias, (None, 0.0))
+    now = time.monotonic()
+    if available is None or now - checked_at >= get_check_interval():
+        available = _check_replica(alias)
+        _status[alias] = (available, now)
+    return available
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = get_replicas()
+        if not replicas or model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        state = _state.get()
+        if (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        available = [alias for alias in replicas if is_replica_available(alias)]
+        return random.choice(available) if available else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not get_replicas():
+            return None
+        if model._meta.label_lower in REPLICA_MODELS:
+            _pin_to_primary()
+        # И для объектов, прочитанных с реплики
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с данными
+        if db in get_replicas():
+            return False
+        return None
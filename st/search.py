@@ -0,0 +1,185 @@
+# st/search.py
+"""
+Полнотекстовый поиск товаров на SQLite FTS5.
+
+Индекс - виртуальная таблица st_product_fts (rowid = id товара) с колонками name, brand,
+description и specs (пары «название: значение» из ProductSpecification). Создается миграцией 0006,
+поддерживается сигналами Product/ProductSpecification (один пересчет на транзакцию)
+и полностью перестраивается командой rebuild_search_index.
+
+Ранжирование - BM25 с весами колонок. Русская морфология: встроенный токенизатор unicode61
+приводит кириллицу к нижнему регистру, «ё» заменяется на «е», а у слов запроса отбрасываются
+типичные окончания, после чего основа ищется по префиксу («смартфоны» -> смартфон*).
+На других СУБД поиск деградирует до icontains.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .deferred import defer_on_commit
+from .models import Product, ProductSpecification
+
+FTS_TABLE = 'st_product_fts'
+# Веса BM25 для колонок name, brand, description, specs
+BM25_WEIGHTS = (10.0, 6.0, 1.0, 3.0)
+INDEX_BATCH_SIZE = 1000
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Окончания, отбрасываемые у слов запроса (от длинных к коротким)
+_RUSSIAN_ENDINGS = (
+    'иями', 'ями', 'ами', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+)
+_MIN_STEM_LENGTH = 4
+
+
+def normalize_text(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def stem_word(word):
+    """Грубое отсечение русского окончания; короткие и латинские слова не меняются."""
+    for ending in _RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match_query(query):
+    """Строка запроса пользователя -> выражение FTS5 MATCH (все слова обязательны, поиск по префиксу)."""
+    terms = [stem_word(word) for word in _WORD_RE.findall(normalize_text(query))]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+def search_available(using=None):
+    using = using or router.db_for_read(Product)
+    return connections[using].vendor == 'sqlite'
+
+
+# --- Индексация ---
+def index_products(product_ids, using=None):
+    """
+    Переиндексирует товары с указанными id (удаленные товары убираются из индекса).
+    Используется как callback для defer_on_commit: на пачку - два запроса на чтение и два на запись.
+    """
+    using = using or router.db_for_write(Product)
+    if not search_available(using):
+        return
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+        _index_batch(product_ids[start:start + INDEX_BATCH_SIZE], using)
+
+
+def _index_batch(product_ids, using):
+    products = Product.objects.using(using).filter(pk__in=product_ids).values_list('pk', 'name', 'brand', 'description')
+    specs = {}
+    spec_rows = (
+        ProductSpecification.objects.using(using).filter(product_id__in=product_ids)
+        .order_by('product_id', 'name').values_list('product_id', 'name', 'value')
+    )
+    for product_id, name, value in spec_rows:
+        specs.setdefault(product_id, []).append(f'{name}: {value}')
+
+    rows = [
+        (pk, normalize_text(name), normalize_text(brand), normalize_text(description), normalize_text('\n'.join(specs.get(pk, []))))
+        for pk, name, brand, description in products
+    ]
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, brand, description, specs) VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+
+def rebuild_search_index(batch_size=INDEX_BATCH_SIZE, using=None):
+    """Полная перестройка индекса пачками. Возвращает число проиндексированных товаров."""
+    using = using or router.db_for_write(Product)
+    if not search_available(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    total = 0
+    batch = []
+    for pk in Product.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            _index_batch(batch, using)
+            total += len(batch)
+            batch = []
+    if batch:
+        _index_batch(batch, using)
+        total += len(batch)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+# --- Поиск ---
+def search_product_ids(query, limit=20, offset=0, active_only=True):
+    """
+    Возвращает список (id товара, релевантность) в порядке убывания релевантности.
+    Релевантность - BM25 со знаком минус (больше - лучше).
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    using = router.db_for_read(Product)
+    if not search_available(using):
+        products = Product.active_products.all() if active_only else Product.objects.all()
+        products = products.filter(
+            Q(name__icontains=query) | Q(brand__icontains=query) | Q(description__icontains=query)
+        )
+        return [(pk, 0.0) for pk in products.values_list('pk', flat=True)[offset:offset + limit]]
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    active_filter = 'AND p.is_active' if active_only else ''
+    sql = (
+        f'SELECT f.rowid, -bm25({FTS_TABLE}, {weights}) AS score '
+        f'FROM {FTS_TABLE} f JOIN st_product p ON p.id = f.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s {active_filter} '
+        f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s'
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [match, limit, offset])
+        return cursor.fetchall()
+
+
+def search_products(query, limit=20, offset=0, active_only=True):
+    """Товары (с tech_type), упорядоченные по релевантности; у каждого заполнен атрибут search_score."""
+    ranked = search_product_ids(query, limit=limit, offset=offset, active_only=active_only)
+    return _ranked_products(ranked, Product.objects.select_related('tech_type').in_bulk([pk for pk, _ in ranked]))
+
+
+async def asearch_products(query, limit=20, offset=0, active_only=True):
+    """search_products() для асинхронных вьюх. Запрос к FTS - сырой SQL через курсор, поэтому в sync_to_async."""
+    ranked = await sync_to_async(search_product_ids)(query, limit=limit, offset=offset, active_only=active_only)
+    return _ranked_products(ranked, await Product.objects.select_related('tech_type').ain_bulk([pk for pk, _ in ranked]))
+
+
+def _ranked_products(ranked, products):
+    results = []
+    for pk, score in ranked:
+        if pk in products:
+            product = products[pk]
+            product.search_score = score
+            results.append(product)
+    return results
+
+
+# --- Синхронизация индекса ---
+@receiver([post_save, post_delete], sender=Product)
+def product_search_receiver(sender, instance, using=None, **kwargs):
+    defer_on_commit(index_products, [instance.pk], using=using)
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def specification_search_receiver(sender, instance, using=None, **kwargs):
+    defer_on_commit(index_products, [instance.product_id], using=using)
@@ -0,0 +1,272 @@
+# st/seeding.py
+"""
+Генератор синтетических данных магазина для нагрузочного тестирования (команда seed_store).
+
+Данные детерминированы: один и тот же seed дает один и тот же каталог. Все строки создаются
+через bulk_create пачками, каждая пачка - в своей транзакции; сигналы моделей не вызываются.
+Производные данные согласованы сразу: сводка рейтинга товара считается по сгенерированным
+отзывам, а Order.total_price - по сгенерированным позициям. Поисковый индекс, карточки товаров,
+сводки продаж и версия каталога обновляются в конце (команда seed_store).
+
+Уникальность соблюдается по построению: SKU и логины содержат префикс запуска (seed<N>),
+справочники (типы, цвета, размеры) переиспользуются по названию, а отзывы и избранное
+выбираются без повторов пар (пользователь, товар).
+"""
+import random
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    RATING_STARS, Category, Color, Favorite, Order, OrderItem, Product, ProductSpecification,
+    ProductVariant, Promo, PromoProduct, Review, Size, TechType, User,
+)
+
+TECH_TYPES = ('Смартфоны', 'Ноутбуки', 'Планшеты', 'Наушники', 'Телевизоры', 'Умные часы', 'Фотоаппараты', 'Мониторы')
+BRANDS = ('Apple', 'Samsung', 'Xiaomi', 'Sony', 'Lenovo', 'Huawei', 'Asus', 'Acer', 'LG', 'Philips')
+COLORS = (
+    ('Черный', '#000000'), ('Белый', '#FFFFFF'), ('Серебристый', '#C0C0C0'), ('Золотой', '#FFD700'),
+    ('Синий', '#0000FF'), ('Красный', '#FF0000'), ('Зеленый', '#008000'), ('Серый', '#808080'),
+)
+SIZES = ('64 ГБ', '128 ГБ', '256 ГБ', '512 ГБ', '1 ТБ', '2 ТБ')
+SPEC_NAMES = ('Экран', 'Процессор', 'Память', 'Аккумулятор', 'Вес', 'Гарантия')
+WORDS = ('быстрый', 'легкий', 'надежный', 'мощный', 'тонкий', 'яркий', 'тихий', 'компактный', 'новый', 'стильный')
+# Распределение оценок в отзывах (1..5 звезд)
+RATING_WEIGHTS = (5, 7, 15, 33, 40)
+ORDER_HISTORY_DAYS = 365
+
+
+def _distribute(total, buckets):
+    """Количество на i-ю корзину при равномерном распределении total по buckets."""
+    base, extra = divmod(total, buckets) if buckets else (0, 0)
+    return lambda i: base + (1 if i < extra else 0)
+
+
+class StoreSeeder:
+    def __init__(self, products=1000, variants_per_product=5, reviews=10000, users=1000, favorites=5000,
+                 orders=2000, items_per_order=3, categories=30, promos=10, products_per_promo=100,
+                 batch_size=5000, seed=0, log=None):
+        self.counts = {
+            'products': products, 'variants_per_product': variants_per_product, 'reviews': reviews,
+            'users': users, 'favorites': favorites, 'orders': orders, 'items_per_order': items_per_order,
+            'categories': categories, 'promos': promos, 'products_per_promo': products_per_promo,
+        }
+        self.batch_size = batch_size
+        self.seed = seed
+        self.rnd = random.Random(seed)
+        self.prefix = f'seed{seed}'
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        # id созданных строк, на которые ссылаются следующие этапы (компактно, без объектов)
+        self.user_ids = array('q')
+        self.product_ids = array('q')
+        self.variant_ids = array('q')
+        self.variant_prices = array('q')  # в копейках
+
+    def check_conflicts(self):
+        """Имя запуска уже использовано (тот же seed): генерация дала бы дубликаты SKU и логинов."""
+        return (
+            User.objects.filter(username__startswith=f'{self.prefix}_').exists()
+            or ProductVariant.objects.filter(sku__startswith=f'{self.prefix.upper()}-').exists()
+        )
+
+    def run(self):
+        c = self.counts
+        if c['reviews'] and c['products'] and -(-c['reviews'] // c['products']) > c['users']:
+            raise ValueError("Отзывов на товар больше, чем пользователей: пары (пользователь, товар) повторятся.")
+        if c['favorites'] and c['users'] and -(-c['favorites'] // c['users']) > c['products']:
+            raise ValueError("Избранных на пользователя больше, чем товаров.")
+        self.seed_reference_data()
+        self.seed_users()
+        self.seed_categories()
+        self.seed_products()
+        self.seed_favorites()
+        self.seed_orders()
+        self.seed_promos()
+        return {
+            'users': len(self.user_ids), 'products': len(self.product_ids), 'variants': len(self.variant_ids),
+        }
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    # --- Справочники ---
+    def seed_reference_data(self):
+        self.tech_type_ids = [TechType.objects.get_or_create(name=name)[0].pk for name in TECH_TYPES]
+        self.color_ids = []
+        for name, hex_code in COLORS:
+            color = Color.objects.filter(name=name).first() or Color.objects.filter(hex_code=hex_code).first()
+            self.color_ids.append((color or Color.objects.create(name=name, hex_code=hex_code)).pk)
+        self.size_ids = [Size.objects.get_or_create(name=name)[0].pk for name in SIZES]
+        self.log(f"Справочники: {len(self.tech_type_ids)} типов, {len(self.color_ids)} цветов, {len(self.size_ids)} размеров")
+
+    def seed_users(self):
+        for start, end in self._batches(self.counts['users']):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    User(
+                        username=f'{self.prefix}_user{i}', email=f'{self.prefix}_user{i}@example.com',
+                        first_name=f'Пользователь {i}', password='!',  # «!» - непригодный для входа пароль
+                        date_joined=self.now - timedelta(days=self.rnd.randrange(ORDER_HISTORY_DAYS * 2)),
+                    )
+                    for i in range(start, end)
+                )
+            self.user_ids.extend(user.pk for user in users)
+        self.log(f"Пользователи: {len(self.user_ids)}")
+
+    def seed_categories(self):
+        # Немного категорий: создаются через save(), чтобы заполнить материализованный путь
+        self.category_ids = []
+        with transaction.atomic():
+            for i in range(self.counts['categories']):
+                parent_id = self.rnd.choice(self.category_ids) if self.category_ids and i % 3 else None
+                category = Category.objects.create(name=f'{self.prefix} Категория {i}', parent_id=parent_id)
+                self.category_ids.append(category.pk)
+        self.log(f"Категории: {len(self.category_ids)}")
+
+    # --- Товары с вариантами, характеристиками, категориями и отзывами ---
+    def seed_products(self):
+        c = self.counts
+        reviews_for = _distribute(c['reviews'], c['products'])
+        for start, end in self._batches(c['products']):
+            with transaction.atomic():
+                self._seed_product_batch(start, end, reviews_for)
+            self.log(f"Товары: {end} из {c['products']}")
+
+    def _seed_product_batch(self, start, end, reviews_for):
+        rnd = self.rnd
+        products, product_reviews = [], []
+        for i in range(start, end):
+            # Отзывы генерируем заранее, чтобы сразу сохранить сводку рейтинга товара
+            reviews = []
+            histogram = dict.fromkeys(RATING_STARS, 0)
+            if self.user_ids:
+                for user_index in rnd.sample(range(len(self.user_ids)), reviews_for(i)):
+                    rating = rnd.choices(RATING_STARS, RATING_WEIGHTS)[0]
+                    is_moderated = rnd.random() < 0.9
+                    if is_moderated:
+                        histogram[rating] += 1
+                    reviews.append((self.user_ids[user_index], rating, is_moderated))
+            product = Product(
+                name=f'{rnd.choice(WORDS).capitalize()} модель {i}',
+                brand=rnd.choice(BRANDS),
+                description=' '.join(rnd.choice(WORDS) for _ in range(30)),
+                is_active=rnd.random() < 0.95,
+                created_at=self.now - timedelta(minutes=(self.counts['products'] - i)),
+                tech_type_id=rnd.choice(self.tech_type_ids),
+            )
+            product.set_rating_histogram(histogram)
+            products.append(product)
+            product_reviews.append(reviews)
+
+        products = Product.objects.bulk_create(products, batch_size=self.batch_size)
+        through = Product.categories.through
+        links, specs, variants, reviews = [], [], [], []
+        combinations = [(color, size) for color in self.color_ids for size in self.size_ids]
+        for product, product_review_rows in zip(products, product_reviews):
+            self.product_ids.append(product.pk)
+            if self.category_ids:
+                for category_id in rnd.sample(self.category_ids, min(2, len(self.category_ids))):
+                    links.append(through(product_id=product.pk, category_id=category_id))
+            for name in rnd.sample(SPEC_NAMES, 3):
+                specs.append(ProductSpecification(product_id=product.pk, name=name, value=f'{rnd.randint(1, 999)}'))
+            # (product, color, size) уникальны: берем разные сочетания
+            for j, (color_id, size_id) in enumerate(rnd.sample(combinations, min(self.counts['variants_per_product'], len(combinations)))):
+                variants.append(ProductVariant(
+                    product_id=product.pk, color_id=color_id, size_id=size_id,
+                    price=Decimal(rnd.randint(500, 300000)), stock_quantity=rnd.randint(0, 200),
+                    sku=f'{self.prefix.upper()}-{product.pk}-{j}',
+                ))
+            for user_id, rating, is_moderated in product_review_rows:
+                reviews.append(Review(
+                    user_id=user_id, product_id=product.pk, rating=rating, comment=rnd.choice(WORDS),
+                    is_moderated=is_moderated, created_at=self.now - timedelta(days=rnd.randrange(ORDER_HISTORY_DAYS)),
+                ))
+        through.objects.bulk_create(links, batch_size=self.batch_size)
+        ProductSpecification.objects.bulk_create(specs, batch_size=self.batch_size)
+        for variant in ProductVariant.objects.bulk_create(variants, batch_size=self.batch_size):
+            self.variant_ids.append(variant.pk)
+            self.variant_prices.append(int(variant.price * 100))
+        Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+
+    def seed_favorites(self):
+        c = self.counts
+        if not self.product_ids:
+            return
+        favorites_for = _distribute(c['favorites'], c['users'])
+        for start, end in self._batches(len(self.user_ids)):
+            with transaction.atomic():
+                Favorite.objects.bulk_create(
+                    (
+                        Favorite(user_id=self.user_ids[i], product_id=self.product_ids[product_index])
+                        for i in range(start, end)
+                        for product_index in self.rnd.sample(range(len(self.product_ids)), favorites_for(i))
+                    ),
+                    batch_size=self.batch_size,
+                )
+        self.log(f"Избранное: {c['favorites']}")
+
+    # --- Заказы с позициями ---
+    def seed_orders(self):
+        c = self.counts
+        if not self.variant_ids:
+            return
+        rnd = self.rnd
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        payments = [method for method, _ in Order.PAYMENT_METHOD_CHOICES]
+        max_items = max(1, 2 * c['items_per_order'] - 1)
+        for start, end in self._batches(c['orders']):
+            orders, order_items = [], []
+            for i in range(start, end):
+                items = []
+                for variant_index in rnd.sample(range(len(self.variant_ids)), min(rnd.randint(1, max_items), len(self.variant_ids))):
+                    items.append((self.variant_ids[variant_index], rnd.randint(1, 3), self.variant_prices[variant_index]))
+                is_guest = rnd.random() < 0.2
+                orders.append(Order(
+                    user_id=None if is_guest or not self.user_ids else rnd.choice(self.user_ids),
+                    guest_name=f'Гость {i}' if is_guest else None,
+                    guest_email=f'{self.prefix}_guest{i}@example.com' if is_guest else None,
+                    order_date=self.now - timedelta(seconds=rnd.randrange(ORDER_HISTORY_DAYS * 86400)),
+                    status=rnd.choice(statuses), payment_method=rnd.choice(payments),
+                    shipping_address=f'г. Москва, ул. Тестовая, д. {i % 500 + 1}',
+                    # Итог считается здесь же: пересчет по сигналам для bulk_create не нужен
+                    total_price=Decimal(sum(quantity * price for _, quantity, price in items)) / 100,
+                ))
+                order_items.append(items)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(orders, batch_size=self.batch_size)
+                # _base_manager: обычный bulk_create без отложенного пересчета итогов (они уже верны)
+                OrderItem._base_manager.bulk_create(
+                    (
+                        OrderItem(order_id=order.pk, variant_id=variant_id, quantity=quantity,
+                                  price_at_time=Decimal(price) / 100)
+                        for order, items in zip(orders, order_items)
+                        for variant_id, quantity, price in items
+                    ),
+                    batch_size=self.batch_size,
+                )
+            self.log(f"Заказы: {end} из {c['orders']}")
+
+    def seed_promos(self):
+        c = self.counts
+        if not self.product_ids:
+            return
+        today = self.now.date()
+        with transaction.atomic():
+            for i in range(c['promos']):
+                start_date = today + timedelta(days=self.rnd.randint(-60, 30))
+                promo = Promo.objects.create(
+                    title=f'{self.prefix} Акция {i}', discount_percent=Decimal(self.rnd.choice((5, 10, 15, 20, 30))),
+                    start_date=start_date, end_date=start_date + timedelta(days=self.rnd.randint(3, 60)),
+                    is_active=self.rnd.random() < 0.9,
+                )
+                product_indexes = self.rnd.sample(range(len(self.product_ids)), min(c['products_per_promo'], len(self.product_ids)))
+                PromoProduct.objects.bulk_create(
+                    (PromoProduct(promo=promo, product_id=self.product_ids[index]) for index in product_indexes),
+                    batch_size=self.batch_size,
+                )
+        self.log(f"Промоакции: {c['promos']}")
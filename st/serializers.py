@@ -0,0 +1,155 @@
+# st/serializers.py
+"""
+Сериализаторы JSON API каталога (только чтение, см. st/api.py).
+
+Состав полей выбирает клиент: fields оставляет только перечисленные поля, include разворачивает
+связи во вложенные объекты (без include связь - это id или отсутствует вовсе). Связи, которые
+не запрошены, не попадают ни в ответ, ни в запросы к БД: вьюха строит queryset по тому же набору.
+
+Ответ собирается за один проход по заранее составленному плану полей: простые атрибуты
+читаются напрямую, без get_attribute()/to_representation() DRF на каждое поле каждого объекта.
+На страницах из сотен товаров с вариантами это основная часть времени сериализации.
+"""
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from .models import Category, Product, ProductSpecification, ProductVariant, Review, TechType
+
+# Поля, у которых to_representation() для значения из модели - тождественное преобразование
+_PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.FloatField)
+
+
+class FieldsetSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer с выбором полей клиентом и быстрым to_representation().
+
+    fields - набор имен полей (None - все поля Meta.fields), include - имена связей из
+    expandable_fields, nested - {имя связи: набор полей вложенного объекта}.
+    """
+    # имя связи -> (класс сериализатора, аргументы); без include поле связи остается как в Meta.fields
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, include=(), nested=None, **kwargs):
+        self.requested_fields = fields
+        self.requested_include = set(include)
+        self.requested_nested = nested or {}
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.requested_include:
+            serializer_class, options = self.expandable_fields[name]
+            fields[name] = serializer_class(fields=self.requested_nested.get(name), read_only=True, **options)
+        if self.requested_fields is not None:
+            keep = set(self.requested_fields) | self.requested_include
+            fields = {name: field for name, field in fields.items() if name in keep}
+        return fields
+
+    def get_uniqueness_extra_kwargs(self, field_names, declared_fields, extra_kwargs):
+        # Только чтение: поля из unique_together не должны превращаться в HiddenField
+        return extra_kwargs, {}
+
+    @classmethod
+    def available_fields(cls):
+        return set(cls.Meta.fields) | set(cls.expandable_fields)
+
+    @cached_property
+    def _representation_plan(self):
+        # (имя, атрибут модели или None, поле); план общий для всех объектов ListSerializer
+        plan = []
+        for field in self._readable_fields:
+            simple = type(field) in _PASSTHROUGH_FIELDS and len(field.source_attrs) == 1
+            plan.append((field.field_name, field.source_attrs[0] if simple else None, field))
+        return plan
+
+    def to_representation(self, instance):
+        data = {}
+        for name, attname, field in self._representation_plan:
+            if attname is not None:
+                data[name] = getattr(instance, attname)
+                continue
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            check = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            data[name] = None if check is None else field.to_representation(attribute)
+        return data
+
+
+class TechTypeSerializer(FieldsetSerializer):
+    class Meta:
+        model = TechType
+        fields = ['id', 'name']
+
+
+class CategorySerializer(FieldsetSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'full_name', 'parent', 'depth', 'description']
+
+
+class SpecificationSerializer(FieldsetSerializer):
+    class Meta:
+        model = ProductSpecification
+        fields = ['name', 'value']
+
+
+class VariantSerializer(FieldsetSerializer):
+    color = serializers.CharField(source='color.name', default=None)
+    color_hex = serializers.CharField(source='color.hex_code', default=None)
+    size = serializers.CharField(source='size.name', default=None)
+    # Точный остаток не отдается: «в наличии» меняется только при распродаже, а с ним и ETag
+    in_stock = serializers.SerializerMethodField()
+    discount_percent = serializers.DecimalField(max_digits=5, decimal_places=2, default=None)
+    final_price = serializers.DecimalField(max_digits=10, decimal_places=2, default=None)
+
+    # Поля, которым нужны связанные таблицы или расчет скидок (вьюха добавляет их в queryset)
+    RELATED_FIELDS = {'color': 'color', 'color_hex': 'color', 'size': 'size'}
+    PRICE_FIELDS = {'discount_percent', 'final_price'}
+
+    class Meta:
+        model = ProductVariant
+        fields = [
+            'id', 'product', 'sku', 'color', 'color_hex', 'size', 'price',
+            'discount_percent', 'final_price', 'in_stock', 'image',
+        ]
+
+    def get_in_stock(self, variant):
+        return variant.stock_quantity > 0
+
+
+class ReviewSerializer(FieldsetSerializer):
+    user = serializers.CharField(source='user.username')
+
+    class Meta:
+        model = Review
+        fields = ['id', 'product', 'user', 'rating', 'comment', 'created_at']
+
+
+class ProductSerializer(FieldsetSerializer):
+    url = serializers.SerializerMethodField()
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, default=None)
+    discount_percent = serializers.DecimalField(max_digits=5, decimal_places=2, default=None)
+    final_min_price = serializers.DecimalField(max_digits=10, decimal_places=2, default=None)
+
+    PRICE_FIELDS = {'min_price', 'discount_percent', 'final_min_price'}
+
+    expandable_fields = {
+        'tech_type': (TechTypeSerializer, {}),
+        'categories': (CategorySerializer, {'many': True}),
+        'specifications': (SpecificationSerializer, {'many': True}),
+        'variants': (VariantSerializer, {'many': True}),
+    }
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'brand', 'description', 'tech_type', 'url', 'manufacturer_url', 'created_at',
+            'rating_avg', 'rating_count', 'min_price', 'discount_percent', 'final_min_price',
+        ]
+
+    def get_url(self, product):
+        return product.get_absolute_url()
@@ -0,0 +1,56 @@
+# st/templatetags/st_cache.py
+"""
+{% cache %} с учетом попаданий и промахов в st.metrics (метка fragment:<имя фрагмента>).
+Синтаксис и ключи - как у встроенного тега: {% load st_cache %} подменяет его в шаблоне.
+
+Переменная контекста cached_fragments ({ключ фрагмента: HTML}) - фрагменты, заранее прочитанные
+из кэша асинхронной вьюхой (st.views): тогда тег не обращается к синхронному API кэша, блокирующему
+цикл событий. Найденный фрагмент выводится без повторного чтения (вытесненный после проверки
+фрагмент не рендерится без данных, которые вьюха не загрузила), отсутствующий рендерится
+и попадает в rendered_fragments ({ключ: HTML}) - вьюха записывает его в кэш сама (aset_many).
+"""
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Library, Node, NodeList
+from django.templatetags.cache import CacheNode, do_cache
+
+from st.pagecache import record
+
+register = Library()
+
+
+class _MissMarker(Node):
+    """Отмечает в render_context, что содержимое фрагмента пришлось рендерить (промах кэша)."""
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        context.render_context[self] = True
+        return self.nodelist.render(context)
+
+
+class MeteredCacheNode(CacheNode):
+    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on, cache_name):
+        self.marker = _MissMarker(nodelist)
+        super().__init__(NodeList([self.marker]), expire_time_var, fragment_name, vary_on, cache_name)
+
+    def render(self, context):
+        prefetched = context.get('cached_fragments')
+        if prefetched is not None:
+            key = make_template_fragment_key(self.fragment_name, [var.resolve(context) for var in self.vary_on])
+            record(f'fragment:{self.fragment_name}', key in prefetched)
+            if key in prefetched:
+                return prefetched[key]
+            value = self.marker.nodelist.render(context)
+            context['rendered_fragments'][key] = value
+            return value
+        context.render_context[self.marker] = False
+        value = super().render(context)
+        record(f'fragment:{self.fragment_name}', not context.render_context[self.marker])
+        return value
+
+
+@register.tag('cache')
+def do_metered_cache(parser, token):
+    node = do_cache(parser, token)
+    return MeteredCacheNode(node.nodelist, node.expire_time_var, node.fragment_name, node.vary_on, node.cache_name)
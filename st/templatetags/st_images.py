@@ -0,0 +1,15 @@
+# st/templatetags/st_images.py
+"""
+{% thumbnail image image_hash size [alt] [style] %} - <picture> с WebP- и JPEG-миниатюрами
+изображения (st.thumbnails), вписанными в рамку size px.
+"""
+from django.template import Library
+
+from st.thumbnails import thumbnail_html
+
+register = Library()
+
+
+@register.simple_tag
+def thumbnail(image, image_hash, size, alt='', style=''):
+    return thumbnail_html(image, image_hash, int(size), alt, style)
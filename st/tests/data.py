@@ -0,0 +1,158 @@
+# st/tests/data.py
+"""
+Наполнение тестовой БД данными реалистичного объема для проверок числа запросов.
+
+Объем задается множителем scale (по умолчанию - переменная окружения ST_PERF_SCALE, иначе 1).
+При scale=1 в каждой таблице со ссылками на другие модели больше 100 строк: полная страница
+списка админки заполнена, поэтому любой запрос «на строку» заметен.
+Данные создаются через bulk_create, производные поля (итоги заказов, сводка рейтинга,
+пути категорий, поисковый индекс, карточки товаров, сводки продаж) пересчитываются явно.
+"""
+import os
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from st.models import (
+    Category, Color, Favorite, Order, OrderItem, Product, ProductSpecification, ProductVariant,
+    Promo, PromoProduct, Review, Size, TechType, User,
+)
+from st.analytics import rebuild_sales_rollups
+from st.cards import rebuild_product_cards
+from st.search import rebuild_search_index
+
+PRODUCTS = 120
+VARIANTS_PER_PRODUCT = 3
+SPECS_PER_PRODUCT = 2
+USERS = 30
+REVIEWS_PER_PRODUCT = 4
+FAVORITES_PER_USER = 4
+ORDERS = 120
+ITEMS_PER_ORDER = 5
+PROMOS = 3
+PRODUCTS_PER_PROMO = 40
+
+
+def default_scale():
+    return int(os.environ.get('ST_PERF_SCALE', 1))
+
+
+def seed_store(scale=None, seed=0):
+    """Создает связанные данные по всем моделям st. Возвращает словарь с созданными объектами."""
+    scale = scale or default_scale()
+    rnd = random.Random(seed)
+    now = timezone.now()
+
+    admin = User.objects.create_superuser('perf_admin', 'perf_admin@example.com', 'perf-password')
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com') for i in range(USERS * scale)
+    )
+
+    tech_types = TechType.objects.bulk_create(
+        TechType(name=name) for name in ('Смартфоны', 'Ноутбуки', 'Планшеты', 'Наушники', 'Телевизоры')
+    )
+    colors = Color.objects.bulk_create(
+        Color(name=f'Цвет {i}', hex_code=f'#{i:06X}') for i in range(8)
+    )
+    sizes = Size.objects.bulk_create(Size(name=f'{2 ** i * 64} ГБ') for i in range(6))
+
+    # Дерево категорий: 3 корня по 3 потомка второго уровня, у каждого по одному третьего уровня
+    categories = []
+    for i in range(3):
+        root = Category.objects.create(name=f'Раздел {i}')
+        categories.append(root)
+        for j in range(3):
+            child = Category.objects.create(name=f'Подраздел {i}.{j}', parent=root)
+            leaf = Category.objects.create(name=f'Группа {i}.{j}', parent=child)
+            categories.extend([child, leaf])
+
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Товар {i}',
+            brand=rnd.choice(['Apple', 'Samsung', 'Xiaomi', 'Sony', 'Lenovo']),
+            description=f'Описание товара {i}. ' * 5,
+            tech_type=rnd.choice(tech_types),
+            created_at=now - timedelta(hours=i),
+            manufacturer_url='https://example.com' if i % 2 else None,
+        )
+        for i in range(PRODUCTS * scale)
+    )
+    Product.categories.through.objects.bulk_create(
+        Product.categories.through(product_id=product.pk, category_id=category.pk)
+        for product in products
+        for category in rnd.sample(categories, 2)
+    )
+    ProductSpecification.objects.bulk_create(
+        ProductSpecification(product=product, name=f'Параметр {j}', value=f'Значение {j}')
+        for product in products
+        for j in range(SPECS_PER_PRODUCT)
+    )
+    variants = ProductVariant.objects.bulk_create(
+        ProductVariant(
+            product=product,
+            color=colors[j % len(colors)],
+            size=sizes[j % len(sizes)],
+            price=Decimal(rnd.randint(1000, 200000)),
+            stock_quantity=rnd.randint(0, 50),
+            sku=f'SKU-{product.pk}-{j}',
+        )
+        for product in products
+        for j in range(VARIANTS_PER_PRODUCT)
+    )
+
+    reviews = []
+    for product in products:
+        for user in rnd.sample(users, min(REVIEWS_PER_PRODUCT, len(users))):
+            reviews.append(Review(
+                user=user, product=product, rating=rnd.randint(1, 5),
+                comment='Отзыв', is_moderated=rnd.random() < 0.8,
+            ))
+    Review.objects.bulk_create(reviews)
+    Favorite.objects.bulk_create(
+        Favorite(user=user, product=product)
+        for user in users
+        for product in rnd.sample(products, FAVORITES_PER_USER)
+    )
+
+    orders = Order.objects.bulk_create(
+        Order(
+            user=rnd.choice(users) if i % 4 else None,
+            guest_name=None if i % 4 else f'Гость {i}',
+            guest_email=None if i % 4 else f'guest{i}@example.com',
+            shipping_address=f'Адрес {i}',
+            status=rnd.choice(Order.STATUS_CHOICES)[0],
+        )
+        for i in range(ORDERS * scale)
+    )
+    items = []
+    for order in orders:
+        for variant in rnd.sample(variants, ITEMS_PER_ORDER):
+            items.append(OrderItem(order=order, variant=variant, quantity=rnd.randint(1, 3), price_at_time=variant.price))
+    OrderItem.objects.bulk_create(items)
+
+    today = now.date()
+    promos = Promo.objects.bulk_create(
+        Promo(title=f'Акция {i}', discount_percent=Decimal(5 * (i + 1)),
+              start_date=today - timedelta(days=3), end_date=today + timedelta(days=3 + i))
+        for i in range(PROMOS)
+    )
+    PromoProduct.objects.bulk_create(
+        PromoProduct(promo=promo, product=product)
+        for promo in promos
+        for product in rnd.sample(products, PRODUCTS_PER_PROMO)
+    )
+
+    # bulk_create не отправляет сигналы: производные данные пересчитываем явно
+    Order.objects.all().recalculate_totals()
+    Product.objects.all().rebuild_rating_summaries()
+    rebuild_search_index()
+    rebuild_product_cards()
+    rebuild_sales_rollups()
+
+    return {
+        'admin': admin, 'users': users, 'tech_types': tech_types, 'categories': categories,
+        'colors': colors, 'sizes': sizes, 'products': products, 'variants': variants,
+        'orders': orders, 'promos': promos,
+    }
@@ -0,0 +1,90 @@
+# st/tests/perf.py
+"""
+Базовый класс проверок «бюджета» SQL-запросов и времени ответа.
+
+measure() выполняет запрос, проверяет статус и то, что число SQL-запросов не превышает бюджет,
+и замеряет время ответа (медиана нескольких повторов). Все замеры прогона дописываются строками
+JSON в файл ST_PERF_RESULTS (по умолчанию perf_results.jsonl в корне проекта), чтобы прогоны
+можно было сравнивать между собой.
+"""
+import json
+import os
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+RUN_ID = uuid.uuid4().hex[:12]
+RUN_STARTED_AT = timezone.now().isoformat()
+LATENCY_REPEATS = int(os.environ.get('ST_PERF_REPEATS', 3))
+
+
+def results_path():
+    return os.environ.get('ST_PERF_RESULTS') or os.path.join(settings.BASE_DIR, 'perf_results.jsonl')
+
+
+class QueryBudgetTestCase(TestCase):
+    """TestCase с measure(); результаты класса записываются в файл в tearDownClass."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.perf_results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.perf_results:
+            with open(results_path(), 'a', encoding='utf-8') as f:
+                for row in cls.perf_results:
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        # Холодный кэш: число запросов не должно зависеть от порядка тестов
+        cache.clear()
+
+    def measure(self, name, url, budget, data=None, status=200):
+        """GET url: проверяет статус и бюджет запросов (замер на холодном кэше), затем время ответа."""
+        # Журнал запросов ограничен по длине: очищаем, чтобы подсчет не упирался в его предел
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+            # Потоковые ответы (FileResponse) дочитываем, чтобы учесть всю работу
+            if response.streaming:
+                b''.join(response.streaming_content)
+        # captured_queries читается из журнала соединения, который следующие запросы очистят
+        captured = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(response.status_code, status, f"{name}: {url}")
+
+        timings = []
+        for _ in range(LATENCY_REPEATS):
+            cache.clear()
+            started = time.perf_counter()
+            repeat = self.client.get(url, data)
+            if repeat.streaming:
+                b''.join(repeat.streaming_content)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        self.perf_results.append({
+            'run': RUN_ID,
+            'started_at': RUN_STARTED_AT,
+            'test': f'{type(self).__name__}.{self._testMethodName}',
+            'name': name,
+            'url': url,
+            'queries': len(captured),
+            'budget': budget,
+            'ms_median': round(statistics.median(timings), 3) if timings else None,
+            'ms_min': round(min(timings), 3) if timings else None,
+        })
+        self.assertLessEqual(
+            len(captured), budget,
+            f"{name}: {len(captured)} SQL-запросов при бюджете {budget}:\n" + '\n'.join(captured),
+        )
+        return response
@@ -0,0 +1,129 @@
+# st/tests/test_admin.py
+"""Бюджеты SQL-запросов для списков, форм добавления и изменения всех моделей st в админке."""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from st.models import Order, OrderItem, Product, ProductSpecification, ProductVariant, Promo, PromoProduct
+
+from .data import seed_store
+from .perf import QueryBudgetTestCase
+
+ADMIN_VIEWS = ('changelist', 'add', 'change')
+
+
+class AdminQueryBudgetTests(QueryBudgetTestCase):
+    # (модель, страница) -> максимально допустимое число SQL-запросов при данных seed_store().
+    # Списки и формы изменения не зависят от числа строк (см. test_changelist_queries_do_not_grow_with_page_size
+    # и test_change_form_queries_do_not_grow_with_inline_rows).
+    BUDGETS = {
+        ('user', 'changelist'): 7, ('user', 'add'): 5, ('user', 'change'): 7,
+        ('techtype', 'changelist'): 5, ('techtype', 'add'): 3, ('techtype', 'change'): 3,
+        ('category', 'changelist'): 6, ('category', 'add'): 3, ('category', 'change'): 3,
+        ('product', 'changelist'): 10, ('product', 'add'): 5, ('product', 'change'): 8,
+        ('productspecification', 'changelist'): 7, ('productspecification', 'add'): 3,
+        ('productspecification', 'change'): 5,
+        ('color', 'changelist'): 5, ('color', 'add'): 3, ('color', 'change'): 3,
+        ('size', 'changelist'): 5, ('size', 'add'): 3, ('size', 'change'): 3,
+        ('productvariant', 'changelist'): 9, ('productvariant', 'add'): 3, ('productvariant', 'change'): 9,
+        ('review', 'changelist'): 9, ('review', 'add'): 3, ('review', 'change'): 7,
+        ('favorite', 'changelist'): 5, ('favorite', 'add'): 3, ('favorite', 'change'): 7,
+        ('order', 'changelist'): 8, ('order', 'add'): 3, ('order', 'change'): 5,
+        ('orderitem', 'changelist'): 6, ('orderitem', 'add'): 3, ('orderitem', 'change'): 10,
+        ('promo', 'changelist'): 7, ('promo', 'add'): 3, ('promo', 'change'): 4,
+        ('promoproduct', 'changelist'): 5, ('promoproduct', 'add'): 3, ('promoproduct', 'change'): 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_store()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.data['admin'])
+
+    def registered_models(self):
+        return [model for model in admin.site._registry if model._meta.app_label == 'st']
+
+    def test_every_admin_page_has_budget(self):
+        pages = {(model._meta.model_name, view) for model in self.registered_models() for view in ADMIN_VIEWS}
+        self.assertEqual(pages - set(self.BUDGETS), set(), "Для новых страниц админки нужно задать бюджет запросов")
+
+    def test_admin_pages(self):
+        for model in self.registered_models():
+            opts = model._meta
+            obj = model._default_manager.order_by('pk').first()
+            for view in ADMIN_VIEWS:
+                if view == 'change':
+                    self.assertIsNotNone(obj, f"Нет данных для {opts.model_name}")
+                    url = reverse(f'admin:{opts.app_label}_{opts.model_name}_change', args=[obj.pk])
+                else:
+                    url = reverse(f'admin:{opts.app_label}_{opts.model_name}_{view}')
+                with self.subTest(model=opts.model_name, view=view):
+                    self.measure(f'admin:{opts.model_name}_{view}', url, self.BUDGETS[(opts.model_name, view)])
+
+    def test_changelist_queries_do_not_grow_with_page_size(self):
+        """Страница из 100 строк стоит столько же запросов, сколько из 10."""
+        for model in self.registered_models():
+            opts = model._meta
+            if model._default_manager.count() <= 10:
+                continue
+            url = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+            counts = []
+            for per_page in (10, 100):
+                with mock.patch.object(admin.site._registry[model], 'list_per_page', per_page):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            with self.subTest(model=opts.model_name):
+                self.assertEqual(counts[0], counts[1], f"{opts.model_name}: {counts[0]} запросов на 10 строк, {counts[1]} на 100")
+
+    def test_change_form_queries_do_not_grow_with_inline_rows(self):
+        """Форма изменения с инлайнами стоит столько же запросов при 1 строке, сколько при 20."""
+        today = timezone.localdate()
+        promo = Promo.objects.create(title='Распродажа', discount_percent=Decimal('10'), start_date=today, end_date=today)
+        order = Order.objects.create(shipping_address='Москва')
+        admin_user = self.data['admin']
+        products = list(Product.objects.order_by('pk')[:20])
+        variants = list(ProductVariant.objects.order_by('pk')[:20])
+
+        def fill_promo(count):
+            PromoProduct.objects.filter(promo=promo).delete()
+            PromoProduct.objects.bulk_create(PromoProduct(promo=promo, product=product) for product in products[:count])
+
+        def fill_order(count):
+            OrderItem.objects.filter(order=order).delete()
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, variant=variant, price_at_time=variant.price) for variant in variants[:count]
+            )
+
+        def fill_specifications(count):
+            ProductSpecification.objects.filter(product=products[0]).delete()
+            ProductSpecification.objects.bulk_create(
+                ProductSpecification(product=products[0], name=f'Параметр {i}', value=str(i)) for i in range(count)
+            )
+
+        pages = (
+            (reverse('admin:st_promo_change', args=[promo.pk]), fill_promo),
+            (reverse('admin:st_order_change', args=[order.pk]), fill_order),
+            (reverse('admin:st_product_change', args=[products[0].pk]), fill_specifications),
+            (reverse('admin:st_user_change', args=[admin_user.pk]),
+             lambda count: admin_user.user_permissions.set(Permission.objects.order_by('pk')[:count])),
+        )
+        for url, fill in pages:
+            counts = []
+            for count in (1, 20):
+                fill(count)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            with self.subTest(url=url):
+                self.assertEqual(counts[0], counts[1], f"{url}: {counts[0]} запросов на 1 строку, {counts[1]} на 20")
@@ -0,0 +1,185 @@
+# st/tests/test_analytics.py
+import datetime
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from st.analytics import moving_average, rebuild_sales_rollups, sales_dashboard
+from st.checkout import place_order
+from st.models import DailyOrderRollup, DailySalesRollup, Order, OrderItem, Product, ProductVariant, TechType, User
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = TechType.objects.create(name='Смартфоны')
+        cls.audio = TechType.objects.create(name='Наушники')
+        phone = Product.objects.create(name='Телефон', brand='Acme', tech_type=cls.phones)
+        headphones = Product.objects.create(name='Наушники', brand='Sonic', tech_type=cls.audio)
+        cls.phone = ProductVariant.objects.create(product=phone, price=Decimal('1000.00'), stock_quantity=50, sku='P-1')
+        cls.headphones = ProductVariant.objects.create(product=headphones, price=Decimal('200.00'), stock_quantity=50, sku='H-1')
+        cls.admin = User.objects.create_superuser('boss', 'boss@example.com', 'password')
+
+    def order(self, lines, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(lines, shipping_address='Москва', **kwargs)
+
+    def rollups(self):
+        return set(
+            DailySalesRollup.objects.values_list('tech_type__name', 'brand', 'status', 'revenue', 'units', 'orders')
+        )
+
+    def order_counts(self):
+        return dict(DailyOrderRollup.objects.values_list('status', 'orders'))
+
+    def test_orders_update_rollups_incrementally(self):
+        first = self.order([(self.phone.pk, 2), (self.headphones.pk, 1)])
+        self.order([(self.phone.pk, 1)])
+        self.assertEqual(self.rollups(), {
+            ('Смартфоны', 'Acme', 'pending', Decimal('3000.00'), 3, 2),
+            ('Наушники', 'Sonic', 'pending', Decimal('200.00'), 1, 1),
+        })
+        # Заказ с товарами двух брендов - один заказ за день
+        self.assertEqual(self.order_counts(), {'pending': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = Order.STATUS_SHIPPED
+            first.save()
+            OrderItem.objects.filter(order=first, variant=self.headphones).update(quantity=3)
+        self.assertEqual(self.rollups(), {
+            ('Смартфоны', 'Acme', 'pending', Decimal('1000.00'), 1, 1),
+            ('Смартфоны', 'Acme', 'shipped', Decimal('2000.00'), 2, 1),
+            ('Наушники', 'Sonic', 'shipped', Decimal('600.00'), 3, 1),
+        })
+        self.assertEqual(self.order_counts(), {'pending': 1, 'shipped': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.rollups(), {('Смартфоны', 'Acme', 'pending', Decimal('1000.00'), 1, 1)})
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.order([(self.phone.pk, 1)])
+        old = self.order([(self.headphones.pk, 2)], payment_method=Order.PAYMENT_COURIER_CASH)
+        Order.objects.filter(pk=old.pk).update(order_date=timezone.now() - datetime.timedelta(days=40))
+        expected = set(DailySalesRollup.objects.values_list('brand', 'payment_method', 'revenue'))
+        DailySalesRollup.objects.update(revenue=0)
+        DailySalesRollup.objects.create(day=datetime.date(2000, 1, 1), payment_method='card_online', status='pending')
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(set(DailySalesRollup.objects.values_list('brand', 'payment_method', 'revenue')), expected)
+        self.assertEqual(
+            sorted(DailySalesRollup.objects.values_list('day', flat=True)),
+            [timezone.localdate() - datetime.timedelta(days=40), timezone.localdate()],
+        )
+        self.assertEqual(rebuild_sales_rollups(timezone.localdate(), timezone.localdate()), 1)
+
+    def snapshot(self):
+        return (
+            sorted(DailySalesRollup.objects.values_list(
+                'day', 'tech_type', 'brand', 'payment_method', 'status', 'revenue', 'units', 'orders',
+            )),
+            sorted(DailyOrderRollup.objects.values_list('day', 'payment_method', 'status', 'orders')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_sales_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_order_changes_apply_deltas(self):
+        first = self.order([(self.phone.pk, 2), (self.headphones.pk, 1)])
+        second = self.order([(self.headphones.pk, 1)], payment_method=Order.PAYMENT_COURIER_CASH)
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.payment_method = Order.PAYMENT_CASH_PICKUP
+            first.status = Order.STATUS_CANCELLED
+            first.save()
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.filter(order=first, variant=self.headphones).update(order=second)
+            OrderItem.objects.filter(order=second).update(quantity=4)
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.items.all().delete()
+        # Заказ без позиций остается в числе заказов за день
+        self.assertEqual(self.order_counts(), {'cancelled': 1, 'pending': 1})
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(pk=second.pk).delete()
+        self.assertEqual(self.order_counts(), {'cancelled': 1})
+        self.assertMatchesRebuild()
+
+    def test_write_cost_does_not_grow_with_daily_orders(self):
+        def ship(order):
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                order.status = Order.STATUS_SHIPPED
+                order.save()
+            return len(queries)
+
+        lines = [(self.phone.pk, 1), (self.headphones.pk, 1)]
+        ship(self.order(lines))  # группы отправленных заказов за день уже есть
+        counts = [ship(self.order(lines))]
+        # Еще 20 заказов за тот же день
+        for _ in range(20):
+            self.order(lines)
+        untouched = set(DailySalesRollup.objects.exclude(status=Order.STATUS_SHIPPED).values_list('pk', flat=True))
+        counts.append(ship(self.order(lines)))
+        # Строки других групп дня обновляются на месте, а не пересоздаются пересчетом всего дня
+        self.assertEqual(set(DailySalesRollup.objects.filter(pk__in=untouched).values_list('pk', flat=True)), untouched)
+        self.assertEqual(counts[0], counts[1])
+        self.assertMatchesRebuild()
+
+    def test_moving_average(self):
+        np.testing.assert_allclose(moving_average([7, 0, 0, 0, 0, 0, 0, 7], window=7), [7, 3.5, 7 / 3, 1.75, 1.4, 7 / 6, 1, 1])
+
+    def test_dashboard_compares_periods(self):
+        today = timezone.localdate()
+        rows = [
+            # Текущий период (7 дней): 3 дня продаж; предыдущий - 1 день
+            (today, self.phones, 'Acme', Order.STATUS_DELIVERED, '3000.00', 3, 2),
+            (today - datetime.timedelta(days=6), self.audio, 'Sonic', Order.STATUS_PENDING, '500.00', 5, 1),
+            (today - datetime.timedelta(days=6), self.phones, 'Acme', Order.STATUS_CANCELLED, '9000.00', 9, 1),
+            (today - datetime.timedelta(days=7), self.phones, 'Acme', Order.STATUS_DELIVERED, '1750.00', 2, 1),
+        ]
+        for day, tech_type, brand, status, revenue, units, orders in rows:
+            DailySalesRollup.objects.create(
+                day=day, tech_type=tech_type, brand=brand, status=status, payment_method=Order.PAYMENT_CARD_ONLINE,
+                revenue=Decimal(revenue), units=units, orders=orders,
+            )
+            DailyOrderRollup.objects.create(day=day, status=status, payment_method=Order.PAYMENT_CARD_ONLINE, orders=orders)
+
+        with self.assertNumQueries(4):
+            data = sales_dashboard(days=7, today=today)
+        self.assertEqual(len(data['revenue']), 7)
+        self.assertEqual((data['totals']['revenue'], data['totals']['orders']), (3500.0, 3.0))
+        self.assertEqual(data['previous_totals']['revenue'], 1750.0)
+        self.assertAlmostEqual(data['changes']['revenue'], 100.0)
+        self.assertAlmostEqual(data['totals']['average_check'], 3500 / 3)
+        # Скользящее среднее первого дня учитывает последний день предыдущего периода
+        self.assertAlmostEqual(data['revenue_average'][0], (1750 + 500) / 7)
+        self.assertEqual(
+            [(row['name'], row['revenue'], row['change']) for row in data['by_tech_type']],
+            [('Смартфоны', 3000.0, (3000 - 1750) / 1750 * 100), ('Наушники', 500.0, None)],
+        )
+        # Отмененные - только при явном выборе статуса
+        cancelled = sales_dashboard(days=7, status=Order.STATUS_CANCELLED, today=today)
+        self.assertEqual(cancelled['totals']['revenue'], 9000.0)
+
+    def test_dashboard_page_does_not_query_orders(self):
+        self.order([(self.phone.pk, 1)])
+        self.client.force_login(self.admin)
+        url = reverse('admin_sales_dashboard')
+        response = self.client.get(url, {'days': '7', 'status': 'bogus'})
+        self.assertContains(response, 'Смартфоны')
+        self.assertContains(response, '<polyline', count=5)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries.captured_queries if '"st_order"' in query['sql']])
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
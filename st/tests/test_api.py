@@ -0,0 +1,137 @@
+# st/tests/test_api.py
+import datetime
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from st.models import (
+    Category, Color, Product, ProductVariant, Promo, PromoProduct, Review, Size, TechType, User,
+)
+from st.versions import page_cache_timeout
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_type = TechType.objects.create(name='Смартфоны')
+        cls.category = Category.objects.create(name='Телефоны')
+        cls.child = Category.objects.create(name='Флагманы', parent=cls.category)
+        color = Color.objects.create(name='Черный', hex_code='#000000')
+        size = Size.objects.create(name='128 ГБ')
+        now = timezone.now()
+        cls.products = []
+        for i in range(12):
+            product = Product.objects.create(
+                name=f'Телефон {i}', brand='Acme', tech_type=cls.tech_type,
+                created_at=now - datetime.timedelta(hours=i),
+            )
+            product.categories.add(cls.child if i % 2 else cls.category)
+            ProductVariant.objects.create(
+                product=product, color=color, size=size, price=Decimal(1000 + i), stock_quantity=i % 3, sku=f'T-{i}-1',
+            )
+            ProductVariant.objects.create(product=product, price=Decimal(2000 + i), sku=f'T-{i}-2')
+            cls.products.append(product)
+        cls.inactive = Product.objects.create(name='Снят с продажи', tech_type=cls.tech_type, is_active=False)
+        user = User.objects.create(username='buyer')
+        cls.review = Review.objects.create(user=user, product=cls.products[0], rating=5, comment='Ок', is_moderated=True)
+        Review.objects.create(user=User.objects.create(username='other'), product=cls.products[0], rating=1, comment='?')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, data=None, *args, **headers):
+        return self.client.get(reverse(name, args=args), data, **headers)
+
+    def test_sparse_fields_and_includes(self):
+        response = self.get('api_product_list', {
+            'fields': 'id,name', 'include': 'variants,tech_type', 'fields[variants]': 'sku,final_price',
+        })
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results'][0]
+        self.assertEqual(set(first), {'id', 'name', 'variants', 'tech_type'})
+        self.assertEqual(first['tech_type'], {'id': self.tech_type.pk, 'name': 'Смартфоны'})
+        self.assertEqual(first['variants'], [{'sku': 'T-0-1', 'final_price': '1000.00'}, {'sku': 'T-0-2', 'final_price': '2000.00'}])
+
+    def test_default_representation(self):
+        product = self.get('api_product_detail', None, self.products[0].pk).json()
+        self.assertEqual(product['tech_type'], self.tech_type.pk)
+        self.assertEqual(product['min_price'], '1000.00')
+        self.assertNotIn('variants', product)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get('api_product_list', {'fields': 'id,secret', 'include': 'orders'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'include'})
+
+    def test_promo_discount_is_applied(self):
+        today = timezone.now().date()
+        promo = Promo.objects.create(
+            title='Скидка', discount_percent=Decimal('10'),
+            start_date=today - datetime.timedelta(days=1), end_date=today + datetime.timedelta(days=1),
+        )
+        PromoProduct.objects.create(promo=promo, product=self.products[0])
+        data = self.get('api_product_detail', {'include': 'variants'}, self.products[0].pk).json()
+        self.assertEqual((data['discount_percent'], data['final_min_price']), ('10.00', '900.00'))
+        self.assertEqual(data['variants'][0]['final_price'], '900.00')
+
+    def test_cursor_pagination_walks_all_active_products(self):
+        seen, data = [], {'page_size': 5, 'fields': 'id'}
+        url = reverse('api_product_list')
+        while url:
+            page = self.client.get(url, data).json()
+            seen.extend(item['id'] for item in page['results'])
+            url, data = page['next'], None
+        self.assertEqual(seen, [product.pk for product in self.products])
+        self.assertEqual(self.get('api_product_list', {'cursor': 'bogus'}).status_code, 404)
+
+    def test_filters(self):
+        ids = lambda response: {item['id'] for item in response.json()['results']}
+        # Категория вместе с подкатегориями
+        self.assertEqual(len(ids(self.get('api_product_list', {'category': self.category.pk}))), 12)
+        self.assertEqual(len(ids(self.get('api_product_list', {'category': self.child.pk}))), 6)
+        in_stock = {product.pk for i, product in enumerate(self.products) if i % 3}
+        self.assertEqual(ids(self.get('api_product_list', {'in_stock': 'true'})), in_stock)
+        self.assertEqual(len(ids(self.get('api_variant_list', {'product': self.products[1].pk}))), 2)
+
+    def test_only_moderated_reviews(self):
+        results = self.get('api_review_list').json()['results']
+        self.assertEqual([review['id'] for review in results], [self.review.pk])
+        self.assertEqual(results[0]['user'], 'buyer')
+
+    def test_etag_and_conditional_get(self):
+        response = self.get('api_product_list', {'fields': 'id,name'})
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            cached = self.get('api_product_list', {'fields': 'id,name'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        # Другой набор полей - другой ETag
+        self.assertNotEqual(self.get('api_product_list', {'fields': 'id'})['ETag'], etag)
+        # Изменение каталога или отзывов делает ETag недействительным
+        self.products[0].save()
+        self.assertEqual(self.get('api_product_list', {'fields': 'id,name'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.get('api_review_list')['ETag']
+        Review.objects.filter(pk=self.review.pk).set_moderated(True)  # без изменений: версия та же
+        self.assertEqual(self.get('api_review_list', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.review.save()
+        self.assertEqual(self.get('api_review_list', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_expires_with_versions(self):
+        # Сброс версии в другом воркере с локальным кэшем здесь не виден: ETag живет до истечения версий
+        etag = self.get('api_product_list')['ETag']
+        self.assertEqual(self.get('api_product_list', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('time.time', return_value=time.time() + page_cache_timeout() + 1):
+            self.assertEqual(self.get('api_product_list', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        data = {'include': 'tech_type,categories,specifications,variants'}
+        self.get('api_product_list', data)  # прогрев кэша версий и скидок
+        with self.assertNumQueries(4):
+            small = self.get('api_product_list', {**data, 'page_size': 2})
+        with self.assertNumQueries(4):
+            large = self.get('api_product_list', {**data, 'page_size': 500})
+        self.assertEqual((len(small.json()['results']), len(large.json()['results'])), (2, 12))
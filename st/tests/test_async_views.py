@@ -0,0 +1,144 @@
+# st/tests/test_async_views.py
+import asyncio
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from st import metrics, views
+from st.models import Category, Product, ProductSpecification, ProductVariant, TechType
+
+
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_type = TechType.objects.create(name='Смартфоны')
+        category = Category.objects.create(name='Телефоны')
+        # Пачка defer_on_commit (карточки, поисковый индекс) должна быть выполнена здесь
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.product = Product.objects.create(name='Смартфон Альфа', brand='Acme', tech_type=cls.tech_type)
+            cls.product.categories.add(category)
+            ProductVariant.objects.create(product=cls.product, price=Decimal('1000.00'), sku='A-1')
+            ProductSpecification.objects.create(product=cls.product, name='Экран', value='6"')
+            cls.hidden = Product.objects.create(name='Смартфон Архив', tech_type=cls.tech_type, is_active=False)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def aget(self, url, data=None):
+        # Асинхронная вьюха через ASGI-обработчик; запросы ORM возвращаются в поток теста (его транзакция)
+        return async_to_sync(self.async_client.get)(url, data)
+
+    def assertSameContent(self, sync_url, async_url):
+        expected = self.aget(async_url).content
+        cache.clear()
+        self.assertEqual(self.client.get(sync_url).content, expected)
+        return expected.decode()
+
+    def test_pages_match_sync_views(self):
+        content = self.assertSameContent(reverse('product_user_list'), reverse('async_product_list'))
+        self.assertIn('Смартфон Альфа', content)
+        self.assertNotIn('Архив', content)
+        self.assertSameContent(
+            reverse('product_detail_view', args=[self.product.pk]),
+            reverse('async_product_detail', args=[self.product.pk]),
+        )
+        content = self.assertSameContent(
+            reverse('product_search') + '?q=смартфоны', reverse('async_product_search') + '?q=смартфоны',
+        )
+        self.assertIn('Смартфон Альфа', content)
+
+    def test_page_cache_is_shared_with_sync_views(self):
+        self.client.get(reverse('product_detail_view', args=[self.product.pk]))
+        with self.assertNumQueries(1):  # только товар: по updated_at проверяется ключ
+            response = self.aget(reverse('async_product_detail', args=[self.product.pk]))
+        self.assertContains(response, 'A-1')
+        self.client.get(reverse('product_user_list'))
+        with self.assertNumQueries(0):
+            self.aget(reverse('async_product_list'))
+        self.assertEqual(metrics.CACHE_REQUESTS.value('page:product_detail', 'hit'), 1)
+        self.assertEqual(metrics.CACHE_REQUESTS.value('page:product_list', 'hit'), 1)
+
+    def test_cached_fragments_are_not_loaded(self):
+        self.aget(reverse('async_product_detail', args=[self.product.pk]))
+        # Новый отзыв меняет страницу, но не фрагменты вариантов и характеристик
+        Product.objects.filter(pk=self.product.pk).update(
+            rating_count=1, rating_5=1, rating_avg=5.0, updated_at=timezone.now(),
+        )
+        with self.assertNumQueries(2):  # товар и категории; окно акций и версии разделов - в кэше
+            response = self.aget(reverse('async_product_detail', args=[self.product.pk]))
+        self.assertContains(response, 'A-1')
+        self.assertContains(response, '(1 оц.)')
+
+    def test_fragment_evicted_after_lookup(self):
+        self.aget(reverse('async_product_detail', args=[self.product.pk]))
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now())
+        render = views.render
+
+        def evicting_render(*args, **kwargs):
+            # Фрагменты найдены вьюхой, но вытеснены из кэша до рендеринга шаблона
+            cache.clear()
+            return render(*args, **kwargs)
+
+        with mock.patch('st.views.render', evicting_render):
+            response = self.aget(reverse('async_product_detail', args=[self.product.pk]))
+        self.assertContains(response, 'A-1')
+        self.assertContains(response, 'Экран')
+        # Пустые фрагменты не попали в кэш, общий с синхронной вьюхой
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now())
+        for response in (
+            self.aget(reverse('async_product_detail', args=[self.product.pk])),
+            self.client.get(reverse('product_detail_view', args=[self.product.pk])),
+        ):
+            self.assertContains(response, 'A-1')
+            self.assertNotContains(response, 'Нет доступных вариантов')
+
+    def test_sync_cache_api_is_not_called_in_event_loop(self):
+        backend = caches['default']
+
+        def guarded(name):
+            method = getattr(backend, name)
+
+            def call(*args, **kwargs):
+                # Асинхронный API LocMemCache вызывает синхронный в потоке (sync_to_async) - это допустимо
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    return method(*args, **kwargs)
+                raise AssertionError(f"cache.{name}() в цикле событий")
+            return call
+
+        names = ('get', 'set', 'add', 'delete', 'get_many', 'set_many', 'incr', 'has_key', 'touch')
+        patches = [mock.patch.object(backend, name, guarded(name)) for name in names]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Холодный кэш, кэш только фрагментов и кэш страниц
+        for _ in range(2):
+            for url in (
+                reverse('async_product_detail', args=[self.product.pk]),
+                reverse('async_product_list'),
+                reverse('async_product_search') + '?q=смартфоны',
+            ):
+                self.assertEqual(self.aget(url).status_code, 200)
+            Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now())
+        self.assertContains(self.aget(reverse('async_product_detail', args=[self.product.pk])), 'A-1')
+        self.assertEqual(metrics.CACHE_REQUESTS.value('fragment:product_variants', 'hit'), 2)
+
+    def test_errors(self):
+        response = self.aget(reverse('async_product_detail', args=[self.hidden.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.aget(reverse('async_product_list'), {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, 404)
+        response = self.aget(reverse('async_product_search'), {'q': 'смартфон', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_middleware_counts_async_queries(self):
+        response = self.aget(reverse('async_product_list'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        self.assertEqual(metrics.REQUESTS_TOTAL.value('async_product_list', 'GET', '200'), 1)
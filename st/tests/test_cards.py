@@ -0,0 +1,95 @@
+# st/tests/test_cards.py
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from st.cards import _refresh_batch, build_product_cards, rebuild_product_cards
+from st.catalog import bump_catalog_version
+from st.checkout import place_order
+from st.models import Category, Product, ProductCard, ProductVariant, Review, TechType, User
+
+
+class ProductCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_type = TechType.objects.create(name='Смартфоны')
+        cls.phones = Category.objects.create(name='Телефоны')
+        cls.flagships = Category.objects.create(name='Флагманы')
+        cls.user = User.objects.create(username='buyer')
+        # Пачка defer_on_commit должна быть выполнена здесь (транзакция класса не коммитится)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.product = Product.objects.create(name='Телефон', brand='Acme', tech_type=cls.tech_type)
+            cls.product.categories.add(cls.phones, cls.flagships)
+            cls.cheap = ProductVariant.objects.create(
+                product=cls.product, price=Decimal('1000.00'), stock_quantity=2, sku='P-1', image='product_variants/p1.jpg',
+            )
+            ProductVariant.objects.create(product=cls.product, price=Decimal('1500.00'), stock_quantity=3, sku='P-2')
+
+    def setUp(self):
+        cache.clear()
+
+    def card(self):
+        return ProductCard.objects.get(pk=self.product.pk)
+
+    def change(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def test_card_is_built_from_all_tables(self):
+        card = self.card()
+        self.assertEqual(
+            (card.name, card.tech_type_name, card.category_names, card.min_price, card.max_price,
+             card.total_stock, card.variants_count, card.image.name),
+            ('Телефон', 'Смартфоны', ['Телефоны', 'Флагманы'], Decimal('1000.00'), Decimal('1500.00'),
+             5, 2, 'product_variants/p1.jpg'),
+        )
+        self.assertEqual(card.get_absolute_url(), self.product.get_absolute_url())
+
+    def test_signals_refresh_card_once_per_transaction(self):
+        def changes():
+            ProductVariant.objects.create(product=self.product, price=Decimal('900.00'), stock_quantity=1, sku='P-3')
+            Review.objects.create(user=self.user, product=self.product, rating=4, comment='Ок', is_moderated=True)
+            self.product.categories.remove(self.flagships)
+            self.tech_type.name = 'Телефоны и смартфоны'
+            self.tech_type.save()
+
+        with mock.patch('st.cards._refresh_batch', wraps=_refresh_batch) as refresh:
+            self.change(changes)
+        refresh.assert_called_once()
+        card = self.card()
+        self.assertEqual((card.min_price, card.total_stock, card.variants_count), (Decimal('900.00'), 6, 3))
+        self.assertEqual((card.rating_avg, card.rating_count), (4.0, 1))
+        self.assertEqual((card.category_names, card.tech_type_name), (['Телефоны'], 'Телефоны и смартфоны'))
+
+    def test_checkout_decrements_card_stock(self):
+        place_order([(self.cheap.pk, 2)], shipping_address='Москва')
+        self.assertEqual(self.card().total_stock, 3)
+
+    def test_deleting_category_refreshes_cards(self):
+        self.change(self.flagships.delete)
+        self.assertEqual(self.card().category_names, ['Телефоны'])
+
+    def test_rebuild_fixes_drift(self):
+        ProductCard.objects.filter(pk=self.product.pk).update(total_stock=0, name='Устарело')
+        self.assertEqual(rebuild_product_cards(batch_size=1), 1)
+        self.assertEqual((self.card().name, self.card().total_stock), ('Телефон', 5))
+        ProductCard.objects.all().delete()
+        call_command('rebuild_product_cards', stdout=StringIO())
+        self.assertTrue(ProductCard.objects.filter(pk=self.product.pk).exists())
+        self.assertEqual(len(build_product_cards([self.product.pk, 999999])), 1)
+
+    def test_list_page_is_a_single_table_scan(self):
+        self.change(lambda: Product.objects.create(name='Архив', tech_type=self.tech_type, is_active=False))
+        url = reverse('product_user_list')
+        self.client.get(url)  # прогрев окна акций и скидок
+        bump_catalog_version()  # промах кэша страницы
+        with self.assertNumQueries(1):
+            content = self.client.get(url).content.decode()
+        self.assertIn('Флагманы', content)
+        self.assertIn('В наличии', content)
+        self.assertNotIn('Архив', content)
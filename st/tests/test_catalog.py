@@ -0,0 +1,67 @@
+# st/tests/test_catalog.py
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+
+from st.catalog import CatalogFilters, compute_facets, filtered_products
+from st.models import Category, Color, Product, ProductVariant, TechType
+
+
+def counts(facet):
+    return {row['label']: row['count'] for row in facet}
+
+
+class FacetCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = TechType.objects.create(name='Смартфоны')
+        audio = TechType.objects.create(name='Наушники')
+        cls.black = Color.objects.create(name='Черный', hex_code='#000000')
+        cls.other = Category.objects.create(name='Other')
+        cls.child = Category.objects.create(name='Child', parent=cls.other)
+        cls.grand = Category.objects.create(name='Grand', parent=cls.child)
+        cls.sale = Category.objects.create(name='Sale')
+        with cls.captureOnCommitCallbacks(execute=True):
+            deep = Product.objects.create(name='Телефон', brand='Acme', tech_type=phones)
+            deep.categories.add(cls.grand)
+            # В двух категориях одного поддерева: считается один раз
+            both = Product.objects.create(name='Планшет', brand='Acme', tech_type=phones)
+            both.categories.add(cls.child, cls.grand, cls.sale)
+            headphones = Product.objects.create(name='Наушники', brand='Sonic', tech_type=audio)
+            headphones.categories.add(cls.sale)
+            ProductVariant.objects.create(product=deep, price=Decimal('100.00'), stock_quantity=1, color=cls.black, sku='C-1')
+            ProductVariant.objects.create(product=both, price=Decimal('200.00'), stock_quantity=0, sku='C-2')
+            ProductVariant.objects.create(product=headphones, price=Decimal('50.00'), stock_quantity=3, sku='C-3')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_category_counts_include_subcategories(self):
+        facets = compute_facets(CatalogFilters())
+        self.assertEqual(counts(facets['category']), {'Other': 2, 'Child': 2, 'Grand': 2, 'Sale': 2})
+        self.assertEqual(counts(facets['tech_type']), {'Смартфоны': 2, 'Наушники': 1})
+        self.assertEqual(counts(facets['brand']), {'Acme': 2, 'Sonic': 1})
+        self.assertEqual(counts(facets['color']), {'Черный': 1})
+        self.assertEqual(facets['price'], {'min': '50', 'max': '200'})
+        self.assertEqual(facets['in_stock'], 2)
+
+    def test_selected_category_count_matches_results(self):
+        for category in (self.other, self.child, self.grand, self.sale):
+            filters = CatalogFilters.from_query_dict(QueryDict(f'category={category.pk}&in_stock=1'))
+            facet = {row['value']: row for row in compute_facets(filters)['category']}
+            self.assertTrue(facet[category.pk]['selected'])
+            self.assertEqual(facet[category.pk]['count'], filtered_products(filters).count(), category.name)
+
+    def test_selected_category_is_listed_without_products(self):
+        filters = CatalogFilters(category=self.other.pk, brands=['Sonic'])
+        self.assertEqual(counts(compute_facets(filters)['category']), {'Other': 0, 'Sale': 1})
+        # Дизъюнктивные счетчики: фильтр бренда не сужает фасет брендов
+        self.assertEqual(counts(compute_facets(filters)['brand']), {'Acme': 2})
+
+    def test_catalog_page(self):
+        response = self.client.get(reverse('catalog'), {'category': self.other.pk})
+        data = response.json()
+        self.assertEqual(len(data['results']), counts(data['facets']['category'])['Other'])
@@ -0,0 +1,70 @@
+# st/tests/test_categories.py
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from st.models import Category
+
+
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.other = Category.objects.create(name='Other')
+        cls.child = Category.objects.create(name='Child', parent=cls.other)
+        cls.grand = Category.objects.create(name='Grand', parent=cls.child)
+        cls.sale = Category.objects.create(name='Sale')
+
+    def tree(self):
+        return {
+            name: (path, full_name, depth)
+            for name, path, full_name, depth in Category.objects.values_list('name', 'path', 'full_name', 'depth')
+        }
+
+    def test_paths_on_create(self):
+        other, child, grand = self.other.pk, self.child.pk, self.grand.pk
+        self.assertEqual(self.tree()['Grand'], (f'/{other}/{child}/{grand}/', 'Other -> Child -> Grand', 2))
+        self.assertEqual(list(self.grand.get_ancestors()), [self.other, self.child])
+        self.assertEqual(set(self.other.get_descendants()), {self.child, self.grand})
+
+    def test_move_and_rename_rewrite_subtree(self):
+        self.child.parent = self.sale
+        self.child.save()
+        sale, child, grand = self.sale.pk, self.child.pk, self.grand.pk
+        self.assertEqual(self.tree()['Grand'], (f'/{sale}/{child}/{grand}/', 'Sale -> Child -> Grand', 2))
+
+        self.sale.name = 'Скидки'
+        self.sale.save()
+        self.assertEqual(self.tree()['Grand'][1], 'Скидки -> Child -> Grand')
+
+        self.child.parent = None
+        self.child.save()
+        self.assertEqual(self.tree()['Grand'], (f'/{child}/{grand}/', 'Child -> Grand', 1))
+
+    def test_cannot_move_into_own_subtree(self):
+        self.other.parent = self.grand
+        with self.assertRaises(ValueError):
+            self.other.save()
+
+    def test_delete_makes_children_roots(self):
+        self.child.delete()
+        self.grand.refresh_from_db()
+        self.assertIsNone(self.grand.parent_id)
+        self.assertEqual(self.tree()['Grand'], (f'/{self.grand.pk}/', 'Grand', 0))
+        self.assertEqual(self.tree()['Other'], (f'/{self.other.pk}/', 'Other', 0))
+
+    def test_rebuild_tree(self):
+        expected = self.tree()
+        Category.objects.update(path='', full_name='', depth=0)
+        out = StringIO()
+        call_command('rebuild_category_tree', stdout=out)
+        self.assertIn('Исправлено категорий: 4', out.getvalue())
+        self.assertEqual(self.tree(), expected)
+
+    def test_child_of_parent_without_path(self):
+        # Как после loaddata: пути не заполнены, новая подкатегория не должна стать корневой
+        Category.objects.update(path='', full_name='', depth=0)
+        leaf = Category.objects.create(name='Leaf', parent=self.grand)
+        other, child, grand = self.other.pk, self.child.pk, self.grand.pk
+        self.assertEqual(self.tree()['Leaf'], (f'/{other}/{child}/{grand}/{leaf.pk}/', 'Other -> Child -> Grand -> Leaf', 3))
+        self.assertEqual(self.tree()['Other'][0], f'/{other}/')
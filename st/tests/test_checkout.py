@@ -0,0 +1,84 @@
+# st/tests/test_checkout.py
+import datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from st.checkout import CheckoutError, InsufficientStockError, place_order
+from st.models import Order, OrderItem, Product, ProductVariant, Promo, PromoProduct, TechType
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tech_type = TechType.objects.create(name='Смартфоны')
+        cls.product = Product.objects.create(name='Телефон', tech_type=tech_type)
+        cls.other = Product.objects.create(name='Чехол', tech_type=tech_type)
+        cls.phone = ProductVariant.objects.create(product=cls.product, price=Decimal('1000.00'), stock_quantity=5, sku='P-1')
+        cls.case = ProductVariant.objects.create(product=cls.other, price=Decimal('150.50'), stock_quantity=2, sku='C-1')
+
+    def setUp(self):
+        cache.clear()
+
+    def stock(self, variant):
+        return ProductVariant.objects.values_list('stock_quantity', flat=True).get(pk=variant.pk)
+
+    def test_order_created_and_stock_decremented(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order([(self.phone.pk, 2), (self.case.pk, 1)], shipping_address='Москва')
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('2150.50'))
+        self.assertEqual(
+            set(order.items.values_list('variant_id', 'quantity', 'price_at_time')),
+            {(self.phone.pk, 2, Decimal('1000.00')), (self.case.pk, 1, Decimal('150.50'))},
+        )
+        self.assertEqual((self.stock(self.phone), self.stock(self.case)), (3, 1))
+
+    def test_price_at_time_includes_active_promo(self):
+        today = timezone.now().date()
+        promo = Promo.objects.create(
+            title='Скидка', discount_percent=Decimal('10'),
+            start_date=today - datetime.timedelta(days=1), end_date=today + datetime.timedelta(days=1),
+        )
+        PromoProduct.objects.create(promo=promo, product=self.product)
+        order = place_order({self.phone.pk: 1, self.case.pk: 1}, shipping_address='Москва')
+        self.assertEqual(OrderItem.objects.get(order=order, variant=self.phone).price_at_time, Decimal('900.00'))
+        self.assertEqual(order.total_price, Decimal('1050.50'))
+
+    def test_duplicate_lines_are_merged(self):
+        order = place_order([(self.phone.pk, 1), (self.phone.pk, 2)], shipping_address='Москва')
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [3])
+        self.assertEqual(self.stock(self.phone), 2)
+
+    def test_shortage_rolls_back_all_lines(self):
+        # Первая позиция списалась бы, вторая - нет: не должно измениться ничего
+        with self.assertRaises(InsufficientStockError) as ctx:
+            place_order([(self.phone.pk, 1), (self.case.pk, 3)], shipping_address='Москва')
+        self.assertEqual(ctx.exception.shortages, {self.case.pk: (3, 2)})
+        self.assertEqual((self.stock(self.phone), self.stock(self.case)), (5, 2))
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_variant_is_a_shortage(self):
+        with self.assertRaises(InsufficientStockError) as ctx:
+            place_order([(self.phone.pk, 1), (999999, 1)], shipping_address='Москва')
+        self.assertEqual(ctx.exception.shortages, {999999: (1, None)})
+        self.assertEqual(self.stock(self.phone), 5)
+
+    def test_stock_can_be_sold_out_exactly(self):
+        place_order([(self.case.pk, 2)], shipping_address='Москва')
+        self.assertEqual(self.stock(self.case), 0)
+        with self.assertRaises(InsufficientStockError):
+            place_order([(self.case.pk, 1)], shipping_address='Москва')
+
+    def test_invalid_lines(self):
+        for lines in ([], [(self.phone.pk, 0)], [(self.phone.pk, -1)]):
+            with self.subTest(lines=lines), self.assertRaises(CheckoutError):
+                place_order(lines, shipping_address='Москва')
+
+    def test_query_count_does_not_depend_on_lines(self):
+        place_order([(self.phone.pk, 1), (self.case.pk, 1)], shipping_address='Москва')  # прогрев кэша скидок
+        # UPDATE остатков, чтение цен, INSERT заказа, один INSERT позиций, UPDATE карточек, SAVEPOINT и RELEASE
+        with self.assertNumQueries(7):
+            place_order([(self.phone.pk, 1), (self.case.pk, 1)], shipping_address='Москва')
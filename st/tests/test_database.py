@@ -0,0 +1,18 @@
+# st/tests/test_database.py
+from django.db import connection
+from django.test import TestCase
+
+
+class SQLiteSettingsTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_init_command_applies_pragmas(self):
+        # journal_mode тестовой базы в памяти всегда memory, остальные PRAGMA - из settings.SQLITE_PRAGMAS
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -32000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
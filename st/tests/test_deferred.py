@@ -0,0 +1,50 @@
+# st/tests/test_deferred.py
+from django.db import transaction
+from django.test import TestCase
+
+from st.deferred import defer_on_commit
+
+
+class DeferOnCommitTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def recalculate(self, keys, using=None):
+        self.calls.append(keys)
+
+    def other(self, keys, using=None):
+        self.calls.append(('other', keys))
+
+    def test_one_call_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            defer_on_commit(self.recalculate, [1, None], using='default')
+            defer_on_commit(self.other, [1])
+            with transaction.atomic():
+                defer_on_commit(self.recalculate, [2, 3])
+            defer_on_commit(self.recalculate, [3])
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{1, 2, 3}, ('other', {1})])
+        defer_on_commit(self.recalculate, [None])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_savepoint_rollback_keeps_later_keys(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # Первый flush пачки ставится в очередь внутри отмененной точки сохранения
+            try:
+                with transaction.atomic():
+                    defer_on_commit(self.recalculate, [1])
+                    raise ValueError
+            except ValueError:
+                pass
+            defer_on_commit(self.recalculate, [2])
+            with transaction.atomic():
+                defer_on_commit(self.recalculate, [3])
+        # Ключи отмененной точки сохранения допустимы в пачке: пересчет идемпотентен
+        self.assertEqual(len(self.calls), 1)
+        self.assertLessEqual({2, 3}, self.calls[0])
+
+        self.calls.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            defer_on_commit(self.recalculate, [4])
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn(4, self.calls[0])
@@ -0,0 +1,141 @@
+# st/tests/test_imports.py
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from st.imports import ImportFormatError, import_catalog, iter_json_rows
+from st.models import (
+    Category, Color, Product, ProductCard, ProductVariant, Size, TechType, User,
+)
+from st.search import search_products
+
+CSV_HEADER = 'sku,name,brand,tech_type,price,stock,color,size,categories,spec:Экран\n'
+
+
+class CatalogImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = TechType.objects.create(name='Смартфоны')
+        cls.black = Color.objects.create(name='Черный', hex_code='#000000')
+        cls.size = Size.objects.create(name='128 ГБ')
+        cls.parent = Category.objects.create(name='Электроника')
+        cls.category = Category.objects.create(name='Телефоны', parent=cls.parent)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.product = Product.objects.create(name='Телефон', brand='Acme', tech_type=cls.phones)
+            ProductVariant.objects.create(product=cls.product, price=Decimal('1000.00'), stock_quantity=1, sku='OLD-1')
+        cls.admin = User.objects.create_superuser('admin', password='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def run_csv(self, body, **kwargs):
+        return import_catalog(StringIO(CSV_HEADER + body), 'csv', **kwargs)
+
+    def test_csv_upserts_by_sku(self):
+        result = self.run_csv(
+            'OLD-1,Телефон,Acme,Смартфоны,900.50,7,,,Телефоны,"6,1"""\n'
+            'NEW-1,Телефон,Acme,Смартфоны,1200,3,Черный,128 ГБ,Электроника -> Телефоны,\n'
+            'NEW-2,Планшет,Acme,Смартфоны,2000,0,,,,"10"""\n',
+            batch_size=2,
+        )
+        self.assertEqual(result.error_count, 0, result.errors)
+        self.assertEqual(
+            (result.products_created, result.variants_created, result.variants_updated), (1, 2, 1),
+        )
+        old = ProductVariant.objects.get(sku='OLD-1')
+        self.assertEqual((old.price, old.stock_quantity), (Decimal('900.50'), 7))
+        new = ProductVariant.objects.get(sku='NEW-1')
+        self.assertEqual((new.product_id, new.color, new.size), (self.product.pk, self.black, self.size))
+        self.assertEqual(list(self.product.categories.all()), [self.category])
+        self.assertEqual(self.product.specifications.get().value, '6,1"')
+        # Сигналы не отправлялись: карточки и поисковый индекс обновлены импортом
+        card = ProductCard.objects.get(pk=self.product.pk)
+        self.assertEqual((card.min_price, card.total_stock, card.category_names), (Decimal('900.50'), 10, ['Телефоны']))
+        self.assertEqual([p.name for p in search_products('планшет')], ['Планшет'])
+
+    def test_row_errors_do_not_stop_import(self):
+        result = self.run_csv(
+            'BAD-1,Телефон,Acme,Холодильники,100,1,,,,\n'
+            'BAD-2,Телефон,Acme,Смартфоны,-5,x,Пурпурный,,Нет такой,\n'
+            'GOOD-1,Телефон,Acme,Смартфоны,100,1,,,,\n'
+        )
+        self.assertEqual((result.rows, result.error_count, result.variants_created), (3, 2, 1))
+        line, sku, message = result.errors[1]
+        self.assertEqual((line, sku), (3, 'BAD-2'))
+        for column in ('price', 'stock', 'color', 'categories'):
+            self.assertIn(column, message)
+        self.assertFalse(ProductVariant.objects.filter(sku__startswith='BAD').exists())
+
+    def test_duplicate_color_and_size_is_a_row_error(self):
+        ProductVariant.objects.create(product=self.product, price=1, sku='TAKEN', color=self.black, size=self.size)
+        result = self.run_csv('DUP-1,Телефон,Acme,Смартфоны,100,1,Черный,128 ГБ,,\n')
+        self.assertEqual(result.error_count, 1)
+        self.assertIn('TAKEN', result.errors[0][2])
+
+    def test_json_is_streamed_in_chunks(self):
+        rows = [
+            {'sku': f'J-{i}', 'name': 'Телефон', 'brand': 'Acme', 'tech_type': 'Смартфоны', 'price': 10 + i,
+             'stock': i, 'categories': ['Телефоны'], 'specifications': {'Экран': f'{i}"'}}
+            for i in range(5)
+        ]
+        # Фрагменты меньше объекта: разбор должен дочитывать файл
+        with mock.patch('st.imports.JSON_READ_SIZE', 7):
+            parsed = list(iter_json_rows(StringIO(json.dumps(rows, ensure_ascii=False))))
+            lines = list(iter_json_rows(StringIO('\n'.join(json.dumps(row) for row in rows))))
+        self.assertEqual([record for _, record in parsed], rows)
+        self.assertEqual([record for _, record in lines], rows)
+        result = import_catalog(StringIO(json.dumps(rows)), 'json', batch_size=2)
+        self.assertEqual((result.variants_created, result.error_count), (5, 0))
+        self.assertEqual(self.product.specifications.get().value, '4"')
+        with self.assertRaises(ImportFormatError):
+            list(iter_json_rows(StringIO('[{"sku": "x"}, {"sku"')))
+
+    def test_dry_run_and_command(self):
+        result = self.run_csv('NEW-1,Новый,Acme,Смартфоны,100,1,,,,\n', dry_run=True)
+        self.assertEqual(result.variants_created, 1)
+        self.assertFalse(Product.objects.filter(name='Новый').exists())
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(CSV_HEADER + 'NEW-1,Новый,Acme,Смартфоны,100,1,,,,\n')
+        out = StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=StringIO())
+        self.assertIn('вариантов создано: 1', out.getvalue())
+        self.assertTrue(ProductVariant.objects.filter(sku='NEW-1', product__name='Новый').exists())
+
+    def test_admin_upload(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin_catalog_import')
+        self.assertContains(self.client.get(reverse('admin:st_productvariant_changelist')), url)
+        upload = SimpleUploadedFile('feed.csv', (CSV_HEADER + 'ADM-1,Телефон,Acme,Смартфоны,100,1,,,,\nADM-2,,,,,,,,,\n').encode())
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['result'].variants_created, response.context['result'].error_count), (1, 1))
+        self.assertContains(response, 'ADM-2')
+        self.assertTrue(ProductVariant.objects.filter(sku='ADM-1').exists())
+        response = self.client.post(url, {'file': SimpleUploadedFile('feed.txt', b'x')})
+        self.assertFormError(response.context['form'], 'file', ["Не удалось определить формат файла feed.txt: укажите csv или json."])
+
+    def test_admin_upload_requires_product_permissions(self):
+        # Права только на варианты: импорт меняет и товары, и характеристики
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        staff.user_permissions.set(Permission.objects.filter(
+            content_type__app_label='st', codename__in=['view_productvariant', 'add_productvariant', 'change_productvariant'],
+        ))
+        self.client.force_login(staff)
+        url = reverse('admin_catalog_import')
+        self.assertNotContains(self.client.get(reverse('admin:st_productvariant_changelist')), url)
+        upload = SimpleUploadedFile('feed.csv', (CSV_HEADER + 'ADM-1,Телефон,Acme,Смартфоны,100,1,,,,\n').encode())
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+        self.assertFalse(ProductVariant.objects.filter(sku='ADM-1').exists())
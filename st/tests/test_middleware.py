@@ -0,0 +1,49 @@
+# st/tests/test_middleware.py
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from st import metrics
+from st.models import Product, TechType, User
+
+
+class PerformanceMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tech_type = TechType.objects.create(name='Смартфоны')
+        cls.product = Product.objects.create(name='Телефон', tech_type=tech_type)
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def setUp(self):
+        metrics.registry.reset()
+        cache.clear()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product_detail_view', args=[self.product.pk]))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(header, r'tpl;dur=[\d.]+')
+        self.assertRegex(header, r'total;dur=[\d.]+')
+
+    def test_metrics_are_aggregated_per_url_name(self):
+        for _ in range(3):
+            self.client.get(reverse('product_detail_view', args=[self.product.pk]))
+        self.assertEqual(metrics.REQUEST_DURATION.count('product_detail_view'), 3)
+        self.assertEqual(metrics.REQUESTS_TOTAL.value('product_detail_view', 'GET', '200'), 3)
+        # Шаблон рендерится только при первом запросе, дальше страница берется из кэша
+        self.assertEqual(metrics.TEMPLATE_DURATION.count('product_detail_view'), 1)
+        self.client.get('/no-such-page/')
+        self.assertEqual(metrics.REQUESTS_TOTAL.value('<unresolved>', 'GET', '404'), 1)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.get(reverse('product_detail_view', args=[self.product.pk]))
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE st_http_request_duration_seconds histogram', body)
+        self.assertIn('st_http_request_duration_seconds_bucket{view="product_detail_view",le="+Inf"} 1', body)
+        self.assertIn('st_db_queries_per_request_count{view="product_detail_view"} 1', body)
@@ -0,0 +1,97 @@
+# st/tests/test_pagecache.py
+import datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from st import metrics
+from st.models import (
+    Category, Product, ProductSpecification, ProductVariant, Promo, PromoProduct, Review, TechType, User,
+)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_type = TechType.objects.create(name='Смартфоны')
+        cls.category = Category.objects.create(name='Телефоны')
+        # Пачка defer_on_commit должна быть выполнена здесь, иначе изменения в тестах дополнят ее
+        # вместо новой (транзакция класса не коммитится)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.product = Product.objects.create(name='Телефон', tech_type=cls.tech_type)
+            cls.product.categories.add(cls.category)
+            cls.variant = ProductVariant.objects.create(product=cls.product, price=Decimal('1000.00'), sku='P-1')
+            ProductSpecification.objects.create(product=cls.product, name='Экран', value='6"')
+        cls.user = User.objects.create(username='buyer')
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.url = reverse('product_detail_view', args=[self.product.pk])
+
+    def get(self, url=None):
+        return self.client.get(url or self.url).content.decode()
+
+    def change(self, func):
+        # Товар отмечается измененным в on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def save(self, obj, **values):
+        for name, value in values.items():
+            setattr(obj, name, value)
+        self.change(obj.save)
+
+    def requests(self, name, result):
+        return metrics.CACHE_REQUESTS.value(name, result)
+
+    def test_detail_page_is_served_from_cache(self):
+        self.get()
+        with self.assertNumQueries(1):  # только товар: по updated_at проверяется ключ
+            content = self.get()
+        self.assertIn('P-1', content)
+        self.assertEqual((self.requests('page:product_detail', 'hit'), self.requests('page:product_detail', 'miss')), (1, 1))
+        self.assertEqual(metrics.cache_hit_ratios()[('page:product_detail',)], 0.5)
+
+    def test_variant_and_spec_changes_invalidate_page(self):
+        self.get()
+        self.save(self.variant, sku='P-1X')
+        self.assertIn('P-1X', self.get())
+        self.change(lambda: ProductSpecification.objects.create(product=self.product, name='Вес', value='180 г'))
+        self.assertIn('180 г', self.get())
+        self.save(self.category, name='Смартфоны и телефоны')
+        self.assertIn('Смартфоны и телефоны', self.get())
+
+    def test_promo_changes_invalidate_prices(self):
+        self.get()
+        today = timezone.now().date()
+        promo = Promo.objects.create(
+            title='Скидка', discount_percent=Decimal('10'),
+            start_date=today - datetime.timedelta(days=1), end_date=today + datetime.timedelta(days=1),
+        )
+        self.change(lambda: PromoProduct.objects.create(promo=promo, product=self.product))
+        self.assertIn('900,00', self.get())
+        self.save(promo, discount_percent=Decimal('20'))
+        self.assertIn('800,00', self.get())
+
+    def test_review_rebuilds_page_but_reuses_fragments(self):
+        self.get()
+        self.change(lambda: Review.objects.create(user=self.user, product=self.product, rating=4, comment='Ок', is_moderated=True))
+        content = self.get()
+        self.assertIn('1 оц.', content)
+        self.assertEqual(self.requests('page:product_detail', 'miss'), 2)
+        # Варианты и характеристики не менялись: фрагменты взяты из кэша
+        self.assertEqual(self.requests('fragment:product_variants', 'hit'), 1)
+        self.assertEqual(self.requests('fragment:product_specs', 'hit'), 1)
+
+    def test_list_page_follows_catalog_version(self):
+        url = reverse('product_user_list')
+        self.get(url)
+        with self.assertNumQueries(0):
+            self.get(url)
+        self.save(self.product, name='Телефон Pro')
+        self.assertIn('Телефон Pro', self.get(url))
+        self.assertEqual(self.requests('page:product_list', 'miss'), 2)
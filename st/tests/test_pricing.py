@@ -0,0 +1,81 @@
+# st/tests/test_pricing.py
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from st.models import Product, ProductVariant, Promo, PromoProduct, TechType
+from st.pricing import annotate_variant_prices, apply_discount, get_discounts
+
+
+class PricingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tech_type = TechType.objects.create(name='Смартфоны')
+        # Карточки товаров для списка создаются при коммите
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.products = [Product.objects.create(name=f'Товар {i}', tech_type=tech_type) for i in range(3)]
+            cls.variant = ProductVariant.objects.create(product=cls.products[0], price=Decimal('999.99'), sku='V-1')
+        cls.today = timezone.now().date()
+
+    def setUp(self):
+        cache.clear()
+
+    def promo(self, percent, start=-1, end=1, products=(), **kwargs):
+        promo = Promo.objects.create(
+            title=f'Акция {percent}', discount_percent=Decimal(percent),
+            start_date=self.today + datetime.timedelta(days=start),
+            end_date=self.today + datetime.timedelta(days=end), **kwargs,
+        )
+        for product in products:
+            PromoProduct.objects.create(promo=promo, product=product)
+        return promo
+
+    def test_best_active_discount_wins(self):
+        first, second, third = self.products
+        self.promo(10, products=[first, second])
+        self.promo(25, products=[first])
+        self.promo(50, products=[second], is_active=False)
+        self.promo(70, start=-10, end=-2, products=[second, third])
+        self.assertEqual(get_discounts([p.pk for p in self.products]), {first.pk: Decimal('25'), second.pk: Decimal('10')})
+
+    def test_results_are_cached_and_invalidated_on_change(self):
+        first = self.products[0]
+        promo = self.promo(10, products=[first])
+        ids = [p.pk for p in self.products]
+        get_discounts(ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_discounts(ids), {first.pk: Decimal('10')})
+        promo.discount_percent = Decimal('15')
+        promo.save()
+        self.assertEqual(get_discounts(ids), {first.pk: Decimal('15')})
+        PromoProduct.objects.filter(promo=promo).delete()
+        self.assertEqual(get_discounts(ids), {})
+
+    def test_cache_expires_at_next_promo_boundary(self):
+        first = self.products[0]
+        self.promo(20, start=1, end=3, products=[first])
+        self.assertEqual(get_discounts([first.pk]), {})
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        with mock.patch('st.pricing.timezone.now', return_value=tomorrow):
+            self.assertEqual(get_discounts([first.pk]), {first.pk: Decimal('20')})
+
+    def test_variant_prices(self):
+        self.promo(15, products=[self.products[0]])
+        prices = annotate_variant_prices([self.variant])
+        self.assertEqual(prices, {self.variant.pk: Decimal('849.99')})
+        self.assertEqual(self.variant.discount_percent, Decimal('15'))
+        self.assertEqual(apply_discount(Decimal('100.00'), None), Decimal('100.00'))
+
+    def test_list_page_shows_discounts_without_per_item_queries(self):
+        self.promo(10, products=self.products)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, product in enumerate(self.products[1:]):
+                ProductVariant.objects.create(product=product, price=Decimal('100'), sku=f'V-{i + 2}')
+        response = self.client.get(reverse('product_user_list'))
+        self.assertContains(response, '-10%', count=3)
+        self.assertContains(response, '90,00 руб.', count=2)
@@ -0,0 +1,172 @@
+# st/tests/test_recommendations.py
+from decimal import Decimal
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from st.checkout import place_order
+from st.models import CountedOrder, Order, OrderItem, Product, ProductPairCount, ProductRecommendation, ProductVariant, RecommendationState, TechType
+from st.recommendations import (
+    get_recommendations, order_pairs, rebuild_recommendations, score_pairs, update_recommendations,
+)
+
+
+class PairMathTests(TestCase):
+    def test_order_pairs_counts_each_order_once(self):
+        # Заказ 1: товары 1, 2; заказ 2: 1, 2, 3 (позиции без повторов товара, как после distinct())
+        a, b, counts, orders = order_pairs([1, 1, 2, 2, 2], [1, 2, 1, 2, 3])
+        pairs = dict(zip(zip(a.tolist(), b.tolist()), counts.tolist()))
+        self.assertEqual(orders, 2)
+        self.assertEqual((pairs[1, 1], pairs[1, 2], pairs[2, 1], pairs[2, 3], pairs[3, 3]), (2, 2, 2, 1, 1))
+        self.assertEqual(len(pairs), 9)
+        self.assertEqual(order_pairs([], [])[3], 0)
+
+    def test_score_pairs_ranks_by_lift(self):
+        # Товар 1 с 2 - в каждом заказе 2, с 3 - в половине заказов популярного 3
+        top = score_pairs([1, 1, 2], [2, 3, 1], [4, 5, 4], [10, 10, 4], [4, 10, 10], 20, top_k=1)
+        self.assertEqual(top, {1: [[2, 2.0, 4]], 2: [[1, 2.0, 4]]})
+        self.assertEqual(score_pairs([], [], [], [], [], 0), {})
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = TechType.objects.create(name='Смартфоны')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.products = [
+                Product.objects.create(name=name, brand='Acme', tech_type=phones)
+                for name in ('Телефон', 'Чехол', 'Зарядка', 'Планшет')
+            ]
+            cls.variants = [
+                ProductVariant.objects.create(product=product, price=Decimal('100.00'), stock_quantity=100, sku=f'R-{i}')
+                for i, product in enumerate(cls.products)
+            ]
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *indexes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order([(self.variants[i].pk, 1) for i in indexes], shipping_address='Москва')
+
+    def recommended(self, index):
+        return [card.pk for card in get_recommendations(self.products[index].pk)]
+
+    def test_orders_update_recommendations_on_commit(self):
+        phone, case, charger, tablet = (product.pk for product in self.products)
+        self.order(0, 1)
+        # Одного совместного заказа мало (MIN_PAIR_ORDERS)
+        self.assertEqual(self.recommended(0), [])
+        self.order(0, 1)
+        self.order(0, 2)
+        self.order(0, 2)
+        self.order(2, 3)
+        self.order(2, 3)
+        self.order(2)
+        state = RecommendationState.objects.get()
+        self.assertEqual((state.orders, state.last_order_id), (7, Order.objects.latest('pk').pk))
+        self.assertEqual(
+            ProductPairCount.objects.get(product_id=phone, other_id=phone).orders, 4,
+        )
+        # Чехол покупают только с телефоном, зарядку - и с планшетом: у чехла lift выше
+        self.assertEqual(self.recommended(0), [case, charger])
+        self.assertEqual(self.recommended(2), [tablet, phone])
+        self.assertEqual(self.recommended(1), [phone])
+
+        response = self.client.get(reverse('product_detail_view', args=[phone]))
+        self.assertContains(response, 'С этим товаром покупают')
+        self.assertEqual([card.pk for card in response.context['recommendations']], [case, charger])
+        async_response = async_to_sync(self.async_client.get)(reverse('async_product_detail', args=[phone]))
+        self.assertContains(async_response, 'С этим товаром покупают')
+        self.assertContains(async_response, self.products[1].get_absolute_url())
+        # Список в кэше: страница с прогретым кэшем не обращается к рекомендациям в БД
+        with self.assertNumQueries(0):
+            self.assertEqual(self.recommended(0), [case, charger])
+
+    def counters(self):
+        return (
+            set(ProductPairCount.objects.values_list('product_id', 'other_id', 'orders')),
+            RecommendationState.objects.values_list('orders', flat=True).get(),
+            dict(CountedOrder.objects.values_list('pk', 'products')),
+            dict(ProductRecommendation.objects.exclude(items=[]).values_list('pk', 'items')),
+        )
+
+    def assertMatchesRebuild(self):
+        counters = self.counters()
+        rebuild_recommendations()
+        self.assertEqual(counters, self.counters())
+
+    def test_inactive_products_and_cancelled_orders_are_skipped(self):
+        self.order(0, 1)
+        self.order(0, 1)
+        cancelled = self.order(0, 2)
+        self.order(0, 2)
+        self.assertEqual(len(self.recommended(0)), 2)
+        # Отмена уже учтенного заказа вычитает его пары при коммите
+        cancelled.status = Order.STATUS_CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled.save()
+        self.assertEqual(self.recommended(0), [self.products[1].pk])
+        self.assertEqual(RecommendationState.objects.get().orders, 3)
+        self.assertEqual(rebuild_recommendations(), (4, 3))
+        self.assertEqual(self.recommended(0), [self.products[1].pk])
+        cache.clear()
+        self.products[1].is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].save()
+        self.assertEqual(self.recommended(0), [])
+
+    def test_counted_order_changes_match_rebuild(self):
+        first = self.order(0, 1)
+        self.order(0, 1)
+        second = self.order(0, 2)
+        self.order(0, 2, 3)
+        self.assertMatchesRebuild()
+
+        # Отмена и возврат из отмены
+        second = Order.objects.get(pk=second.pk)
+        second.status = Order.STATUS_CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            second.save()
+        self.assertEqual(ProductPairCount.objects.get(product=self.products[0], other=self.products[2]).orders, 1)
+        self.assertMatchesRebuild()
+        second.status = Order.STATUS_PENDING
+        with self.captureOnCommitCallbacks(execute=True):
+            second.save()
+        self.assertEqual(self.recommended(0), [self.products[1].pk, self.products[2].pk])
+        self.assertMatchesRebuild()
+
+        # Позиции учтенного заказа: добавление, перенос в другой заказ, удаление заказа
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=first, variant=self.variants[3], price_at_time=Decimal('100.00'))
+        self.assertEqual(
+            CountedOrder.objects.get(pk=first.pk).products, [self.products[i].pk for i in (0, 1, 3)],
+        )
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.filter(order=first, variant=self.variants[3]).update(order=second)
+        self.assertMatchesRebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(pk=second.pk).delete()
+        self.assertEqual(ProductPairCount.objects.get(product=self.products[3], other=self.products[2]).orders, 1)
+        self.assertMatchesRebuild()
+        self.assertEqual(self.recommended(0), [self.products[1].pk])
+
+    def test_rebuild_matches_incremental_update(self):
+        # Последний заказ со всеми товарами: их top-k пересчитаны по итоговым счетчикам
+        for indexes in ((0, 1), (0, 1, 2), (1, 2), (3, 0), (3, 0), (0, 1, 2, 3)):
+            self.order(*indexes)
+        incremental = dict(ProductRecommendation.objects.values_list('pk', 'items'))
+        pairs = set(ProductPairCount.objects.values_list('product_id', 'other_id', 'orders'))
+        self.assertEqual(update_recommendations(), (0, 0))
+
+        out = StringIO()
+        call_command('rebuild_recommendations', stdout=out)
+        self.assertIn('Заказов: 6', out.getvalue())
+        self.assertEqual(set(ProductPairCount.objects.values_list('product_id', 'other_id', 'orders')), pairs)
+        rebuilt = dict(ProductRecommendation.objects.values_list('pk', 'items'))
+        self.assertEqual(rebuilt, incremental)
@@ -0,0 +1,126 @@
+# st/tests/test_routers.py
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from st import routers
+from st.catalog import get_catalog_version
+from st.middleware import PRIMARY_PIN_COOKIE, PrimaryPinningMiddleware
+from st.models import Order, Product, ProductVariant, TechType
+
+REPLICA, BROKEN = 'replica', 'replica_broken'
+
+
+@override_settings(ST_DB_REPLICAS=[REPLICA])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    # Без транзакции TestCase: внутри транзакции основной базы роутер не читает реплики
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Реплика - второй файл SQLite, заполняемый sync_replicas из тестовой базы. Алиасы добавляются
+        # после настройки тестовых баз раннером и разрешаются для запросов только на время класса
+        cls.databases = {'default', REPLICA, BROKEN}
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias, path in ((REPLICA, cls.directory.name), (BROKEN, os.path.join(cls.directory.name, 'нет'))):
+            connections.settings[alias] = {
+                **connections['default'].settings_dict, 'NAME': os.path.join(path, 'replica.sqlite3'),
+            }
+        call_command('sync_replicas', stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in (REPLICA, BROKEN):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+        cls.databases = {'default'}
+        super().tearDownClass()
+
+    def setUp(self):
+        routers._status.clear()
+        # Запись вне запроса закрепляет чтение до конца контекста: у каждого теста свое состояние
+        self.addCleanup(routers.end_request, routers.start_request())
+
+    def test_catalog_reads_go_to_replica(self):
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            self.assertEqual(list(Product.objects.all()), [])
+        self.assertEqual(len(queries), 2)  # проверка доступности и сам запрос
+        self.assertEqual(ProductVariant.objects.all().db, REPLICA)
+        # Заказы, запись и блокирующее чтение - основная база
+        self.assertEqual(Order.objects.all().db, 'default')
+        self.assertEqual(ProductVariant.objects.select_for_update().db, 'default')
+        self.assertEqual(router.db_for_write(Order), 'default')
+        product = Product(name='Телефон')
+        product._state.db = REPLICA
+        self.assertEqual(router.db_for_read(ProductVariant, instance=product), REPLICA)
+        with transaction.atomic():
+            self.assertEqual(Product.objects.all().db, 'default')
+        self.assertFalse(router.allow_migrate(REPLICA, 'st'))
+
+    def test_write_pins_reads_to_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(Product.objects.all().db)
+            router.db_for_write(Order)
+            seen.append(Product.objects.all().db)
+            router.db_for_write(ProductVariant)
+            seen.append(Product.objects.all().db)
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        response = middleware(RequestFactory().post('/'))
+        self.assertEqual(seen, [REPLICA, REPLICA, 'default'])
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], routers.get_replica_lag())
+        # Закрепление заканчивается с запросом, дальше - по cookie
+        self.assertEqual(Product.objects.all().db, REPLICA)
+        seen.clear()
+        request = RequestFactory().get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        middleware(request)
+        self.assertEqual(seen[0], 'default')
+
+    def test_failover_to_primary(self):
+        with override_settings(ST_DB_REPLICAS=[BROKEN]), self.assertLogs('st.routers', 'WARNING'):
+            self.assertEqual(Product.objects.all().db, 'default')
+        # Исключенная реплика не проверяется до ST_DB_REPLICA_CHECK_INTERVAL
+        with override_settings(ST_DB_REPLICAS=[BROKEN, REPLICA]), self.assertNoLogs('st.routers'):
+            self.assertEqual({Product.objects.all().db for _ in range(10)}, {REPLICA})
+        with override_settings(ST_DB_REPLICAS=[BROKEN], ST_DB_REPLICA_CHECK_INTERVAL=0), \
+                self.assertLogs('st.routers', 'WARNING'):
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_recent_version_bump_reads_primary(self):
+        cache.clear()
+        tech_type = TechType.objects.create(name='Смартфоны')
+        self.addCleanup(tech_type.delete)
+        product = Product.objects.create(name='Новинка', tech_type=tech_type)
+        self.addCleanup(product.delete)
+        # Другой клиент без cookie: реплика еще не видит товар, но версия каталога уже сброшена -
+        # страница под новой версией строится и кэшируется по основной базе
+        response = self.client.get(reverse('product_user_list'))
+        self.assertContains(response, 'Новинка')
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse('product_user_list')), 'Новинка')
+
+        self.addCleanup(routers.end_request, routers.start_request())
+        get_catalog_version()
+        self.assertEqual(Product.objects.all().db, 'default')
+        # Через ST_DB_REPLICA_LAG после сброса чтение снова идет на реплику
+        routers.start_request()
+        with mock.patch('st.versions.time.time', return_value=time.time() + routers.get_replica_lag()):
+            get_catalog_version()
+        self.assertEqual(Product.objects.all().db, REPLICA)
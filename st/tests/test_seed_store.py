@@ -0,0 +1,47 @@
+# st/tests/test_seed_store.py
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from st.models import Category, Favorite, Order, Product, ProductVariant, Review, User
+
+
+class SeedStoreCommandTests(TestCase):
+    def seed(self, **options):
+        defaults = dict(products=60, reviews=300, users=20, favorites=50, orders=40, batch_size=17, verbosity=0)
+        defaults.update(options)
+        call_command('seed_store', stdout=StringIO(), **defaults)
+
+    def test_counts_and_derived_data_are_consistent(self):
+        self.seed()
+        self.assertEqual(Product.objects.count(), 60)
+        self.assertEqual(ProductVariant.objects.count(), 300)
+        self.assertEqual(Review.objects.count(), 300)
+        self.assertEqual(Favorite.objects.count(), 50)
+        self.assertEqual(Order.objects.count(), 40)
+        # Сводки рейтинга, итоги заказов и пути категорий сгенерированы согласованными
+        self.assertEqual(Product.objects.all().rebuild_rating_summaries(), 0)
+        self.assertEqual(Category.objects.rebuild_tree(), 0)
+        totals = dict(Order.objects.values_list('pk', 'total_price'))
+        Order.objects.all().recalculate_totals()
+        self.assertEqual(dict(Order.objects.values_list('pk', 'total_price')), totals)
+
+    def test_same_seed_is_deterministic_and_not_repeated(self):
+        self.seed(seed=1)
+        with self.assertRaises(CommandError):
+            self.seed(seed=1)
+        snapshot = list(ProductVariant.objects.order_by('sku').values_list('sku', 'price', 'stock_quantity', 'product__name'))
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        User.objects.filter(username__startswith='seed1_').delete()
+        self.seed(seed=1)
+        # id новых строк другие, поэтому сравниваем по позициям в порядке создания
+        rerun = list(ProductVariant.objects.order_by('pk').values_list('price', 'stock_quantity', 'product__name'))
+        self.assertEqual(rerun, [row[1:] for row in sorted(snapshot, key=lambda row: _sku_order(row[0]))])
+
+
+def _sku_order(sku):
+    _, product_id, index = sku.split('-')
+    return int(product_id), int(index)
@@ -0,0 +1,133 @@
+# st/tests/test_thumbnails.py
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from st.models import Product, ProductCard, ProductVariant, TechType
+from st.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, thumbnail_html, thumbnail_name
+
+
+def image_bytes(size=(800, 600), color=(200, 30, 30, 255), fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGBA' if fmt == 'PNG' else 'RGB', size, color[:4] if fmt == 'PNG' else color[:3]).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_type = TechType.objects.create(name='Смартфоны')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.product = Product.objects.create(name='Телефон', tech_type=cls.tech_type)
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, ST_THUMBNAIL_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_variant(self, sku='P-1', content=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            variant = ProductVariant.objects.create(
+                product=self.product, price=Decimal('1000.00'), sku=sku,
+                image=SimpleUploadedFile(f'{sku}.png', content or image_bytes()),
+            )
+        variant.refresh_from_db()
+        return variant
+
+    def test_upload_generates_all_sizes_and_formats(self):
+        variant = self.create_variant()
+        self.assertEqual(len(variant.image_hash), 16)
+        for size in THUMBNAIL_SIZES:
+            for ext in THUMBNAIL_FORMATS:
+                with default_storage.open(thumbnail_name(variant.image.name, variant.image_hash, size, ext)) as f:
+                    with Image.open(f) as thumbnail:
+                        # 800x600 вписывается в квадрат с сохранением пропорций
+                        self.assertEqual(thumbnail.size, (size, size * 3 // 4))
+                        self.assertEqual(thumbnail.format, THUMBNAIL_FORMATS[ext][0])
+        # Хэш попадает и в карточку товара для списков
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).image_hash, variant.image_hash)
+
+    def test_picture_markup(self):
+        variant = self.create_variant()
+        html = thumbnail_html(variant.image, variant.image_hash, 100, alt='P-1')
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn(f'{variant.image_hash}-128.webp 1x, ', html)
+        self.assertIn(f'{variant.image_hash}-256.webp 2x', html)
+        self.assertIn(f'src="/media/product_variants/{variant.image_hash}-128.jpg"', html)
+        self.assertIn('max-width: 100px', html)
+        # Миниатюры еще не готовы - исходное изображение
+        self.assertEqual(
+            thumbnail_html(variant.image, '', 50),
+            f'<img src="{variant.image.url}" alt="" style="max-width: 50px; max-height: 50px;" loading="lazy">',
+        )
+        self.assertEqual(thumbnail_html(ProductVariant(image=None).image, '', 50), '')
+
+    def test_new_upload_gets_new_hash_and_identical_content_is_shared(self):
+        first = self.create_variant('P-1')
+        same = self.create_variant('P-2')
+        self.assertEqual(first.image_hash, same.image_hash)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = SimpleUploadedFile('new.png', image_bytes(color=(10, 200, 10, 128)))
+            first.save()
+        first.refresh_from_db()
+        self.assertNotEqual(first.image_hash, same.image_hash)
+        # Прозрачность в JPEG заменяется белым фоном
+        with default_storage.open(thumbnail_name(first.image.name, first.image_hash, 64, 'jpg')) as f:
+            with Image.open(f) as thumbnail:
+                self.assertEqual(thumbnail.mode, 'RGB')
+
+    def test_reassigned_storage_name_resets_hash(self):
+        first = self.create_variant('P-1')
+        default_storage.save('product_variants/b.png', io.BytesIO(image_bytes(color=(10, 10, 200, 255))))
+        old_hash = first.image_hash
+        # Повторное сохранение без замены файла хэш не сбрасывает
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        first.refresh_from_db()
+        self.assertEqual(first.image_hash, old_hash)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = 'product_variants/b.png'
+            first.save()
+        first.refresh_from_db()
+        self.assertEqual(first.image.name, 'product_variants/b.png')
+        self.assertEqual(len(first.image_hash), 16)
+        self.assertNotEqual(first.image_hash, old_hash)
+        self.assertTrue(default_storage.exists(thumbnail_name(first.image.name, first.image_hash, 64, 'webp')))
+
+    def test_backfill_command_skips_broken_images(self):
+        default_storage.save('product_variants/old.jpg', io.BytesIO(image_bytes(size=(300, 300), fmt='JPEG')))
+        default_storage.save('product_variants/broken.jpg', io.BytesIO(b'not an image'))
+        with self.assertLogs('st.thumbnails', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            old = ProductVariant.objects.create(product=self.product, price=Decimal('10.00'), sku='OLD', image='product_variants/old.jpg')
+            broken = ProductVariant.objects.create(product=self.product, price=Decimal('20.00'), sku='BAD', image='product_variants/broken.jpg')
+        ProductVariant.objects.update(image_hash='')
+        with self.assertLogs('st.thumbnails', 'WARNING'):
+            call_command('generate_thumbnails', workers=1, stdout=StringIO(), stderr=StringIO())
+        old.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual((len(old.image_hash), broken.image_hash), (16, ''))
+        # 300px: миниатюра 512 не больше оригинала
+        with default_storage.open(thumbnail_name(old.image.name, old.image_hash, 512, 'webp')) as f:
+            with Image.open(f) as thumbnail:
+                self.assertEqual(thumbnail.size, (300, 300))
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).image_hash, old.image_hash)
+
+    def test_pages_render_pictures(self):
+        variant = self.create_variant()
+        detail = self.client.get(reverse('product_detail_view', args=[self.product.pk])).content.decode()
+        self.assertIn(f'{variant.image_hash}-64.webp', detail)
+        listing = self.client.get(reverse('product_user_list')).content.decode()
+        self.assertIn(f'{variant.image_hash}-256.webp 2x', listing)  # 80px на экране 2x
@@ -0,0 +1,168 @@
+# st/tests/test_views.py
+"""Бюджеты SQL-запросов для всех URL из st.urls на данных реалистичного объема."""
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import URLPattern, reverse
+
+from st import urls as st_urls
+from st.invoices import invalidate_invoice
+
+from .data import seed_store
+from .perf import QueryBudgetTestCase
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='st_perf_media_')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StoreViewsQueryBudgetTests(QueryBudgetTestCase):
+    # Имя URL -> максимально допустимое число SQL-запросов
+    BUDGETS = {
+        'products_demo_extended_list': 2,
+        'products_optimized_list': 1,
+        'product_search': 2,
+        'catalog': 10,
+        'tech_type_list': 1,
+        'tech_type_create': 0,
+        'tech_type_detail': 1,
+        'tech_type_update': 1,
+        'tech_type_delete': 1,
+        'product_user_list': 3,
+        'product_user_create': 2,
+        'product_detail_view': 7,
+        'product_user_update': 4,
+        'product_user_delete': 1,
+        # Асинхронные версии: те же запросы, что у синхронных вьюх
+        'async_product_list': 3,
+        'async_product_detail': 7,
+        'async_product_search': 2,
+        'admin_order_pdf': 5,
+        # Сессия, пользователь и четыре запроса к сводкам продаж
+        'admin_sales_dashboard': 6,
+        # Сессия и пользователь (форма загрузки)
+        'admin_catalog_import': 2,
+        'old_product_redirect': 1,
+        'metrics': 2,
+        # Товары со всеми include: страница, варианты, категории, характеристики, скидки, окно акций
+        'api_product_list': 6,
+        'api_product_detail': 6,
+        'api_variant_list': 3,
+        'api_variant_detail': 3,
+        'api_category_list': 1,
+        'api_category_detail': 1,
+        'api_tech_type_list': 1,
+        'api_tech_type_detail': 1,
+        'api_review_list': 1,
+        'api_review_detail': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_store()
+        cls.product = cls.data['products'][0]
+        cls.tech_type = cls.data['tech_types'][0]
+        cls.order = cls.data['orders'][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_every_url_has_budget(self):
+        names = {pattern.name for pattern in st_urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+        self.assertEqual(names - set(self.BUDGETS), set(), "Для новых URL нужно задать бюджет запросов")
+
+    def test_product_search_and_catalog(self):
+        self.measure('product_search', reverse('product_search'), self.BUDGETS['product_search'], {'q': 'товар'})
+        self.measure('catalog', reverse('catalog'), self.BUDGETS['catalog'])
+        self.measure(
+            'catalog', reverse('catalog'), self.BUDGETS['catalog'],
+            {'tech_type': self.tech_type.pk, 'category': self.data['categories'][0].pk, 'in_stock': '1'},
+        )
+
+    def test_demo_lists(self):
+        for name in ('products_demo_extended_list', 'products_optimized_list'):
+            self.measure(name, reverse(name), self.BUDGETS[name])
+
+    def test_tech_type_crud(self):
+        for name in ('tech_type_list', 'tech_type_create'):
+            self.measure(name, reverse(name), self.BUDGETS[name])
+        for name in ('tech_type_detail', 'tech_type_update', 'tech_type_delete'):
+            self.measure(name, reverse(name, args=[self.tech_type.pk]), self.BUDGETS[name])
+
+    def test_product_list_pages(self):
+        url = reverse('product_user_list')
+        response = self.measure('product_user_list', url, self.BUDGETS['product_user_list'])
+        self.assertEqual(len(response.context['products']), 10)
+        # Глубокие страницы стоят столько же, сколько первая
+        cursor = response.context['page_obj'].next_cursor
+        self.measure('product_user_list', url, self.BUDGETS['product_user_list'], {'cursor': cursor})
+
+    def test_product_crud(self):
+        self.measure('product_user_create', reverse('product_user_create'), self.BUDGETS['product_user_create'])
+        for name in ('product_detail_view', 'product_user_update', 'product_user_delete'):
+            self.measure(name, reverse(name, args=[self.product.pk]), self.BUDGETS[name])
+
+    def test_async_views(self):
+        self.measure('async_product_list', reverse('async_product_list'), self.BUDGETS['async_product_list'])
+        self.measure(
+            'async_product_detail', reverse('async_product_detail', args=[self.product.pk]),
+            self.BUDGETS['async_product_detail'],
+        )
+        self.measure(
+            'async_product_search', reverse('async_product_search'), self.BUDGETS['async_product_search'], {'q': 'товар'},
+        )
+
+    def test_admin_order_pdf(self):
+        self.client.force_login(self.data['admin'])
+        url = reverse('admin_order_pdf', args=[self.order.pk])
+        self.measure('admin_order_pdf', url, self.BUDGETS['admin_order_pdf'])
+
+    def test_admin_order_pdf_when_cached_file_is_pruned(self):
+        # Параллельный store_invoice другой версии удалил файл между записью и открытием
+        self.client.force_login(self.data['admin'])
+        url = reverse('admin_order_pdf', args=[self.order.pk])
+        invalidate_invoice(self.order.pk)
+        with mock.patch('st.invoices.get_invoice_path', return_value=os.path.join(MEDIA_ROOT, 'нет.pdf')):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_admin_sales_dashboard(self):
+        self.client.force_login(self.data['admin'])
+        url = reverse('admin_sales_dashboard')
+        self.measure('admin_sales_dashboard', url, self.BUDGETS['admin_sales_dashboard'])
+        self.measure('admin_sales_dashboard', url, self.BUDGETS['admin_sales_dashboard'], {'days': 365, 'status': 'delivered'})
+
+    def test_admin_catalog_import(self):
+        self.client.force_login(self.data['admin'])
+        self.measure('admin_catalog_import', reverse('admin_catalog_import'), self.BUDGETS['admin_catalog_import'])
+
+    def test_metrics(self):
+        self.client.force_login(self.data['admin'])
+        self.measure('metrics', reverse('metrics'), self.BUDGETS['metrics'])
+
+    def test_api(self):
+        include = {'include': 'tech_type,categories,specifications,variants'}
+        self.measure('api_product_list', reverse('api_product_list'), self.BUDGETS['api_product_list'], include)
+        self.measure(
+            'api_product_list', reverse('api_product_list'), self.BUDGETS['api_product_list'],
+            {**include, 'page_size': 500},
+        )
+        self.measure(
+            'api_product_detail', reverse('api_product_detail', args=[self.product.pk]),
+            self.BUDGETS['api_product_detail'], include,
+        )
+        variant = self.data['variants'][0]
+        review = self.product.reviews.filter(is_moderated=True).first()
+        for name, pk in (('variant', variant.pk), ('category', self.data['categories'][0].pk),
+                         ('tech_type', self.tech_type.pk), ('review', review.pk)):
+            self.measure(f'api_{name}_list', reverse(f'api_{name}_list'), self.BUDGETS[f'api_{name}_list'])
+            self.measure(f'api_{name}_detail', reverse(f'api_{name}_detail', args=[pk]), self.BUDGETS[f'api_{name}_detail'])
+
+    def test_old_product_redirect(self):
+        url = reverse('old_product_redirect', args=['1'])
+        self.measure('old_product_redirect', url, self.BUDGETS['old_product_redirect'], status=302)
@@ -0,0 +1,263 @@
+# st/thumbnails.py
+"""
+Миниатюры изображений вариантов товаров (WebP и JPEG).
+
+Для каждого ProductVariant.image создаются миниатюры, вписанные в квадраты THUMBNAIL_SIZES,
+в двух форматах. Они лежат рядом с оригиналом под именами из хэша содержимого:
+product_variants/<хэш>-<размер>.<webp|jpg>. Одинаковые файлы дают одни и те же миниатюры,
+а новое содержимое - новые URL, поэтому миниатюры можно отдавать с долгим кэшированием.
+Хэш хранится в ProductVariant.image_hash; пока он пуст, выводится исходное изображение.
+
+После загрузки нового файла миниатюры строятся в фоновом пуле потоков (после коммита,
+ST_THUMBNAIL_WORKERS; 0 - сразу в текущем потоке). Pillow отпускает GIL при декодировании,
+масштабировании и кодировании, поэтому потоки работают параллельно. Существующие изображения
+обрабатывает команда generate_thumbnails (пул процессов).
+
+В шаблонах - тег {% thumbnail %} (st/templatetags/st_images.py): <picture> с WebP и JPEG
+и srcset для экранов 1x/2x.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+from .cards import refresh_product_cards
+from .models import ProductVariant
+from .pagecache import bump_section_versions, touch_products
+
+logger = logging.getLogger(__name__)
+
+# Стороны квадратов (px), в которые вписываются миниатюры; изображение не увеличивается
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+# расширение -> (формат Pillow, параметры сохранения)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+HASH_LENGTH = 16
+THUMBNAIL_BATCH_SIZE = 200
+
+
+def thumbnail_workers():
+    return getattr(settings, 'ST_THUMBNAIL_WORKERS', 2)
+
+
+# --- Рендеринг ---
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def thumbnail_name(name, image_hash, size, ext):
+    """Имя миниатюры в хранилище: в каталоге оригинала, по хэшу содержимого."""
+    return posixpath.join(posixpath.dirname(name), f'{image_hash}-{size}.{ext}')
+
+
+def _encode(image, ext):
+    fmt, options = THUMBNAIL_FORMATS[ext]
+    if fmt == 'JPEG' and image.mode == 'RGBA':
+        # В JPEG нет прозрачности: подкладываем белый фон
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def render_thumbnails(name, storage=None):
+    """
+    Создает недостающие миниатюры изображения name и возвращает хэш его содержимого.
+    Не обращается к БД, поэтому подходит для пула процессов. Ошибки чтения и декодирования
+    (OSError, в том числе PIL.UnidentifiedImageError) передаются вызывающему.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    image_hash = content_hash(data)
+    missing = {
+        (size, ext) for size in THUMBNAIL_SIZES for ext in THUMBNAIL_FORMATS
+        if not storage.exists(thumbnail_name(name, image_hash, size, ext))
+    }
+    if not missing:
+        return image_hash
+
+    with Image.open(io.BytesIO(data)) as original:
+        largest = max(size for size, _ in missing)
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2..1/8), если оригинал намного больше
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        # От большего размера к меньшему: каждый следующий масштабируется из предыдущего
+        for size in sorted({size for size, _ in missing}, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)
+            for ext in THUMBNAIL_FORMATS:
+                if (size, ext) in missing:
+                    storage.save(thumbnail_name(name, image_hash, size, ext), ContentFile(_encode(image, ext)))
+    return image_hash
+
+
+def _render_or_none(name):
+    # Для пула процессов: одно битое изображение не должно прерывать обработку остальных
+    try:
+        return render_thumbnails(name)
+    except FileNotFoundError:
+        # Ссылка на отсутствующий файл (например, после переноса медиа) - не ошибка изображения
+        logger.info("Файл изображения %s не найден", name)
+        return None
+    except (OSError, Image.DecompressionBombError):
+        logger.warning("Не удалось построить миниатюры для %s", name, exc_info=True)
+        return None
+
+
+def generate_variant_thumbnails(variant_id, name, using=None):
+    """
+    Строит миниатюры и сохраняет хэш у варианта, если его изображение все еще name.
+    save() вызывает сигналы: карточка товара и кэш страницы обновляются как при любом изменении.
+    """
+    image_hash = _render_or_none(name)
+    if image_hash is None:
+        return None
+    variant = ProductVariant.objects.using(using).filter(pk=variant_id, image=name).first()
+    if variant is not None and variant.image_hash != image_hash:
+        variant.image_hash = image_hash
+        variant.save(using=using, update_fields=['image_hash'])
+    return image_hash
+
+
+def backfill_thumbnails(workers=None, batch_size=THUMBNAIL_BATCH_SIZE, check_all=False):
+    """
+    Строит миниатюры для вариантов без image_hash (check_all - для всех вариантов с изображением,
+    досоздавая удаленные файлы) в пуле процессов. Одинаковые файлы обрабатываются один раз.
+    Хэши сохраняются bulk_update без сигналов, поэтому карточки и кэш страниц обновляются здесь же.
+    Возвращает (число обработанных вариантов, число изображений с ошибкой).
+    """
+    variants = ProductVariant.objects.exclude(image='').exclude(image__isnull=True)
+    if not check_all:
+        variants = variants.filter(image_hash='')
+    rows = list(variants.order_by('pk').values_list('pk', 'product_id', 'image', 'image_hash'))
+    names = list(dict.fromkeys(name for _, _, name, _ in rows))
+    hashes = {}
+    executor = None
+    try:
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            if len(batch) > 1 and workers != 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                hashes.update(zip(batch, executor.map(_render_or_none, batch)))
+            else:
+                hashes.update((name, _render_or_none(name)) for name in batch)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    changed = [
+        ProductVariant(pk=pk, product_id=product_id, image_hash=hashes[name])
+        for pk, product_id, name, image_hash in rows
+        if hashes[name] is not None and hashes[name] != image_hash
+    ]
+    if changed:
+        ProductVariant.objects.bulk_update(changed, ['image_hash'], batch_size=batch_size)
+        product_ids = {variant.product_id for variant in changed}
+        refresh_product_cards(product_ids)
+        bump_section_versions(product_ids, 'variants')
+        touch_products(product_ids)
+    failed = sum(1 for image_hash in hashes.values() if image_hash is None)
+    return len(rows), failed
+
+
+# --- Фоновый пул ---
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=thumbnail_workers(), thread_name_prefix='st-thumbnails')
+        return _executor
+
+
+def _run_in_worker(variant_id, name, using):
+    try:
+        return generate_variant_thumbnails(variant_id, name, using)
+    finally:
+        # Соединения с БД у каждого потока свои: не оставляем их открытыми в пуле
+        connections.close_all()
+
+
+def schedule_thumbnails(variant_id, name, using=None):
+    """Ставит построение миниатюр в фоновый пул (при ST_THUMBNAIL_WORKERS = 0 - выполняет сразу)."""
+    if thumbnail_workers() <= 0:
+        return generate_variant_thumbnails(variant_id, name, using)
+    return _get_executor().submit(_run_in_worker, variant_id, name, using)
+
+
+@receiver(pre_save, sender=ProductVariant)
+def variant_image_pre_save_receiver(sender, instance, raw=False, **kwargs):
+    # Новый файл еще не записан в хранилище (_committed = False), изображение удалено или заменено
+    # другим файлом хранилища (имя отличается от загруженного из БД): миниатюры прежнего
+    # содержимого больше не подходят
+    if raw:
+        return
+    image = instance.image
+    if not image or not image._committed or image.name != getattr(instance, '_loaded_image_name', image.name):
+        instance.image_hash = ''
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_image_post_save_receiver(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    instance._loaded_image_name = instance.image.name or ''
+    if not instance.image or instance.image_hash:
+        return
+    variant_id, name = instance.pk, instance.image.name
+    transaction.on_commit(lambda: schedule_thumbnails(variant_id, name, using), using=using)
+
+
+# --- Вывод ---
+def _srcset(image, image_hash, size, ext):
+    """srcset для рамки size px: миниатюра не меньше size (1x) и не меньше 2*size (2x)."""
+    candidates = []
+    for density in (1, 2):
+        box = next((s for s in THUMBNAIL_SIZES if s >= size * density), THUMBNAIL_SIZES[-1])
+        url = image.storage.url(thumbnail_name(image.name, image_hash, box, ext))
+        if not candidates or candidates[-1][0] != url:
+            candidates.append((url, density))
+    return candidates
+
+
+def thumbnail_html(image, image_hash, size, alt='', style=''):
+    """
+    <picture> с WebP- и JPEG-миниатюрами, вписанными в рамку size px; без готовых миниатюр -
+    исходное изображение с той же рамкой. image - FieldFile (ProductVariant.image, ProductCard.image).
+    """
+    if not image:
+        return ''
+    style = f'max-width: {size}px; max-height: {size}px; {style}'.strip()
+    if not image_hash:
+        return format_html('<img src="{}" alt="{}" style="{}" loading="lazy">', image.url, alt, style)
+    webp = _srcset(image, image_hash, size, 'webp')
+    jpeg = _srcset(image, image_hash, size, 'jpg')
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" alt="{}" style="{}" loading="lazy"></picture>',
+        ', '.join(f'{url} {density}x' for url, density in webp),
+        jpeg[0][0],
+        ', '.join(f'{url} {density}x' for url, density in jpeg),
+        alt, style,
+    )
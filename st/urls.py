@@ -1,11 +1,19 @@
 # st/urls.py
 from django.urls import path
-from . import views
+from . import api, views
+
+_list = {'get': 'list'}
+_detail = {'get': 'retrieve'}
 
 urlpatterns = [
     # Демонстрационные URL для различных функций ORM и Django
     path('products-demo-extended/', views.product_list_view_extended, name='products_demo_extended_list'),
     path('products-optimized/', views.optimized_product_list_view, name='products_optimized_list'),
+
+    # Полнотекстовый поиск товаров (JSON)
+    path('search/', views.product_search_view, name='product_search'),
+    # Каталог с фасетными фильтрами и счетчиками (JSON)
+    path('catalog/', views.catalog_view, name='catalog'),
     
     # CRUD для модели TechType
     path('techtypes/', views.TechTypeListView.as_view(), name='tech_type_list'),
@@ -22,9 +30,33 @@ urlpatterns = [
     path('product/<int:pk>/update/', views.ProductUpdateUserView.as_view(), name='product_user_update'), # Изменил URL
     path('product/<int:pk>/delete/', views.ProductDeleteUserView.as_view(), name='product_user_delete'), # Изменил URL
 
+    # Асинхронные версии списка, страницы товара и поиска (для ASGI, см. iat/asgi.py)
+    path('async/products/', views.async_product_list_view, name='async_product_list'),
+    path('async/product/<int:pk>/', views.async_product_detail_view, name='async_product_detail'),
+    path('async/search/', views.async_product_search_view, name='async_product_search'),
+
     # Генерация PDF для заказа из админки
     path('admin/order/<int:order_id>/pdf/', views.admin_order_pdf, name='admin_order_pdf'),
+    # Дашборд продаж по сводкам за день (см. st/analytics.py)
+    path('admin/sales/', views.admin_sales_dashboard, name='admin_sales_dashboard'),
+    # Импорт товаров и вариантов из CSV/JSON (см. st/imports.py)
+    path('admin/catalog/import/', views.admin_catalog_import, name='admin_catalog_import'),
     
+    # JSON API каталога только для чтения (см. st/api.py)
+    path('api/products/', api.ProductViewSet.as_view(_list), name='api_product_list'),
+    path('api/products/<int:pk>/', api.ProductViewSet.as_view(_detail), name='api_product_detail'),
+    path('api/variants/', api.VariantViewSet.as_view(_list), name='api_variant_list'),
+    path('api/variants/<int:pk>/', api.VariantViewSet.as_view(_detail), name='api_variant_detail'),
+    path('api/categories/', api.CategoryViewSet.as_view(_list), name='api_category_list'),
+    path('api/categories/<int:pk>/', api.CategoryViewSet.as_view(_detail), name='api_category_detail'),
+    path('api/tech-types/', api.TechTypeViewSet.as_view(_list), name='api_tech_type_list'),
+    path('api/tech-types/<int:pk>/', api.TechTypeViewSet.as_view(_detail), name='api_tech_type_detail'),
+    path('api/reviews/', api.ReviewViewSet.as_view(_list), name='api_review_list'),
+    path('api/reviews/<int:pk>/', api.ReviewViewSet.as_view(_detail), name='api_review_detail'),
+
+    # Метрики производительности в формате Prometheus (только для персонала)
+    path('metrics/', views.metrics_view, name='metrics'),
+
     # Пример редиректа для старых URL продуктов
     path('old-product/<str:old_id>/', views.old_product_redirect_view, name='old_product_redirect'),
 ]
\ No newline at end of file
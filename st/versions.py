@@ -0,0 +1,96 @@
+# st/versions.py
+"""
+Версии данных в кэше: каталог, отзывы, акции и разделы страницы товара.
+
+Закэшированные страницы, фрагменты, фасеты и ETag API строятся по ключу с текущей версией;
+изменение данных увеличивает версию, и старые записи просто перестают читаться.
+
+Версия живет в кэше не дольше page_cache_timeout(), как и сами страницы. С общим кэшем
+(Redis, Memcached) это лишь изредка дает лишний промах, а с локальным кэшем процесса
+(LocMemCache) ограничивает время, в течение которого другие воркеры, не видевшие сброса,
+отдают устаревшие данные. Новая версия начинается со случайного числа, поэтому после истечения
+или очистки кэша она не совпадает с прежними и не находит записи, закэшированные под ними.
+
+Если каталог читается с реплик (st/routers.py), рядом с версией хранится время ее сброса:
+запрос, прочитавший версию моложе ST_DB_REPLICA_LAG, читает каталог из основной базы.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import routers
+
+
+def page_cache_timeout():
+    return getattr(settings, 'ST_PAGE_CACHE_TIMEOUT', 60 * 15)
+
+
+def _initial_version():
+    return random.randrange(1, 2 ** 48)
+
+
+# --- Время сброса версии (реплики базы, st/routers.py) ---
+def _bumped_key(key):
+    return f'{key}:bumped'
+
+
+def _lookup_keys(keys):
+    # Время сброса нужно, только если каталог читается с реплик
+    return [*keys, *map(_bumped_key, keys)] if routers.get_replicas() else list(keys)
+
+
+def _pin_if_recently_bumped(found, keys):
+    """
+    Версия, сброшенная меньше ST_DB_REPLICA_LAG секунд назад, может быть новее данных реплики:
+    тогда запрос до конца читает каталог из основной базы, чтобы не закэшировать под новой
+    версией данные реплики.
+    """
+    now = time.time()
+    if any(now - found.get(_bumped_key(key), 0) < routers.get_replica_lag() for key in keys):
+        routers.pin_reads_to_primary()
+
+
+# --- Чтение и сброс ---
+def _add_version(key):
+    version = _initial_version()
+    cache.add(key, version, timeout=page_cache_timeout())
+    return cache.get(key, version)
+
+
+async def _aadd_version(key):
+    version = _initial_version()
+    await cache.aadd(key, version, timeout=page_cache_timeout())
+    return await cache.aget(key, version)
+
+
+def get_versions(keys):
+    """{ключ: версия} одним обращением к кэшу (и по обращению на каждую отсутствующую версию)."""
+    found = cache.get_many(_lookup_keys(keys))
+    _pin_if_recently_bumped(found, keys)
+    return {key: found[key] if key in found else _add_version(key) for key in keys}
+
+
+async def aget_versions(keys):
+    found = await cache.aget_many(_lookup_keys(keys))
+    _pin_if_recently_bumped(found, keys)
+    return {key: found[key] if key in found else await _aadd_version(key) for key in keys}
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+async def aget_version(key):
+    return (await aget_versions([key]))[key]
+
+
+def bump_version(key):
+    """Делает недействительными записи, закэшированные под текущей версией key."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=page_cache_timeout())
+    if routers.get_replicas():
+        cache.set(_bumped_key(key), time.time(), timeout=routers.get_replica_lag())
@@ -1,17 +1,33 @@
 # st/views.py
 from django.shortcuts import render, get_object_or_404, redirect # КРИТЕРИЙ (Часть 3): return redirect
-from django.http import HttpResponse, Http404 # КРИТЕРИЙ (Часть 4): The Http404 exception
+from django.http import HttpResponse, Http404, FileResponse, JsonResponse # КРИТЕРИЙ (Часть 4): The Http404 exception
 from django.urls import reverse_lazy, reverse
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from .models import Product, Category, Review, Order, ProductVariant, TechType, User # Добавил User
-from .forms import TechTypeForm, ProductUserForm # Добавил ProductUserForm
+from .models import Product, ProductCard, Category, Review, Order, ProductVariant, TechType, User # Добавил User
+from .forms import CatalogImportForm, TechTypeForm, ProductUserForm # Добавил ProductUserForm
+from .search import asearch_products, search_products
+from .catalog import CatalogFilters, aget_catalog_version, filtered_products, get_catalog_version, get_facets
+from .pagination import InvalidCursor, KeysetPaginationMixin, KeysetPaginator
+from .metrics import registry as metrics_registry
+from .pricing import aannotate_product_prices, aannotate_variant_prices, acurrent_window, annotate_product_prices, annotate_variant_prices, current_window
+from .pagecache import PageCacheMixin, aget_section_versions, apage_cache_key, get_section_versions, page_cache_key, page_cache_timeout, record
+from .imports import IMPORT_PERMISSIONS, ImportFormatError, detect_format, import_catalog
+from .analytics import DASHBOARD_DEFAULT_DAYS, DASHBOARD_PERIODS, sales_dashboard, svg_polyline
+from .recommendations import aget_recommendations, get_recommendations
+from django.contrib import admin
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.html import format_html, format_html_join
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import aprefetch_related_objects
 from django.db.models import Avg, Count, Sum, Min, Max, F, Q, ExpressionWrapper, DecimalField # КРИТЕРИЙ (Часть 4): F expressions (использовано в aggregate)
 from django.contrib.admin.views.decorators import staff_member_required # Для PDF
-from django.conf import settings # Для PDF
-from django.template.loader import render_to_string # Для PDF
-import weasyprint # Для PDF
-import os # Для PDF (если CSS из файла)
+from django.contrib.auth.decorators import permission_required
+from django.utils.cache import get_conditional_response # Для PDF (304 Not Modified)
+from django.utils.http import http_date, quote_etag # Для PDF
+from .invoices import invoice_etag, open_invoice # Для PDF (кэш счетов)
+import io
 
 # --- Демонстрационные Views для Части 2 и 4 ---
 
@@ -72,21 +88,107 @@ def product_list_view_extended(request):
 
 
 def optimized_product_list_view(request):
-    products = Product.objects.all() \
-        .select_related('tech_type') \
-        .prefetch_related(
-            'categories', 
-            'variants__color', 
-            'variants__size',
-            'reviews' # Добавим отзывы для примера
-        )
-    
+    # Вместо select_related/prefetch_related по пяти таблицам - карточки товаров (st.cards):
+    # тип, категории, цены, остаток и рейтинг уже лежат в одной строке
+    products = list(ProductCard.objects.all())
+
     context = {
         'products': products,
         'page_title': "Оптимизированный список товаров"
     }
     # return render(request, 'st/optimized_product_list.html', context)
-    return HttpResponse(f"<html><body><h1>Оптимизированный список товаров</h1><p>Загружено {products.count()} товаров с оптимизацией (select_related, prefetch_related).</p></body></html>")
+    rows = format_html_join(
+        '', '<li>{} ({}): {} руб., на складе {}</li>',
+        (
+            (card.get_full_name_with_brand(), card.tech_type_name, card.min_price if card.min_price is not None else '-', card.total_stock)
+            for card in products
+        ),
+    )
+    return HttpResponse(format_html(
+        "<html><body><h1>Оптимизированный список товаров</h1><p>Загружено {} товаров из карточек (один запрос).</p><ul>{}</ul></body></html>",
+        len(products), rows,
+    ))
+
+
+# --- Полнотекстовый поиск (SQLite FTS5, см. st/search.py) ---
+SEARCH_MAX_LIMIT = 100
+
+def _search_params(request):
+    """(query, limit, offset) из GET; ValueError, если limit или offset не целые."""
+    query = request.GET.get('q', '').strip()
+    limit = min(max(int(request.GET.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+    offset = max(int(request.GET.get('offset', 0)), 0)
+    return query, limit, offset
+
+
+def _search_error():
+    return JsonResponse({'error': "Параметры limit и offset должны быть целыми числами"}, status=400)
+
+
+def _search_response(query, limit, offset, products):
+    results = [
+        {
+            'id': product.pk,
+            'name': product.name,
+            'brand': product.brand,
+            'tech_type': product.tech_type.name,
+            'url': product.get_absolute_url(),
+            'rating': product.rating_avg,
+            'score': round(product.search_score, 6),
+        }
+        for product in products[:limit]
+    ]
+    return JsonResponse({
+        'query': query,
+        'offset': offset,
+        'limit': limit,
+        'has_more': len(products) > limit,
+        'results': results,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+def product_search_view(request):
+    try:
+        query, limit, offset = _search_params(request)
+    except ValueError:
+        return _search_error()
+    # Запрашиваем на один результат больше, чтобы узнать о следующей странице без COUNT(*)
+    products = search_products(query, limit=limit + 1, offset=offset) if query else []
+    return _search_response(query, limit, offset, products)
+
+
+CATALOG_MAX_LIMIT = 100
+
+def catalog_view(request):
+    try:
+        filters = CatalogFilters.from_query_dict(request.GET)
+        limit = min(max(int(request.GET.get('limit', 20)), 1), CATALOG_MAX_LIMIT)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    products = annotate_product_prices(filtered_products(filters)[offset:offset + limit + 1])
+    results = [
+        {
+            'id': product.pk,
+            'name': product.name,
+            'brand': product.brand,
+            'tech_type': product.tech_type.name,
+            'url': product.get_absolute_url(),
+            'min_price': str(product.min_price) if product.min_price is not None else None,
+            'discount_percent': str(product.discount_percent) if product.discount_percent else None,
+            'final_min_price': str(product.final_min_price) if product.final_min_price is not None else None,
+            'rating': product.rating_avg,
+        }
+        for product in products[:limit]
+    ]
+    return JsonResponse({
+        'offset': offset,
+        'limit': limit,
+        'has_more': len(products) > limit,
+        'results': results,
+        'facets': get_facets(filters),
+    }, json_dumps_params={'ensure_ascii': False})
 
 
 # --- CRUD для TechType (Часть 2) ---
@@ -141,23 +243,42 @@ class TechTypeDeleteView(DeleteView):
 
 # --- CRUD для Product (Часть 3 - FileField, URLField) ---
 # Мы будем использовать эти views для демонстрации загрузки файлов и URLField
-class ProductListViewUser(ListView):
-    model = Product
+class ProductListViewUser(PageCacheMixin, KeysetPaginationMixin, ListView):
+    model = ProductCard
     template_name = 'st/product_user_list.html' # Создайте этот шаблон
     context_object_name = 'products'
-    queryset = Product.active_products.all().select_related('tech_type').prefetch_related('categories')
-    paginate_by = 10 # Пример пагинации
+    # Карточки товаров (st.cards): страница - один запрос к одной таблице, по индексу st_card_keyset_idx
+    queryset = ProductCard.objects.filter(is_active=True)
+    paginate_by = 10 # Пагинация по курсору (?cursor=...), без OFFSET и COUNT(*)
+    cursor_ordering = ('-created_at', 'name', 'product')
+    page_cache_name = 'product_list'
+
+    def get_page_cache_key(self):
+        # Страница списка меняется только вместе с каталогом или акциями - проверка без запросов к БД
+        promo_version, _, _ = current_window()
+        cursor = self.request.GET.get(self.cursor_query_param, '')
+        return page_cache_key('products', cursor, get_catalog_version(), promo_version)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Скидки по акциям для всей страницы - один запрос (или ни одного при попадании в кэш)
+        annotate_product_prices(context['products'])
+        return context
 
-class ProductDetailViewUser(DetailView):
+class ProductDetailViewUser(PageCacheMixin, DetailView):
     model = Product
     template_name = 'st/product_user_detail.html' # Создайте этот шаблон
     context_object_name = 'product'
+    page_cache_name = 'product_detail'
 
     def get_object(self, queryset=None):
         # КРИТЕРИЙ (Часть 4): The Http404 exception
         # Если объект не найден по pk, get_object_or_404 вызовет Http404
-        obj = get_object_or_404(Product, pk=self.kwargs.get('pk'), is_active=True)
-        return obj
+        # Один запрос: по нему же проверяется кэш страницы (updated_at), остальное - только при промахе
+        if not hasattr(self, '_product'):
+            queryset = Product.objects.select_related('tech_type')
+            self._product = get_object_or_404(queryset, pk=self.kwargs.get('pk'), is_active=True)
+        return self._product
         # Если бы мы хотели кастомную обработку:
         # try:
         #     obj = Product.objects.get(pk=self.kwargs.get('pk'), is_active=True)
@@ -165,6 +286,27 @@ class ProductDetailViewUser(DetailView):
         #     raise Http404("Такой товар не найден или неактивен.")
         # return obj
 
+    def get_page_cache_key(self):
+        product = self.get_object()
+        return page_cache_key('product', product.pk, product.updated_at.isoformat())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        product = self.object
+        _, context['promo_boundary'], _ = current_window()
+        context['section_versions'] = get_section_versions(product.pk)
+        context['fragment_cache_timeout'] = page_cache_timeout()
+        # Варианты и характеристики запрашиваются, только если их фрагменты не нашлись в кэше
+        context['variants'] = SimpleLazyObject(lambda: self._priced_variants(product))
+        context['specifications'] = SimpleLazyObject(lambda: list(product.specifications.all()))
+        context['recommendations'] = get_recommendations(product.pk)
+        return context
+
+    def _priced_variants(self, product):
+        variants = list(product.variants.select_related('color', 'size'))
+        annotate_variant_prices(variants)
+        return variants
+
 
 class ProductCreateUserView(CreateView):
     model = Product
@@ -173,7 +315,7 @@ class ProductCreateUserView(CreateView):
     
     def get_success_url(self):
         # КРИТЕРИЙ (Часть 3): return redirect (success_url через метод)
-        return reverse('product_user_detail', kwargs={'pk': self.object.pk})
+        return reverse('product_detail_view', kwargs={'pk': self.object.pk})
 
     def form_valid(self, form):
         # КРИТЕРИЙ (Часть 3): File Uploads (особенности сохранения файлов в формах)
@@ -189,7 +331,7 @@ class ProductUpdateUserView(UpdateView):
     template_name = 'st/product_user_form.html'
     
     def get_success_url(self):
-        return reverse('product_user_detail', kwargs={'pk': self.object.pk})
+        return reverse('product_detail_view', kwargs={'pk': self.object.pk})
 
     def get_queryset(self):
         # Для безопасности, позволяем редактировать только свои объекты (если бы было поле user)
@@ -203,38 +345,189 @@ class ProductDeleteUserView(DeleteView):
     success_url = reverse_lazy('product_user_list')
 
 
+# --- Асинхронные версии для ASGI (iat/asgi.py) ---
+# Список, страница товара и поиск без блокировки цикла событий: асинхронный ORM (aget, async for,
+# ain_bulk) и асинхронный API кэша. Ключи кэша те же, что у синхронных вьюх, поэтому страницы общие.
+# Ленивые запросы из шаблона в асинхронном коде невозможны: все нужное шаблону загружается заранее.
+async def async_product_list_view(request):
+    view = ProductListViewUser
+    promo_version, _, _ = await acurrent_window()
+    cursor = request.GET.get(view.cursor_query_param, '')
+    key = await apage_cache_key('products', cursor, await aget_catalog_version(), promo_version)
+    content = await cache.aget(key)
+    record(f'page:{view.page_cache_name}', content is not None)
+    if content is not None:
+        return HttpResponse(content)
+
+    paginator = KeysetPaginator(view.queryset, view.cursor_ordering, view.paginate_by)
+    try:
+        page = await paginator.apage(cursor)
+    except InvalidCursor:
+        raise Http404("Некорректный курсор страницы")
+    await aannotate_product_prices(page.object_list)
+    response = render(request, view.template_name, {
+        'products': page.object_list, 'object_list': page.object_list,
+        'page_obj': page, 'paginator': paginator, 'is_paginated': page.has_other_pages(),
+    })
+    await cache.aset(key, response.content, page_cache_timeout())
+    return response
+
+
+async def async_product_detail_view(request, pk):
+    try:
+        product = await Product.objects.select_related('tech_type').aget(pk=pk, is_active=True)
+    except Product.DoesNotExist:
+        raise Http404("Такой товар не найден или неактивен.")
+    key = await apage_cache_key('product', product.pk, product.updated_at.isoformat())
+    content = await cache.aget(key)
+    record(f'page:{ProductDetailViewUser.page_cache_name}', content is not None)
+    if content is not None:
+        return HttpResponse(content)
+
+    _, promo_boundary, _ = await acurrent_window()
+    section_versions = await aget_section_versions(product.pk)
+    await aprefetch_related_objects([product], 'categories')
+    # Те же ключи, что у {% cache %} в шаблоне. Найденный HTML передается в шаблон (cached_fragments),
+    # а данные загружаются для каждого отсутствующего фрагмента: отдельная проверка наличия
+    # могла устареть к моменту рендеринга. Отрендеренные фрагменты (rendered_fragments) записываются
+    # здесь же: тег не обращается к синхронному API кэша
+    variants_key = make_template_fragment_key(
+        'product_variants', [product.pk, section_versions['variants'], promo_boundary],
+    )
+    specs_key = make_template_fragment_key('product_specs', [product.pk, section_versions['specs']])
+    cached_fragments = await cache.aget_many([variants_key, specs_key])
+    variants = specifications = []
+    rendered_fragments = {}
+    if variants_key not in cached_fragments:
+        variants = [variant async for variant in product.variants.select_related('color', 'size')]
+        await aannotate_variant_prices(variants)
+    if specs_key not in cached_fragments:
+        specifications = [spec async for spec in product.specifications.all()]
+    response = render(request, ProductDetailViewUser.template_name, {
+        'product': product, 'object': product, 'variants': variants, 'specifications': specifications,
+        'cached_fragments': cached_fragments, 'rendered_fragments': rendered_fragments,
+        'recommendations': await aget_recommendations(product.pk),
+        'section_versions': section_versions, 'promo_boundary': promo_boundary,
+        'fragment_cache_timeout': page_cache_timeout(),
+    })
+    if rendered_fragments:
+        await cache.aset_many(rendered_fragments, page_cache_timeout())
+    await cache.aset(key, response.content, page_cache_timeout())
+    return response
+
+
+async def async_product_search_view(request):
+    try:
+        query, limit, offset = _search_params(request)
+    except ValueError:
+        return _search_error()
+    products = await asearch_products(query, limit=limit + 1, offset=offset) if query else []
+    return _search_response(query, limit, offset, products)
+
+
 # --- Генерация PDF для заказа (Часть 3) ---
 # КРИТЕРИЙ (Часть 3): Генерация pdf документа в админке
 @staff_member_required # Только для персонала (администраторов)
 def admin_order_pdf(request, order_id):
+    # Для проверки условного запроса достаточно updated_at: полный заказ грузим, только если PDF нет в кэше
+    updated_at = Order.objects.filter(id=order_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404("Заказ не найден") # КРИТЕРИЙ (Часть 4): The Http404 exception
+
+    etag = quote_etag(invoice_etag(order_id, updated_at))
+    last_modified = int(updated_at.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
     try:
-        order = Order.objects.select_related('user').prefetch_related(
-            'items__variant__product', 
-            'items__variant__color', 
-            'items__variant__size'
-        ).get(id=order_id)
+        invoice = open_invoice(order_id, updated_at)
     except Order.DoesNotExist:
-        raise Http404("Заказ не найден") # КРИТЕРИЙ (Часть 4): The Http404 exception
-        
-    html = render_to_string('st/order/pdf.html', {'order': order})
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'filename="order_{order.id}.pdf"'
-    
-    # Путь к CSS файлу. Мы можем попробовать найти его в статике приложения.
-    # css_path = os.path.join(settings.STATIC_ROOT, 'st/css/pdf.css') # Для collectstatic
-    # Если STATIC_ROOT не используется/не настроен для разработки, Weasyprint может не найти CSS по этому пути.
-    # Альтернатива для разработки - передать абсолютный путь или встроить стили в HTML.
-    # В pdf.html уже есть встроенные стили, если css_path не будет передан.
-    
-    # Попытка найти CSS в статических файлах приложения (работает без collectstatic в DEBUG)
-    css_file_path_in_app = os.path.join(settings.BASE_DIR, 'st', 'static', 'st', 'css', 'pdf.css')
-    stylesheets = []
-    if os.path.exists(css_file_path_in_app):
-        stylesheets.append(weasyprint.CSS(css_file_path_in_app))
-    
-    weasyprint.HTML(string=html).write_pdf(response, stylesheets=stylesheets)
+        raise Http404("Заказ не найден")
+
+    response = FileResponse(invoice, content_type='application/pdf')
+    response['Content-Disposition'] = f'filename="order_{order_id}.pdf"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
+# --- Дашборд продаж (сводки по дням, см. st/analytics.py) ---
+CHART_WIDTH, CHART_HEIGHT = 720, 160
+
+
+@staff_member_required
+def admin_sales_dashboard(request):
+    # Неизвестные значения фильтров заменяются значениями по умолчанию
+    days = request.GET.get('days', '')
+    days = int(days) if days in {str(period) for period in DASHBOARD_PERIODS} else DASHBOARD_DEFAULT_DAYS
+    status = request.GET.get('status') if request.GET.get('status') in dict(Order.STATUS_CHOICES) else None
+    payment_method = request.GET.get('payment_method')
+    if payment_method not in dict(Order.PAYMENT_METHOD_CHOICES):
+        payment_method = None
+    data = sales_dashboard(days, status=status, payment_method=payment_method)
+
+    revenue_series = (data['revenue'], data['revenue_average'], data['previous_revenue_average'])
+    revenue_max = max(float(series.max()) for series in revenue_series)
+    orders_max = max(float(data['orders'].max()), float(data['orders_average'].max()))
+    charts = {
+        'revenue': svg_polyline(data['revenue'], revenue_max, CHART_WIDTH, CHART_HEIGHT),
+        'revenue_average': svg_polyline(data['revenue_average'], revenue_max, CHART_WIDTH, CHART_HEIGHT),
+        'previous_revenue_average': svg_polyline(data['previous_revenue_average'], revenue_max, CHART_WIDTH, CHART_HEIGHT),
+        'orders': svg_polyline(data['orders'], orders_max, CHART_WIDTH, CHART_HEIGHT),
+        'orders_average': svg_polyline(data['orders_average'], orders_max, CHART_WIDTH, CHART_HEIGHT),
+        'revenue_max': revenue_max, 'orders_max': orders_max,
+    }
+    kpis = [
+        (label, data['totals'][name], data['previous_totals'][name], data['changes'][name])
+        for name, label in (('revenue', "Выручка, руб."), ('orders', "Заказы"), ('units', "Продано, шт."),
+                            ('average_check', "Средний чек, руб."))
+    ]
+    context = {
+        **admin.site.each_context(request),
+        'title': "Продажи по дням",
+        'data': data, 'charts': charts, 'kpis': kpis,
+        'breakdowns': (("По типам техники", data['by_tech_type']), ("По брендам", data['by_brand'])),
+        'chart_width': CHART_WIDTH, 'chart_height': CHART_HEIGHT,
+        'periods': DASHBOARD_PERIODS, 'status': status, 'payment_method': payment_method,
+        'status_choices': Order.STATUS_CHOICES, 'payment_choices': Order.PAYMENT_METHOD_CHOICES,
+    }
+    return render(request, 'st/admin/sales_dashboard.html', context)
+
+# --- Импорт каталога из CSV/JSON (см. st/imports.py) ---
+# Ошибок на странице результата; полный список выводит команда import_catalog
+ADMIN_IMPORT_ERRORS = 100
+
+@staff_member_required
+@permission_required(IMPORT_PERMISSIONS, raise_exception=True)
+def admin_catalog_import(request):
+    form = CatalogImportForm(request.POST or None, request.FILES or None)
+    result = None
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['file']
+        try:
+            fmt = form.cleaned_data['format'] or detect_format(upload.name)
+            # Файл читается потоково: большие загрузки Django хранит во временном файле, а не в памяти.
+            # Фиды на миллионы строк лучше загружать командой import_catalog, а не запросом
+            with io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='') as f:
+                result = import_catalog(f, fmt, dry_run=form.cleaned_data['dry_run'])
+        except (ImportFormatError, UnicodeDecodeError) as e:
+            form.add_error('file', str(e))
+    context = {
+        **admin.site.each_context(request),
+        'title': "Импорт каталога",
+        'form': form, 'result': result,
+        'errors': result.errors[:ADMIN_IMPORT_ERRORS] if result else [],
+        'dry_run': form.cleaned_data.get('dry_run') if result else False,
+    }
+    return render(request, 'st/admin/catalog_import.html', context)
+
+# --- Метрики производительности (см. st/middleware.py) ---
+@staff_member_required
+def metrics_view(request):
+    # Текстовый формат Prometheus; значения накоплены в текущем процессе
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Пример redirect для несуществующего объекта (не в CRUD)
 def old_product_redirect_view(request, old_id):
     # Предположим, это старый URL, и мы хотим редиректить на новый